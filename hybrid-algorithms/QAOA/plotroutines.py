@@ -6,6 +6,8 @@ import numpy as np
 
 from qaoa import QAOA
 
+from landscape import qaoa_landscape
+
 def __plot_landscape(A, extent, fig):
     if not fig:
         fig = pl.figure(figsize=(6, 6), dpi=80, facecolor="w", edgecolor="k")
@@ -19,15 +21,38 @@ def __plot_landscape(A, extent, fig):
     _ = pl.colorbar(im, cax=cax)
 
 
-def plot_E(qaoa_instance, fig=None):
-    angles = qaoa_instance.landscape_p1_angles
-    extent = [
+def __extent(angles):
+    return [
         angles["gamma"][0],
         angles["gamma"][1],
         angles["beta"][0],
         angles["beta"][1],
     ]
-    return __plot_landscape(qaoa_instance.exp_landscape(), extent, fig=fig)
+
+
+def plot_E(qaoa_instance, fig=None, exact=False, angles=None):
+    """
+    plot the depth-1 landscape sampled by sample_cost_landscape or, if exact is set,
+    the exact MaxCut landscape of the problem graph, see landscape.py
+    """
+    angles = angles or qaoa_instance.landscape_p1_angles
+    if exact:
+        E, _ = qaoa_landscape(qaoa_instance, angles)
+    else:
+        E = qaoa_instance.exp_landscape()
+    return __plot_landscape(E, __extent(angles), fig=fig)
+
+
+def plot_Var(qaoa_instance, fig=None, exact=False, angles=None):
+    """
+    same as plot_E for the variance, the exact landscape is computed only once for both
+    """
+    angles = angles or qaoa_instance.landscape_p1_angles
+    if exact:
+        _, Var = qaoa_landscape(qaoa_instance, angles)
+    else:
+        Var = qaoa_instance.var_landscape()
+    return __plot_landscape(Var, __extent(angles), fig=fig)
 
 
 def plot_ApproximationRatio(
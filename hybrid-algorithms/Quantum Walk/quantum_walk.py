@@ -0,0 +1,260 @@
+"""Fast paths for the classical and quantum random walks of the notebooks.
+
+The notebooks rebuild the whole walk circuit for every number of steps, call
+``decompose()`` on it and sample 5000 shots with the ``QasmSimulator``. This module
+offers two faster ways to obtain the position distributions:
+
+* NumPy evolution of the coin x position state. One step of the quantum walk is a
+  shift of the two coin components by +-1 (``np.roll``, the register wraps around
+  like the adder circuits) followed by the Hadamard coin, so the exact distributions
+  of all steps ``0 ... T`` come out of a single pass. For a single, large number of
+  steps, :func:`quantum_walk_distribution_fft` diagonalizes the shift in momentum
+  space and applies the T-th power of the 2x2 step matrix of every momentum.
+* A simulator path that composes the walk from cached, transpiled increment,
+  decrement and QFT blocks, and saves the probabilities after every step, so one
+  simulator run returns the exact distributions of all steps.
+
+The conventions follow the notebooks: the position register has
+``start.bit_length()`` qubits and starts in ``start``, the coin adds +1 (``add``) if
+it is ``|1>`` and -1 (``sub``) if it is ``|0>``, and the quantum walk starts with the
+coin in ``(|0> + i|1>) / sqrt(2)``.
+
+Running this file compares the paths for starting positions 2^7 ... 2^12:
+
+    python quantum_walk.py --steps 20
+"""
+
+import argparse
+import functools
+import time
+
+import numpy as np
+from numpy import pi
+from qiskit import ClassicalRegister, QuantumCircuit, QuantumRegister, transpile
+from qiskit.circuit.library import QFT
+from qiskit_aer import AerSimulator, QasmSimulator
+
+HADAMARD = np.array([[1, 1], [1, -1]]) / np.sqrt(2)
+QUANTUM_COIN = np.array([1, 1j]) / np.sqrt(2)
+
+
+def encode_basis(n, double=False):
+    num_qubits = n.bit_length()
+
+    if double:
+        num_qubits *= 2
+        num_qubits -= 1
+
+    qnum = QuantumRegister(num_qubits, "q_num")
+
+    circuit = QuantumCircuit(qnum)
+
+    for i in range(num_qubits):
+        if (n >> i) & 1:
+            circuit.x(qnum[i])
+    return circuit
+
+
+def add_qft_gate(n):
+    add = QuantumCircuit(n, name="add_qft")
+    for q in range(n - 1):
+        add.cp(pi / (2**q), n - 1, q)
+    add.x(n - 1)
+    return add.to_instruction()
+
+
+def sub_qft_gate(n):
+    add = QuantumCircuit(n, name="sub_qft")
+    for q in range(n - 1):
+        add.cp(-pi / (2**q), n - 1, q)
+    add.x(n - 1)
+    return add.to_instruction()
+
+
+def decode_result(result):
+    return {int(k, 2): result[k] for k in result.keys()}
+
+
+def coin_probability(bias=0.5):
+    """Probability of ``|1>`` (add) of ``qcoin(bias)`` = ``ry(pi (1 - 2 bias)) H|0>``."""
+    if bias < 0 or bias > 1:
+        raise ValueError("Bias should be between 0 and 1")
+    return np.sin(3 * pi / 4 - pi * bias) ** 2
+
+
+def quantum_walk_distributions(start, steps, num_qubits=None, coin=QUANTUM_COIN):
+    """Exact position distributions of the Hadamard walk after ``0 ... steps`` steps.
+
+    Returns an array of shape ``(steps + 1, 2**num_qubits)``; ``num_qubits`` defaults
+    to ``start.bit_length()`` as in ``encode_basis``.
+    """
+    size = 2 ** (num_qubits or start.bit_length())
+    psi = np.zeros((2, size), dtype=complex)
+    psi[:, start] = coin
+    distributions = np.empty((steps + 1, size))
+    distributions[0] = np.sum(np.abs(psi) ** 2, axis=0)
+    for t in range(1, steps + 1):
+        psi[0] = np.roll(psi[0], -1)
+        psi[1] = np.roll(psi[1], 1)
+        psi = HADAMARD @ psi
+        distributions[t] = np.sum(np.abs(psi) ** 2, axis=0)
+    return distributions
+
+
+def quantum_walk_distribution_fft(start, steps, num_qubits=None, coin=QUANTUM_COIN):
+    """Exact position distribution after ``steps`` steps, in ``O(N log N + N log T)``.
+
+    In momentum space the shift is diagonal, so every momentum ``k`` evolves with the
+    2x2 matrix ``H diag(exp(2 pi i k / N), exp(-2 pi i k / N))`` to the power ``steps``.
+    """
+    size = 2 ** (num_qubits or start.bit_length())
+    phase = np.exp(2j * pi * np.fft.fftfreq(size))
+    step = HADAMARD[None, :, :] * np.stack([phase, phase.conj()], axis=-1)[:, None, :]
+    evolution = np.linalg.matrix_power(step, steps)  # (N, 2, 2)
+
+    psi = np.zeros((2, size), dtype=complex)
+    psi[:, start] = coin
+    momentum = np.fft.fft(psi, axis=1)
+    momentum = np.einsum("kij,jk->ik", evolution, momentum)
+    return np.sum(np.abs(np.fft.ifft(momentum, axis=1)) ** 2, axis=0)
+
+
+def classical_walk_distributions(start, steps, value=1, bias=0.5, num_qubits=None):
+    """Exact position distributions of the classical walk with one coin per step."""
+    size = 2 ** (num_qubits or start.bit_length())
+    p_add = coin_probability(bias)
+    distributions = np.zeros((steps + 1, size))
+    distributions[0, start] = 1
+    for t in range(1, steps + 1):
+        previous = distributions[t - 1]
+        distributions[t] = p_add * np.roll(previous, value) + (1 - p_add) * np.roll(
+            previous, -value
+        )
+    return distributions
+
+
+@functools.lru_cache(maxsize=None)
+def _walk_blocks(num_qubits):
+    """Transpiled QFT, inverse QFT and walk step (add, sub, coin) for the simulator.
+
+    The blocks act on ``num_qubits`` position qubits plus the coin as last qubit.
+    """
+    basis = AerSimulator(method="statevector")
+    qft = transpile(QFT(num_qubits, do_swaps=False, inverse=False), basis)
+    iqft = transpile(QFT(num_qubits, do_swaps=False, inverse=True), basis)
+    step = QuantumCircuit(num_qubits + 1)
+    step.append(add_qft_gate(num_qubits + 1), range(num_qubits + 1))
+    step.append(sub_qft_gate(num_qubits + 1), range(num_qubits + 1))
+    step.h(num_qubits)
+    return qft, iqft, transpile(step, basis)
+
+
+def walk_circuit(start, steps, save_every_step=False):
+    """QFT quantum walk circuit of the notebook, built from the cached blocks.
+
+    With ``save_every_step`` the position probabilities are saved after every step
+    (labels ``"t0" ... "tT"``) instead of measuring at the end.
+    """
+    num_qubits = start.bit_length()
+    qft, iqft, step = _walk_blocks(num_qubits)
+    positions = list(range(num_qubits))
+
+    qc = encode_basis(start)
+    qc.add_register(QuantumRegister(1, "single_q_coin"))
+    qc.h(num_qubits)
+    qc.s(num_qubits)
+    if save_every_step:
+        qc.save_probabilities(positions, label="t0")
+    qc.compose(qft, positions, inplace=True)
+    for t in range(1, steps + 1):
+        qc.compose(step, inplace=True)
+        if save_every_step:
+            qc.compose(iqft, positions, inplace=True)
+            qc.save_probabilities(positions, label=f"t{t}")
+            qc.compose(qft, positions, inplace=True)
+    if not save_every_step:
+        qc.compose(iqft, positions, inplace=True)
+        qc.add_register(ClassicalRegister(num_qubits))
+        qc.measure(positions, positions)
+    return qc
+
+
+def simulate_walk_distributions(start, steps, simulator=None):
+    """Exact distributions of all steps ``0 ... steps`` from a single simulator run."""
+    simulator = simulator or AerSimulator(method="statevector")
+    result = simulator.run(walk_circuit(start, steps, save_every_step=True)).result()
+    data = result.data()
+    return np.array([data[f"t{t}"] for t in range(steps + 1)])
+
+
+def _notebook_walk_counts(start, steps, simulator, shots=5000):
+    """The notebook's path: rebuild, decompose and sample the walk circuit."""
+    qnum = encode_basis(start)
+    single_qcoin = QuantumCircuit(QuantumRegister(1, "single_q_coin"))
+    single_qcoin.h(0)
+    single_qcoin.s(0)
+    qc = QuantumCircuit(*qnum.qregs, *single_qcoin.qregs)
+    qc.compose(qnum, range(qnum.num_qubits), inplace=True)
+    qc.compose(single_qcoin, [qnum.num_qubits], inplace=True)
+    add = add_qft_gate(qnum.num_qubits + 1)
+    sub = sub_qft_gate(qnum.num_qubits + 1)
+    qc.append(
+        QFT(qnum.num_qubits, do_swaps=False, inverse=False).decompose(),
+        range(qnum.num_qubits),
+    )
+    for _ in range(steps):
+        qc.append(add, range(qc.num_qubits))
+        qc.append(sub, range(qc.num_qubits))
+        qc.h(qc.num_qubits - 1)
+    qc.append(
+        QFT(qnum.num_qubits, do_swaps=False, inverse=True).decompose(),
+        range(qnum.num_qubits),
+    )
+    qc.add_register(ClassicalRegister(qnum.num_qubits + 1))
+    qc.measure(range(qnum.num_qubits), range(qnum.num_qubits))
+    return decode_result(simulator.run(qc.decompose(), shots=shots).result().get_counts())
+
+
+def benchmark(steps, exponents=range(7, 13)):
+    """Distributions of all step counts ``1 ... steps``: the notebook path samples one
+    rebuilt circuit per step count, the other paths are exact."""
+    simulator = QasmSimulator()
+    statevector = AerSimulator(method="statevector")
+    for k in exponents:
+        start = 2**k
+
+        t0 = time.perf_counter()
+        for t in range(1, steps + 1):
+            _notebook_walk_counts(start, t, simulator)
+        rebuild = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        _walk_blocks(start.bit_length())
+        blocks = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        simulated = simulate_walk_distributions(start, steps, statevector)
+        cached = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        exact = quantum_walk_distributions(start, steps)
+        numpy_time = time.perf_counter() - t0
+
+        deviation = np.max(np.abs(simulated - exact))
+        fft_deviation = np.max(
+            np.abs(quantum_walk_distribution_fft(start, steps) - exact[-1])
+        )
+        print(
+            f"{2 * start:5d} positions: rebuild per step count {rebuild:7.2f} s, "
+            f"cached simulator {cached:6.3f} s (+ {blocks:5.3f} s blocks), "
+            f"numpy {numpy_time:7.4f} s "
+            f"(max. deviation {deviation:.1e}, fft {fft_deviation:.1e})"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--max-exponent", type=int, default=12)
+    args = parser.parse_args()
+    benchmark(args.steps, range(7, args.max_exponent + 1))
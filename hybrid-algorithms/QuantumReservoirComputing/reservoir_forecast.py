@@ -0,0 +1,403 @@
+"""Incremental reservoir forecasting for the logistic map notebook.
+
+The prediction loop of ``Logistic map.ipynb`` reruns the quantum reservoirs on a
+window of the series for every predicted point: 10 reservoir circuits with ``2 *
+timeplex`` time steps each, sampled until the precision target is met, followed by
+``create_shifted_array`` on the whole window. Here the reservoirs are stepped one
+input at a time instead:
+
+* :class:`QuantumFeatureMap` keeps the density matrix of every reservoir of a
+  ``PartialMeasurement`` or ``Stabilizer`` reservoir. One time step applies the
+  encoding, the Ising unitary and the measurement (with reset or syndrome
+  correction) as a quantum channel, and returns the expectation values of the
+  measured observables, exactly or estimated from ``shots`` samples.
+* :class:`FeatureWindow` is a ring buffer with the last ``timeplex`` feature vectors,
+  so the time-multiplexed regressor input is available without rebuilding the
+  shifted array.
+* :class:`ReservoirForecaster` fits the ridge regression with ``fit_model`` and
+  forecasts by feeding each prediction back into the reservoir, so every step only
+  simulates the new input.
+* :func:`forecast_folds` runs the forecasters of several methods on the
+  ``TimeSeriesSplit`` folds in a process pool.
+
+Running this file compares the notebook loop with the incremental pipeline:
+
+    python reservoir_forecast.py --num-pred 5
+"""
+
+import argparse
+import copy
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations
+
+import numpy as np
+import reservoirpy
+from qiskit.quantum_info import Operator
+from quantumreservoirpy.stabilizer import Stabilizer
+from quantumreservoirpy.util import create_shifted_array
+from reservoirpy.nodes import Reservoir
+from sklearn.linear_model import Ridge
+from sklearn.model_selection import TimeSeriesSplit
+
+# one progress bar per step of the classical reservoir would flood the output
+reservoirpy.verbosity(0)
+
+HADAMARD = np.array([[1, 1], [1, -1]]) / np.sqrt(2)
+S_DAGGER = np.diag([1, -1j])
+
+
+def fit_model(model, res_states, series, WARMUP=0.3, timeplex=1):
+    warmup = int(len(series) * WARMUP)
+
+    X = res_states[warmup:-1]
+    y = series[warmup + 1 :]
+
+    if timeplex > 1:
+        X = create_shifted_array(X, timeplex)
+    model.fit(X, y)
+
+    return model, X, y
+
+
+def run_prediction(model, res_states, timeplex=1):
+    X = np.copy(res_states)
+
+    if timeplex > 1:
+        X = create_shifted_array(X, timeplex)
+    X = X[-1, :]
+    X = X.reshape((1, -1))
+    return model.predict(X)
+
+
+def _rx(theta):
+    c, s = np.cos(theta / 2), np.sin(theta / 2)
+    return np.array([[c, -1j * s], [-1j * s, c]])
+
+
+def _kron_qubits(gates):
+    """Operator of single-qubit ``gates[k]`` on qubit ``k`` (little endian)."""
+    result = np.ones((1, 1))
+    for gate in gates:
+        result = np.kron(gate, result)
+    return result
+
+
+class QuantumFeatureMap:
+    """Exact, stateful simulation of the reservoirs of quantumreservoirpy.
+
+    Every time step maps the density matrices ``rho`` of the reservoirs to
+    ``sum_b K_b V(x) rho V(x)^dag K_b^dag``, where ``V(x)`` is the encoding and
+    reservoir unitary and ``K_b`` the measurement operator of the outcome ``b`` of
+    the classical register, followed by the reset or the syndrome correction of the
+    circuit. The features of the step are the probabilities of an odd parity of the
+    register bits of every observable, as in ``Static.measurementStatistics``.
+
+    Use :meth:`from_reservoir` to build it from a ``PartialMeasurement`` or
+    ``Stabilizer`` instance.
+
+    Args:
+        unitaries: Reservoir unitaries, shape ``(num_reservoirs, d, d)``, including
+            the basis change before the measurement.
+        kraus: Measurement operators ``K_b``, shape ``(2**n_meas, d, d)``.
+        n_meas: Number of register bits per time step, the first ``n_meas`` qubits
+            carry the encoded input.
+        degree: Maximal number of register bits per observable.
+        shots: Estimate the features from this many samples per step, ``None`` for
+            the exact expectation values.
+        seed: Seed of the shot sampling.
+    """
+
+    def __init__(self, unitaries, kraus, n_meas, degree=1, shots=None, seed=None):
+        self.unitaries = np.asarray(unitaries, dtype=complex)
+        self.kraus = np.asarray(kraus, dtype=complex)
+        self.n_meas = n_meas
+        self.num_reservoirs, self.dim, _ = self.unitaries.shape
+        self.num_qubits = self.dim.bit_length() - 1
+        self.shots = shots
+        self.rng = np.random.default_rng(seed)
+
+        # outcome -> parity of the register bits of every observable
+        outcomes = np.arange(2**n_meas)
+        bits = (outcomes[:, None] >> np.arange(n_meas)) & 1
+        observables = [
+            list(obs)
+            for k in range(1, degree + 1)
+            for obs in combinations(range(n_meas), k)
+        ]
+        self.parities = np.stack(
+            [bits[:, obs].sum(axis=1) % 2 for obs in observables], axis=1
+        ).astype(float)
+        # probability of outcome b = sum of the diagonal of K_b^dag K_b rho
+        self.projectors = np.real(np.einsum("bji,bji->ib", self.kraus.conj(), self.kraus))
+        self.reset()
+
+    @classmethod
+    def from_reservoir(cls, res, shots=None, seed=None):
+        if isinstance(res, Stabilizer):
+            num_qubits = res.n_qubits - 1  # without the syndrome ancilla
+            decodermap = res.decodermap if res.decode else {}
+            kraus = cls._stabilizer_kraus(num_qubits, res.n_meas, decodermap)
+            basis = np.eye(2**num_qubits)
+        else:
+            num_qubits = res.n_qubits
+            kraus = cls._partial_kraus(num_qubits, res.n_meas, res.decode)
+            change = {"Z": HADAMARD, "Y": S_DAGGER @ HADAMARD}.get(res.basis, np.eye(2))
+            basis = _kron_qubits(
+                [change] * res.n_meas + [np.eye(2)] * (num_qubits - res.n_meas)
+            )
+        unitaries = [
+            basis @ Operator(res.U[nr]).data for nr in range(1, res.num_reservoirs + 1)
+        ]
+        return cls(unitaries, kraus, res.n_meas, res.degree, shots=shots, seed=seed)
+
+    @staticmethod
+    def _partial_kraus(num_qubits, n_meas, decode=True):
+        """Measure qubits ``0 ... n_meas - 1`` and reset them if ``decode``."""
+        dim, M = 2**num_qubits, 2**n_meas
+        kraus = np.zeros((M, dim, dim))
+        rest = np.arange(dim // M) * M
+        for b in range(M):
+            kraus[b, rest if decode else rest + b, rest + b] = 1
+        return kraus
+
+    @staticmethod
+    def _stabilizer_kraus(num_qubits, n_meas, decodermap):
+        """Measure the parities ``Z_j Z_{j+1}`` and flip the qubits of the decoder."""
+        dim = 2**num_qubits
+        states = np.arange(dim)
+        x = (states[:, None] >> np.arange(num_qubits)) & 1
+        syndrome = (x[:, :n_meas] ^ x[:, 1 : n_meas + 1]) @ (1 << np.arange(n_meas))
+        kraus = np.zeros((2**n_meas, dim, dim))
+        for c in range(2**n_meas):
+            flips = [q for q in decodermap.get(c, []) if q < num_qubits]
+            mask = int(np.sum(1 << np.array(flips, dtype=int))) if flips else 0
+            selected = states[syndrome == c]
+            kraus[c, selected ^ mask, selected] = 1
+        return kraus
+
+    @property
+    def num_features(self):
+        return self.num_reservoirs * self.parities.shape[1]
+
+    def reset(self):
+        self.rho = np.zeros((self.num_reservoirs, self.dim, self.dim), dtype=complex)
+        self.rho[:, 0, 0] = 1
+
+    def step(self, x):
+        """Feed one input to all reservoirs and return the features of the step."""
+        gates = [_rx(-(3**k) / 2 * np.pi * x) for k in range(self.n_meas)]
+        encode = _kron_qubits(gates + [np.eye(2)] * (self.num_qubits - self.n_meas))
+        V = self.unitaries @ encode
+        sigma = V @ self.rho @ V.conj().swapaxes(1, 2)
+
+        p = np.real(np.diagonal(sigma, axis1=1, axis2=2)) @ self.projectors
+        self.rho = np.einsum("bij,rjk,blk->ril", self.kraus, sigma, self.kraus.conj())
+
+        if self.shots:
+            p = np.clip(p, 0, None)
+            p /= p.sum(axis=1, keepdims=True)
+            p = self.rng.multinomial(int(self.shots), p) / self.shots
+        return (p @ self.parities).ravel()
+
+    def run(self, timeseries, reset=True):
+        """Features of every step of ``timeseries``, shape ``(steps, num_features)``."""
+        if reset:
+            self.reset()
+        return np.array([self.step(x) for x in np.ravel(timeseries)])
+
+
+class ClassicalFeatureMap:
+    """Stateful reservoirpy ``Reservoir`` with the interface of the quantum maps."""
+
+    def __init__(self, units, **kwargs):
+        self.reservoir = Reservoir(units, **kwargs)
+
+    @property
+    def num_features(self):
+        return self.reservoir.output_dim
+
+    def reset(self):
+        self.reservoir.reset()
+
+    def step(self, x):
+        return self.reservoir.run(np.array([[float(x)]]))[-1]
+
+    def run(self, timeseries, reset=True):
+        return self.reservoir.run(np.reshape(timeseries, (-1, 1)), reset=reset)
+
+
+class FeatureWindow:
+    """Ring buffer of the last ``timeplex`` feature vectors.
+
+    :meth:`row` is the last row of ``create_shifted_array(states, timeplex)``: the
+    newest features first, zeros for steps before the start of the series.
+    """
+
+    def __init__(self, timeplex, num_features):
+        self.timeplex = timeplex
+        self.buffer = np.zeros((timeplex, num_features))
+        self.head = -1
+
+    def push(self, features):
+        self.head = (self.head + 1) % self.timeplex
+        self.buffer[self.head] = features
+
+    def extend(self, states):
+        for features in states[-self.timeplex :]:
+            self.push(features)
+
+    def row(self):
+        order = (self.head - np.arange(self.timeplex)) % self.timeplex
+        return self.buffer[order].reshape(1, -1)
+
+
+class ReservoirForecaster:
+    """Ridge regression on time-multiplexed reservoir features, forecast step by step.
+
+    Args:
+        feature_map: :class:`QuantumFeatureMap` or :class:`ClassicalFeatureMap`.
+        timeplex: Number of time steps of features per regressor input.
+        warmup: Fraction of the training series that is not used for the fit.
+        alpha: Ridge regularization.
+    """
+
+    def __init__(self, feature_map, timeplex=1, warmup=0.3, alpha=1e-7):
+        self.feature_map = feature_map
+        self.timeplex = timeplex
+        self.warmup = warmup
+        self.model = Ridge(alpha=alpha)
+
+    def fit(self, series):
+        """Run the reservoir over ``series``, fit the regression and return its score."""
+        states = self.feature_map.run(series, reset=True)
+        self.model, X, y = fit_model(
+            self.model, states, series, WARMUP=self.warmup, timeplex=self.timeplex
+        )
+        self.window = FeatureWindow(self.timeplex, states.shape[1])
+        self.window.extend(states)
+        return self.model.score(X, y)
+
+    def forecast(self, num_pred):
+        """Predict ``num_pred`` further points, feeding every prediction back."""
+        predictions = np.empty(num_pred)
+        for j in range(num_pred):
+            predictions[j] = self.model.predict(self.window.row())[0]
+            if j < num_pred - 1:
+                self.window.push(self.feature_map.step(predictions[j]))
+        return predictions
+
+
+def _forecast_fold(forecaster, train, num_pred):
+    score = forecaster.fit(train)
+    return score, forecaster.forecast(num_pred)
+
+
+def forecast_folds(series, forecasters, n_splits=5, folds=None, max_workers=None):
+    """Fit and forecast every method on every ``TimeSeriesSplit`` fold.
+
+    ``forecasters`` maps method names to :class:`ReservoirForecaster` instances, each
+    task works on its own copy. All (method, fold) pairs run in a process pool, or
+    in this process if ``max_workers == 1``. Returns ``{(method, fold): (score,
+    training series followed by the predictions)}``.
+    """
+    splits = list(TimeSeriesSplit(n_splits=n_splits).split(series))
+    folds = range(len(splits)) if folds is None else folds
+    tasks = {
+        (method, i): (forecaster, series[splits[i][0]], len(splits[i][1]))
+        for method, forecaster in forecasters.items()
+        for i in folds
+    }
+
+    results = {}
+    if max_workers == 1:
+        for key, (forecaster, train, num_pred) in tasks.items():
+            results[key] = _forecast_fold(copy.deepcopy(forecaster), train, num_pred)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_forecast_fold, *task): key for key, task in tasks.items()
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+
+    return {
+        key: (score, np.append(tasks[key][1], predictions))
+        for key, (score, predictions) in results.items()
+    }
+
+
+def _notebook_forecast(res, linreg, train, num_pred, timeplex):
+    """The notebook's loop: rerun the reservoirs on a window for every point."""
+    prediction = train
+    for _ in range(num_pred):
+        states = res.run(
+            prediction[-2 * int(timeplex) :], shots=1e3, precision=1e-2, tqdm=True
+        )
+        prediction = np.append(prediction, run_prediction(linreg, states, timeplex))
+    return prediction[len(train) :]
+
+
+def benchmark(num_pred, timeplex=10, fold=2):
+    from qiskit_aer import AerSimulator
+    from quantumreservoirpy.partialmeasurement import PartialMeasurement
+    from reservoirpy.datasets import logistic_map
+
+    np.random.seed(0)
+    ts = logistic_map(200, r=3.9, x0=0.5).flatten()
+    train_index, test_index = list(TimeSeriesSplit().split(ts))[fold]
+    train = ts[train_index]
+
+    for name, cls in [("quantum_part", PartialMeasurement), ("quantum_stab", Stabilizer)]:
+        res = cls(3, 2, backend=AerSimulator(), degree=2, num_reservoirs=10)
+        feature_map = QuantumFeatureMap.from_reservoir(res)
+
+        sampled = res.run(timeseries=train[:20], shots=1e3, precision=1e-2, tqdm=True)
+        deviation = np.max(np.abs(sampled - feature_map.run(train[:20])))
+
+        linreg = Ridge(alpha=1e-7)
+        states = res.run(timeseries=train, shots=1e3, precision=1e-2, tqdm=True)
+        linreg, _, _ = fit_model(linreg, states, train, timeplex=timeplex)
+        start = time.perf_counter()
+        _notebook_forecast(res, linreg, train, num_pred, timeplex)
+        notebook = (time.perf_counter() - start) / num_pred
+
+        forecaster = ReservoirForecaster(feature_map, timeplex=timeplex)
+        start = time.perf_counter()
+        score = forecaster.fit(train)
+        fit = time.perf_counter() - start
+        start = time.perf_counter()
+        forecaster.forecast(len(test_index))
+        incremental = (time.perf_counter() - start) / len(test_index)
+
+        print(
+            f"{name}: notebook loop {notebook:.3f} s/point, incremental "
+            f"{incremental * 1e3:.2f} ms/point (fit {fit:.2f} s, score {score:.4f}); "
+            f"exact vs sampled features {deviation:.3f}"
+        )
+
+    forecasters = {
+        "classical": ReservoirForecaster(
+            ClassicalFeatureMap(30, lr=0.5, sr=0.9, seed=0), timeplex=1
+        ),
+        "quantum_part": ReservoirForecaster(
+            QuantumFeatureMap.from_reservoir(
+                PartialMeasurement(3, 2, degree=2, num_reservoirs=10)
+            ),
+            timeplex=timeplex,
+        ),
+    }
+    start = time.perf_counter()
+    results = forecast_folds(ts, forecasters)
+    print(
+        f"{len(results)} (method, fold) forecasts in the process pool: "
+        f"{time.perf_counter() - start:.2f} s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-pred", type=int, default=5)
+    parser.add_argument("--timeplex", type=int, default=10)
+    args = parser.parse_args()
+    benchmark(args.num_pred, args.timeplex)
@@ -0,0 +1,418 @@
+"""Batched H2 VQE engine for ``vqe-h2-qiskit.ipynb`` and ``vqe-h2-cirq.ipynb``.
+
+The notebooks compose the ansatz with one measurement circuit per Hamiltonian term,
+bind ``theta`` and run the simulator once per term and per point of the scan, i.e.
+``5 * 80`` simulator calls for one bond length. The engines of this module
+
+* build the ansatz once and leave ``theta`` unbound,
+* measure the five terms with two circuits, since ``Z0``, ``Z1`` and ``Z0 Z1``
+  commute and so do ``X0 X1`` and ``Y0 Y1``: after ``CX(0, 1)`` and ``H(0)``,
+  ``X0 X1`` is read from ``Z0`` and ``Y0 Y1`` from ``-Z0 Z1`` of the same shots,
+* evaluate all ``theta`` of a scan in one batched call, a parameter binding array
+  of the V2 primitives in Qiskit or a ``cirq.Points`` sweep in Cirq.
+
+The term averages do not depend on the bond length, only the coefficients ``g_i``
+do, so :func:`dissociation_curve` scans ``theta`` once for all bond lengths and
+then refines the minimum of every bond length in a few batched zoom steps, starting
+from the optimum of the previous bond length.
+
+The Hamiltonian is ``H = g0 + g1 Z0 + g2 Z1 + g3 Z0 Z1 + g4 Y0 Y1 + g5 X0 X1``. The
+coefficients are given as ``(g0, g1, g2, g3, g4, g5)``; only the row for
+``R = 0.75`` used in the notebooks is included here (:data:`COEFFS_R075`), the other
+bond lengths of Table 1 of arXiv:1512.06860 are passed as rows ``(R, (g0, ..., g5))``
+or read from a CSV file with the columns ``R,g0,g1,g2,g3,g4,g5`` that you write
+yourself (:func:`read_table`).
+
+Usage:
+    engine = QiskitH2VQE(shots=1000)  # or CirqH2VQE(shots=1000), shots=None: exact
+    energies = engine.energies(param_range, COEFFS_R075)
+    curve = dissociation_curve(engine, [(0.75, COEFFS_R075), ...])
+
+Running this file compares the notebook loops with the engines:
+
+    python h2_vqe.py --table my_table1.csv
+"""
+
+import argparse
+import csv
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+# g0, ..., g5 for R = 0.75, as in the notebooks
+COEFFS_R075 = (0.2252, 0.3435, -0.4347, 0.5716, 0.091, 0.091)
+# order of the averages returned by H2VQE.expectations, i.e. of g1, ..., g5
+TERMS = ("Z0", "Z1", "Z0Z1", "Y0Y1", "X0X1")
+# theta scan of the notebooks
+PARAM_RANGE = np.arange(-np.pi, np.pi, np.pi / 40)
+
+
+def expectations_from_outcomes(z_outcomes, bell_outcomes):
+    """Averages of :data:`TERMS` from the outcome probabilities of both circuits.
+
+    Args:
+        z_outcomes: Probabilities of shape ``(thetas, 4)`` of the outcomes
+            ``b0 + 2 b1`` measured in the ``Z`` basis.
+        bell_outcomes: The same after ``CX(0, 1)`` and ``H(0)``.
+
+    Returns:
+        Array of shape ``(thetas, 5)``.
+    """
+    # eigenvalues of Z0, Z1 and Z0 Z1 of the outcomes 00, 10, 01, 11 (b0 b1)
+    z0 = np.array([1, -1, 1, -1])
+    z1 = np.array([1, 1, -1, -1])
+    z0z1 = z0 * z1
+    return np.stack(
+        [
+            z_outcomes @ z0,
+            z_outcomes @ z1,
+            z_outcomes @ z0z1,
+            -(bell_outcomes @ z0z1),
+            bell_outcomes @ z0,
+        ],
+        axis=1,
+    )
+
+
+class H2VQE(ABC):
+    """Base class of the engines, which implement :meth:`expectations`.
+
+    Args:
+        shots: Number of shots per ``theta`` and circuit, ``None`` for exact averages.
+        seed: Seed of the sampler.
+    """
+
+    def __init__(self, shots=None, seed=None):
+        self.shots = shots
+        self.seed = seed
+        self.num_calls = 0
+
+    @abstractmethod
+    def expectations(self, thetas):
+        """Averages of :data:`TERMS` of shape ``(len(thetas), 5)``."""
+
+    def energies(self, thetas, coeffs):
+        """Averages of the Hamiltonian with coefficients ``coeffs`` for all ``thetas``."""
+        return coeffs[0] + self.expectations(thetas) @ np.asarray(coeffs[1:])
+
+    def refine(self, coeffs, theta, width, points=9, rounds=2):
+        """Zoom in on the minimum of the energy around ``theta``.
+
+        Every round evaluates ``points`` values in ``[theta - width, theta + width]``
+        in one batched call and shrinks the window around the best of them.
+
+        Returns:
+            The best ``theta`` and its energy.
+        """
+        for _ in range(rounds):
+            thetas = theta + np.linspace(-width, width, points)
+            energies = self.energies(thetas, coeffs)
+            best = np.argmin(energies)
+            theta, energy = thetas[best], energies[best]
+            width *= 2 / (points - 1)
+        return theta, energy
+
+
+class QiskitH2VQE(H2VQE):
+    """Engine on the Qiskit reference primitives.
+
+    With ``shots=None`` the averages are computed by ``StatevectorEstimator``,
+    otherwise the two measurement circuits are sampled by ``StatevectorSampler`` in
+    one ``run`` call.
+    """
+
+    def __init__(self, shots=None, seed=None):
+        from qiskit.circuit import Parameter
+        from qiskit.primitives import StatevectorEstimator, StatevectorSampler
+
+        super().__init__(shots, seed)
+        self.estimator = StatevectorEstimator(seed=seed)
+        self.sampler = StatevectorSampler(seed=seed)
+        self.theta = Parameter("θ")
+        self.ansatz = self.ansatz_circuit(self.theta)
+        # TERMS as Pauli labels, qubit 0 on the right; shape (5, 1) broadcasts against
+        # the parameter values of shape (thetas, 1)
+        self.observables = [["IZ"], ["ZI"], ["ZZ"], ["YY"], ["XX"]]
+
+        self.z_circuit = self.ansatz.copy()
+        self.z_circuit.measure([0, 1], [0, 1])
+        self.bell_circuit = self.ansatz.copy()
+        self.bell_circuit.cx(0, 1)
+        self.bell_circuit.h(0)
+        self.bell_circuit.measure([0, 1], [0, 1])
+
+    @staticmethod
+    def ansatz_circuit(parameter):
+        """``create_ansatz_circuit`` of the notebook, without the barriers."""
+        from qiskit import QuantumCircuit
+
+        circuit = QuantumCircuit(2, 2)
+        circuit.rx(np.pi, 0)
+        circuit.rx(-np.pi / 2, 0)
+        circuit.ry(np.pi / 2, 1)
+        circuit.cx(1, 0)
+        circuit.rz(parameter, 0)
+        circuit.cx(1, 0)
+        circuit.rx(np.pi / 2, 0)
+        circuit.ry(-np.pi / 2, 1)
+        return circuit
+
+    def expectations(self, thetas):
+        thetas = np.asarray(thetas, dtype=float).reshape(-1, 1)
+        self.num_calls += 1
+        if self.shots is None:
+            pub = (self.ansatz, self.observables, thetas)
+            result = self.estimator.run([pub]).result()
+            return result[0].data.evs.T
+
+        pubs = [(self.z_circuit, thetas), (self.bell_circuit, thetas)]
+        result = self.sampler.run(pubs, shots=self.shots).result()
+        outcomes = []
+        for pub_result in result:
+            # outcome b0 + 2 b1 of every shot, shape (thetas, shots)
+            values = pub_result.data.c.array[..., -1]
+            counts = np.apply_along_axis(np.bincount, 1, values, minlength=4)
+            outcomes.append(counts / self.shots)
+        return expectations_from_outcomes(*outcomes)
+
+
+class CirqH2VQE(H2VQE):
+    """Engine on ``cirq.Simulator``.
+
+    With ``shots=None`` the two measurement bases are simulated with
+    ``simulate_sweep`` and the averages computed from the final states, otherwise
+    both circuits are sampled with one ``run_batch`` call.
+    """
+
+    def __init__(self, shots=None, seed=None):
+        import cirq
+        import sympy
+
+        super().__init__(shots, seed)
+        self.theta = sympy.Symbol("θ")
+        self.qubits = cirq.LineQubit.range(2)
+        self.ansatz = self.ansatz_circuit(self.qubits, self.theta)
+        q0, q1 = self.qubits
+        self.bell_circuit = self.ansatz + cirq.Circuit(cirq.CNOT(q0, q1), cirq.H(q0))
+        self.simulator = cirq.Simulator(seed=seed)
+
+    @staticmethod
+    def ansatz_circuit(qubits, parameter):
+        """``create_ansatz_circuit`` of the notebook."""
+        import cirq
+
+        q0, q1 = qubits
+        return cirq.Circuit(
+            cirq.rx(np.pi)(q0),
+            cirq.rx(-np.pi / 2)(q0),
+            cirq.ry(np.pi / 2)(q1),
+            cirq.CNOT(q1, q0),
+            cirq.rz(parameter)(q0),
+            cirq.CNOT(q1, q0),
+            cirq.rx(np.pi / 2)(q0),
+            cirq.ry(-np.pi / 2)(q1),
+        )
+
+    def expectations(self, thetas):
+        import cirq
+
+        sweep = cirq.Points(self.theta.name, np.asarray(thetas, dtype=float))
+        self.num_calls += 1
+        if self.shots is None:
+            outcomes = []
+            for circuit in (self.ansatz, self.bell_circuit):
+                states = [
+                    r.final_state_vector
+                    for r in self.simulator.simulate_sweep(
+                        circuit, sweep, qubit_order=self.qubits
+                    )
+                ]
+                # Cirq orders the amplitudes as 2 b0 + b1
+                probabilities = np.abs(np.array(states)) ** 2
+                outcomes.append(probabilities[:, [0, 2, 1, 3]])
+            return expectations_from_outcomes(*outcomes)
+
+        measure = cirq.Circuit(cirq.measure(*self.qubits, key="m"))
+        batch = self.simulator.run_batch(
+            [self.ansatz + measure, self.bell_circuit + measure],
+            params_list=[sweep, sweep],
+            repetitions=self.shots,
+        )
+        outcomes = []
+        for results in batch:
+            bits = np.array([r.measurements["m"] for r in results])
+            values = bits[..., 0] + 2 * bits[..., 1]
+            counts = np.apply_along_axis(np.bincount, 1, values, minlength=4)
+            outcomes.append(counts / self.shots)
+        return expectations_from_outcomes(*outcomes)
+
+
+def read_table(filename):
+    """Rows ``(R, (g0, ..., g5))`` of a CSV file with the columns ``R,g0,...,g5``."""
+    with open(filename, newline="") as file:
+        rows = [
+            (float(row["R"]), tuple(float(row[f"g{i}"]) for i in range(6)))
+            for row in csv.DictReader(file)
+        ]
+    return sorted(rows)
+
+
+def dissociation_curve(engine, table, thetas=PARAM_RANGE, **refine_options):
+    """Minimum energy of every bond length of ``table``.
+
+    The averages on the ``thetas`` grid are computed once and shared by all bond
+    lengths. Every bond length is refined from the optimum of the previous one,
+    or from its grid minimum if that is lower than the warm-started result.
+
+    Args:
+        engine: :class:`H2VQE` engine.
+        table: Rows ``(R, (g0, ..., g5))``, e.g. from :func:`read_table`.
+        thetas: Grid of the initial scan.
+        refine_options: Options of :meth:`H2VQE.refine`.
+
+    Returns:
+        Array of shape ``(len(table), 3)`` with the columns ``R``, ``theta`` and
+        the energy.
+    """
+    grid = engine.expectations(thetas)
+    step = thetas[1] - thetas[0]
+    curve = []
+    theta = None
+    for R, coeffs in table:
+        grid_energies = coeffs[0] + grid @ np.asarray(coeffs[1:])
+        best = np.argmin(grid_energies)
+        if theta is None:
+            theta = thetas[best]
+        theta, energy = engine.refine(coeffs, theta, step, **refine_options)
+        if grid_energies[best] < energy:
+            theta, energy = engine.refine(coeffs, thetas[best], step, **refine_options)
+        curve.append((R, theta, energy))
+    return np.array(curve)
+
+
+def _notebook_scan_qiskit(coeffs, shots):
+    """The scan of ``vqe-h2-qiskit.ipynb``: one simulator run per term and theta."""
+    from qiskit import QuantumCircuit
+    from qiskit.circuit import Parameter
+    from qiskit_aer import AerSimulator
+
+    simulator = AerSimulator()
+    theta = Parameter("θ")
+    ansatz = QiskitH2VQE.ansatz_circuit(theta)
+    obs = [
+        {"00": 1, "10": 1, "01": -1, "11": -1},
+        {"00": 1, "10": -1, "01": 1, "11": -1},
+        {"00": 1, "10": -1, "01": -1, "11": 1},
+        {"00": 1, "10": -1, "01": -1, "11": 1},
+        {"00": 1, "10": -1, "01": -1, "11": 1},
+    ]
+    circuits = []
+    for basis in ("", "", "", "YY", "XX"):
+        circuit = QuantumCircuit(2, 2)
+        for qubit, op in enumerate(basis):
+            if op == "Y":
+                circuit.sdg(qubit)
+            circuit.h(qubit)
+        circuit.measure([0, 1], [0, 1])
+        circuits.append(ansatz.compose(circuit))
+
+    energies = []
+    for x in PARAM_RANGE:
+        energy = coeffs[0]
+        for g, circuit, obsval in zip(coeffs[1:], circuits, obs):
+            bound = circuit.assign_parameters({theta: x})
+            counts = simulator.run(bound, shots=shots).result().get_counts()
+            energy += g * sum(obsval[k] * v / shots for k, v in counts.items())
+        energies.append(energy)
+    return np.array(energies)
+
+
+def _notebook_scan_cirq(coeffs, shots):
+    """The scan of ``vqe-h2-cirq.ipynb``: one ``run_sweep`` per term and theta."""
+    import cirq
+    import sympy
+
+    simulator = cirq.Simulator()
+    theta = sympy.Symbol("θ")
+    qubits = cirq.LineQubit.range(2)
+    ansatz = CirqH2VQE.ansatz_circuit(qubits, theta)
+    obs = [
+        {"00": 1, "10": 1, "01": -1, "11": -1},
+        {"00": 1, "10": -1, "01": 1, "11": -1},
+        {"00": 1, "10": -1, "01": -1, "11": 1},
+        {"00": 1, "10": -1, "01": -1, "11": 1},
+        {"00": 1, "10": -1, "01": -1, "11": 1},
+    ]
+    circuits = []
+    for basis in ("", "", "", "YY", "XX"):
+        circuit = cirq.Circuit()
+        for qubit, op in zip(qubits, basis):
+            if op == "Y":
+                circuit.append(cirq.S(qubit) ** -1)
+            circuit.append(cirq.H(qubit))
+        circuit.append(cirq.measure(qubits, key="m"))
+        circuits.append(ansatz + circuit)
+
+    energies = []
+    for x in PARAM_RANGE:
+        energy = coeffs[0]
+        for g, circuit, obsval in zip(coeffs[1:], circuits, obs):
+            trials = simulator.run_sweep(circuit, params={theta: x}, repetitions=shots)
+            histogram = trials[0].histogram(key="m")
+            energy += g * sum(
+                obsval[format(k, "02b")] * v / shots for k, v in histogram.items()
+            )
+        energies.append(energy)
+    return np.array(energies)
+
+
+def benchmark(table, shots, frameworks):
+    engines = {"qiskit": QiskitH2VQE, "cirq": CirqH2VQE}
+    notebook_scans = {"qiskit": _notebook_scan_qiskit, "cirq": _notebook_scan_cirq}
+    exact = QiskitH2VQE().energies(PARAM_RANGE, COEFFS_R075)
+    print(f"exact H_min on the notebook grid at R = 0.75: {exact.min():.4f}")
+
+    for framework in frameworks:
+        start = time.perf_counter()
+        reference = notebook_scans[framework](COEFFS_R075, shots)
+        notebook = time.perf_counter() - start
+        engine = engines[framework](shots=shots, seed=0)
+        start = time.perf_counter()
+        energies = engine.energies(PARAM_RANGE, COEFFS_R075)
+        batched = time.perf_counter() - start
+        print(
+            f"{framework}: notebook scan {notebook:6.2f} s "
+            f"(H_min {reference.min():.4f}), batched scan {batched:6.3f} s "
+            f"(H_min {energies.min():.4f}), {notebook / batched:.0f}x"
+        )
+
+        start = time.perf_counter()
+        curve = dissociation_curve(engine, table)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{framework}: dissociation curve of {len(table)} bond lengths in "
+            f"{elapsed:.2f} s ({engine.num_calls} simulator calls), "
+            f"notebook loop estimate {notebook * len(table):.0f} s"
+        )
+        for R, theta, energy in curve[:: max(1, len(curve) // 10)]:
+            print(f"    R = {R:5.2f}: theta = {theta:+.4f}, E = {energy:+.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--table",
+        help="CSV file with the columns R,g0,...,g5; without it the curve is timed on "
+        "--rows copies of the R = 0.75 coefficients",
+    )
+    parser.add_argument("--rows", type=int, default=54)
+    parser.add_argument("--shots", type=int, default=1000)
+    parser.add_argument("--frameworks", nargs="+", default=["qiskit", "cirq"])
+    args = parser.parse_args()
+    if args.table:
+        table = read_table(args.table)
+    else:
+        # timing only: every row has the coefficients of R = 0.75
+        table = [(0.75, COEFFS_R075)] * args.rows
+    benchmark(table, args.shots, args.frameworks)
@@ -0,0 +1,260 @@
+# This code is part of Tergite
+#
+# (C) Copyright Axel Andersson 2022
+#
+# This code is licensed under the Apache License, Version 2.0. You may
+# obtain a copy of this license in the LICENSE.txt file in the current directory
+# of this source tree or at http://www.apache.org/licenses/LICENSE-2.0.
+#
+# Any modifications or derivative works of this code must retain this
+# copyright notice, and modified files need to carry a notice indicating
+# that they have been altered from the originals.
+#
+# Modified:
+# Frame pipeline derived from compute-bloch-frames.ipynb, 2024
+"""Concurrent Bloch-frame pipeline for the StateTomography demo.
+
+``compute_new_frame`` in ``compute-bloch-frames.ipynb`` submits the tomography
+circuits of one angle, polls ``job.status()`` once a second until that job is done,
+fits the state with ``StateTomographyFitter`` and plots it before the next angle is
+submitted, so the total time is the sum of the job latencies. :func:`compute_frames`
+instead
+
+1. submits the jobs of all frames up front,
+2. collects the results in the order the jobs complete,
+3. fits the single-qubit density matrices of all frames at once in closed form
+   (:func:`density_matrices`), and
+4. renders the frames in a process pool.
+
+The total time then approaches the latency of the slowest job. The fit uses the
+Bloch vector ``r_k = p(0) - p(1)`` of the ``X``, ``Y`` and ``Z`` measurements,
+``rho = (I + r . sigma) / 2``; if noise pushes ``|r|`` above one, ``r`` is scaled
+back to the surface of the Bloch ball, which is the positive semidefinite
+projection that the ``lstsq`` fitter applies for a single qubit.
+
+Usage:
+    rho = compute_frames(backend, precomputed_tomog_circs, folder=folder)
+
+Running this file compares the notebook loop with the pipeline on a local simulator
+whose jobs take one to three seconds:
+
+    python bloch_frames.py --frames 12 --max-latency 3
+"""
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from qiskit import QuantumCircuit, transpile
+from qiskit.providers.jobstatus import JOB_FINAL_STATES, JobStatus
+
+PAULIS = np.array(
+    [
+        [[0, 1], [1, 0]],
+        [[0, -1j], [1j, 0]],
+        [[1, 0], [0, -1]],
+    ]
+)
+
+
+def tomography_circuits(theta):
+    """``X``, ``Y`` and ``Z`` measurements of ``rx(theta)|0>``, like ``tomog_circs``."""
+    circuits = []
+    for basis in "XYZ":
+        circ = QuantumCircuit(1, 1, name=basis)
+        circ.barrier(0)
+        circ.reset(0)
+        circ.rx(theta, 0)
+        if basis == "X":
+            circ.h(0)
+        elif basis == "Y":
+            circ.sdg(0)
+            circ.h(0)
+        circ.measure(0, 0)
+        circuits.append(circ)
+    return circuits
+
+
+def tomography_counts(result, circuits):
+    """Counts of shape ``(3, 2)`` of the outcomes 0 and 1 in the X, Y and Z bases.
+
+    The basis is read from the circuit names, which are ``"X"`` for
+    :func:`tomography_circuits` and ``"('X',)"`` for ``state_tomography_circuits``.
+    """
+    counts = np.zeros((3, 2))
+    for k, circ in enumerate(circuits):
+        basis = "XYZ".index(circ.name.strip("()',"))
+        for key, n in result.get_counts(k).items():
+            # the tomography qubit is the last bit of the key
+            counts[basis, int(key[-1])] += n
+    return counts
+
+
+def bloch_vectors(counts):
+    """Bloch vectors, shape ``(frames, 3)``, from counts of shape ``(frames, 3, 2)``."""
+    counts = np.asarray(counts, dtype=float)
+    r = (counts[..., 0] - counts[..., 1]) / counts.sum(axis=-1)
+    norm = np.linalg.norm(r, axis=-1, keepdims=True)
+    return r / np.maximum(norm, 1)
+
+
+def density_matrices(counts):
+    """Single-qubit density matrices, shape ``(frames, 2, 2)``, of all frames."""
+    r = bloch_vectors(counts)
+    return 0.5 * (np.eye(2) + np.einsum("fk,kij->fij", r, PAULIS))
+
+
+def completed_results(jobs, poll_interval=0.1):
+    """Yield ``(index, result)`` of the jobs in the order they finish."""
+    pending = dict(enumerate(jobs))
+    while pending:
+        done = [j for j, job in pending.items() if job.status() in JOB_FINAL_STATES]
+        for j in done:
+            yield j, pending.pop(j).result()
+        if pending and not done:
+            time.sleep(poll_interval)
+
+
+def render_frame(density_matrix, filename):
+    """Save the Bloch sphere of one density matrix, returns ``filename``."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from qiskit.quantum_info import DensityMatrix
+    from qiskit.visualization import plot_bloch_multivector
+
+    figure = plot_bloch_multivector(DensityMatrix(density_matrix), reverse_bits=True)
+    figure.savefig(filename)
+    plt.close(figure)
+    return filename
+
+
+def compute_frames(
+    backend, circuits_per_frame, folder=None, max_workers=None, **run_options
+):
+    """Density matrices of all frames, rendered to ``folder`` if one is given.
+
+    Args:
+        backend: Backend to run the tomography circuits on.
+        circuits_per_frame: Tomography circuits of every frame, e.g.
+            ``precomputed_tomog_circs``.
+        folder: Directory for the ``frame_<j>.jpg`` images, or ``None`` to skip the
+            rendering.
+        max_workers: Number of rendering processes.
+        run_options: Options of ``backend.run``.
+
+    Returns:
+        Array of shape ``(frames, 2, 2)``.
+    """
+    jobs = [backend.run(circuits, **run_options) for circuits in circuits_per_frame]
+    counts = np.zeros((len(jobs), 3, 2))
+    for j, result in completed_results(jobs):
+        counts[j] = tomography_counts(result, circuits_per_frame[j])
+    rho = density_matrices(counts)
+
+    if folder is not None:
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        filenames = [folder / f"frame_{j:03d}.jpg" for j in range(len(rho))]
+        with ProcessPoolExecutor(max_workers) as executor:
+            list(executor.map(render_frame, rho, filenames))
+    return rho
+
+
+class DelayedJob:
+    """Job whose result becomes available ``latency`` seconds after submission."""
+
+    def __init__(self, job, latency):
+        self.job = job
+        self.ready_at = time.monotonic() + latency
+
+    def status(self):
+        if time.monotonic() < self.ready_at:
+            return JobStatus.RUNNING
+        return self.job.status()
+
+    def result(self):
+        time.sleep(max(0.0, self.ready_at - time.monotonic()))
+        return self.job.result()
+
+
+class DelayedBackend:
+    """Local stand-in for a remote backend whose jobs take a configurable time.
+
+    Args:
+        backend: Backend that runs the circuits, e.g. ``AerSimulator()``.
+        latency: Seconds per job, either one value or one per submitted job.
+    """
+
+    def __init__(self, backend, latency):
+        self.backend = backend
+        self.latency = latency
+        self.num_jobs = 0
+
+    @property
+    def name(self):
+        return f"delayed {self.backend.name}"
+
+    def run(self, circuits, **options):
+        latency = np.atleast_1d(self.latency)[self.num_jobs % np.size(self.latency)]
+        self.num_jobs += 1
+        return DelayedJob(self.backend.run(circuits, **options), float(latency))
+
+
+def _notebook_frames(backend, circuits_per_frame, folder, **run_options):
+    """The loop of the notebook: submit, poll every second, fit, render."""
+    rho = []
+    for j, circuits in enumerate(circuits_per_frame):
+        job = backend.run(circuits, **run_options)
+        while job.status() != JobStatus.DONE:
+            time.sleep(1)  # blocking wait
+        rho.append(density_matrices(tomography_counts(job.result(), circuits)[None])[0])
+        render_frame(rho[-1], folder / f"notebook_{j:03d}.jpg")
+    return np.array(rho)
+
+
+def benchmark(num_frames, max_latency, folder):
+    from qiskit_aer import AerSimulator
+
+    simulator = AerSimulator()
+    thetas = -np.linspace(0, np.pi, num_frames)
+    circuits_per_frame = [
+        transpile(tomography_circuits(theta), simulator) for theta in thetas
+    ]
+    latency = np.random.default_rng(0).uniform(1, max_latency, size=num_frames)
+    print(
+        f"{num_frames} frames, job latencies: sum {latency.sum():.1f} s, "
+        f"max {latency.max():.1f} s"
+    )
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    rho_notebook = _notebook_frames(
+        DelayedBackend(simulator, latency), circuits_per_frame, folder, shots=2000
+    )
+    print(f"notebook loop: {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    rho = compute_frames(
+        DelayedBackend(simulator, latency), circuits_per_frame, folder, shots=2000
+    )
+    print(f"pipeline:      {time.perf_counter() - start:.1f} s")
+
+    # rx(theta)|0> has the Bloch vector (0, -sin(theta), cos(theta))
+    expected = np.stack([0 * thetas, -np.sin(thetas), np.cos(thetas)], axis=1)
+    for name, result in [("notebook loop", rho_notebook), ("pipeline", rho)]:
+        r = np.einsum("fij,kji->fk", result, PAULIS).real
+        print(f"{name} max Bloch vector error: {np.abs(r - expected).max():.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=12)
+    parser.add_argument("--max-latency", type=float, default=3.0)
+    parser.add_argument("--folder", default="demo_bloch_frames")
+    args = parser.parse_args()
+    benchmark(args.frames, args.max_latency, args.folder)
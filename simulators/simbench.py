@@ -0,0 +1,537 @@
+"""Benchmark harness for the QuEST, Qiskit Aer and qsim simulators on eX3 and LUMI.
+
+The job scripts in ``ex3/QuEST`` compile ``bernstein_vazirani_circuit.c`` for every
+precision and parallelism and only print the success probability. This harness runs
+a Bernstein-Vazirani circuit of a given size on every combination of
+
+* simulator: ``quest-st``, ``quest-omp``, ``quest-omp+mpi``, ``aer`` and ``qsim``,
+* qubit count,
+* precision: ``fp32``, ``fp64`` and ``fp128`` (QuEST only),
+* OpenMP threads and MPI ranks (``quest-omp+mpi`` only),
+
+and records the wall time of the process, the simulation time, the peak resident
+set size and the gate throughput. Every configuration runs in its own process, so
+the peak RSS belongs to that configuration alone. QuEST programs are compiled once
+per simulator and precision and reused for all sizes, threads and ranks.
+
+The results go to a store directory: one ``runs/<run id>.json`` per run with a
+schema version, and all records appended to ``results.csv``. ``compare`` flags the
+configurations that became slower (or larger) than in a baseline run, ``best`` lists
+the fastest configuration per qubit count.
+
+QuEST is found through the ``QuEST-kit/libQuEST/3.5.0/<variant>+<precision>``
+modules of eX3 with ``--modules``, otherwise through the ``QuEST_INCLUDE_DIR`` and
+``QuEST_LIBRARY_PATH`` variables set by ``load_QuEST.sh``; such a local library has a
+single precision.
+
+Usage:
+    python simbench.py run --simulators aer quest-omp --qubits 16 20 24 \\
+        --precisions fp32 fp64 --threads 1 4 16
+    python simbench.py compare
+    python simbench.py best
+"""
+
+import argparse
+import csv
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import platform
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+SCHEMA_VERSION = 1
+
+FIELDS = [
+    "run_id",
+    "simulator",
+    "precision",
+    "threads",
+    "ranks",
+    "qubits",
+    "status",
+    "wall_s",
+    "sim_s",
+    "peak_rss_mb",
+    "gates",
+    "gates_per_s",
+    "success_prob",
+]
+
+# configuration columns that identify the same measurement across runs
+KEY_FIELDS = ["simulator", "precision", "threads", "ranks", "qubits"]
+
+BYTES_PER_REAL = {"fp32": 4, "fp64": 8, "fp128": 16}
+QUEST_PREC = {"fp32": 1, "fp64": 2, "fp128": 4}
+QUEST_MODULE = "QuEST-kit/libQuEST/3.5.0/{variant}+{precision}"
+
+# failed QuEST builds by binary path, so that they are not retried in the same run
+_build_errors = {}
+
+# Bernstein-Vazirani with phase oracle, as the QuEST example, for numQubits = argv[1]
+QUEST_SOURCE = r"""
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+#include "QuEST.h"
+
+int main(int argc, char *argv[]) {
+    int numQubits = atoi(argv[1]);
+    long long int secret = 0x5555555555555555LL & ((1LL << numQubits) - 1);
+    int numGates = 2 * numQubits;
+
+    QuESTEnv env = createQuESTEnv();
+    Qureg qureg = createQureg(numQubits, env);
+    initZeroState(qureg);
+    syncQuESTEnv(env);
+
+    struct timespec start, end;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    for (int qb = 0; qb < numQubits; qb++)
+        hadamard(qureg, qb);
+    for (int qb = 0; qb < numQubits; qb++)
+        if ((secret >> qb) & 1) {
+            pauliZ(qureg, qb);
+            numGates++;
+        }
+    for (int qb = 0; qb < numQubits; qb++)
+        hadamard(qureg, qb);
+    syncQuESTEnv(env);
+    clock_gettime(CLOCK_MONOTONIC, &end);
+
+    qreal successProb = getProbAmp(qureg, secret);
+    if (env.rank == 0)
+        printf("{\"sim_s\": %.9f, \"gates\": %d, \"success_prob\": %.8f}\n",
+               (end.tv_sec - start.tv_sec) + 1e-9 * (end.tv_nsec - start.tv_nsec),
+               numGates, (double) successProb);
+
+    destroyQureg(qureg, env);
+    destroyQuESTEnv(env);
+    return 0;
+}
+"""
+
+
+def secret_string(num_qubits):
+    """Secret ``...0101`` of the circuit, qubit 0 is the last character."""
+    return "".join("1" if q % 2 == 0 else "0" for q in reversed(range(num_qubits)))
+
+
+def configurations(args):
+    """Valid configurations of the requested matrix, smallest circuits first."""
+    for qubits, simulator, precision, threads, ranks in itertools.product(
+        sorted(args.qubits), args.simulators, args.precisions, args.threads, args.ranks
+    ):
+        if simulator == "quest-st" and threads > 1:
+            continue
+        if simulator != "quest-omp+mpi" and ranks > 1:
+            continue
+        if simulator == "aer" and precision == "fp128":
+            continue
+        if simulator == "qsim" and precision != "fp32":
+            continue
+        memory = 2**qubits * 2 * BYTES_PER_REAL[precision] / ranks
+        if memory > args.max_memory_gb * 2**30:
+            continue
+        yield {
+            "simulator": simulator,
+            "precision": precision,
+            "threads": threads,
+            "ranks": ranks,
+            "qubits": qubits,
+        }
+
+
+def build_quest(variant, precision, build_dir, use_modules, compiler="cc"):
+    """Compile the QuEST program once per variant, precision and source."""
+    build_dir = Path(build_dir)
+    build_dir.mkdir(parents=True, exist_ok=True)
+    source = build_dir / "bernstein_vazirani.c"
+    if not source.exists() or source.read_text() != QUEST_SOURCE:
+        source.write_text(QUEST_SOURCE)
+    digest = hashlib.sha1(
+        f"{QUEST_SOURCE}{variant}{precision}{use_modules}".encode()
+    ).hexdigest()[:8]
+    binary = build_dir / f"bernstein_{variant.replace('+', '_')}_{precision}_{digest}"
+    if binary.exists():
+        return binary
+    if binary in _build_errors:
+        raise _build_errors[binary]
+
+    command = [compiler, "-o", str(binary), str(source)]
+    if not use_modules:
+        command += [f"-I{os.environ.get('QuEST_INCLUDE_DIR', '.')}"]
+        command += [f"-L{os.environ.get('QuEST_LIBRARY_PATH', '.')}"]
+    command += ["-lQuEST", "-lm", f"-DQuEST_PREC={QUEST_PREC[precision]}"]
+    try:
+        subprocess.run(_shell(command, variant, precision, use_modules), check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        _build_errors[binary] = e
+        raise
+    return binary
+
+
+def _shell(command, variant, precision, use_modules):
+    """``command``, inside ``bash -lc`` with the QuEST module loaded if requested."""
+    if not use_modules:
+        return command
+    module = QUEST_MODULE.format(variant=variant, precision=precision)
+    return ["bash", "-lc", f"module load {module} && exec {shlex.join(command)}"]
+
+
+def run_process(command, env, timeout):
+    """Run ``command``, returns its JSON output line, wall time and peak RSS in MB.
+
+    The peak RSS is that of the largest process of the command, from ``wait4``.
+    ``communicate`` would reap the process without its resource usage, so stdout is
+    drained until the process closes it, the process is reaped with ``wait4``, and
+    a timer kills it after ``timeout`` seconds.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        with process.stdout:
+            output = process.stdout.read()
+    finally:
+        _, status, rusage = os.wait4(process.pid, 0)
+        timer.cancel()
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+    if timed_out.is_set():
+        raise TimeoutError(f"{command[0]} exceeded {timeout} s")
+    if process.returncode != 0:
+        raise RuntimeError(f"{command[0]} exited with {process.returncode}")
+    lines = [line for line in output.splitlines() if line.startswith("{")]
+    # ru_maxrss is in kilobytes on Linux
+    return json.loads(lines[-1]), wall, rusage.ru_maxrss / 1024
+
+
+def command_for(config, args):
+    """Command and environment that run ``config``, compiling QuEST if needed."""
+    env = dict(os.environ, OMP_NUM_THREADS=str(config["threads"]))
+    simulator = config["simulator"]
+    if not simulator.startswith("quest-"):
+        command = [sys.executable, __file__, "worker", simulator]
+        command += [str(config[k]) for k in ["qubits", "precision", "threads"]]
+        return command, env
+
+    variant = simulator.removeprefix("quest-")
+    binary = build_quest(variant, config["precision"], args.build_dir, args.modules)
+    command = [str(binary), str(config["qubits"])]
+    if config["ranks"] > 1:
+        command = [args.launcher, "-n", str(config["ranks"])] + command
+    if not args.modules and "QuEST_LIBRARY_PATH" in os.environ:
+        env["LD_LIBRARY_PATH"] = os.pathsep.join(
+            [os.environ["QuEST_LIBRARY_PATH"], env.get("LD_LIBRARY_PATH", "")]
+        )
+    return _shell(command, variant, config["precision"], args.modules), env
+
+
+def measure(config, args):
+    """One record of the results store for ``config``."""
+    record = dict(config, status="ok")
+    try:
+        command, env = command_for(config, args)
+        output, wall, rss = run_process(command, env, args.timeout)
+    except (OSError, RuntimeError, TimeoutError, subprocess.CalledProcessError) as e:
+        record["status"] = f"error: {e}"
+        return record
+    record.update(
+        wall_s=wall,
+        sim_s=output["sim_s"],
+        peak_rss_mb=rss,
+        gates=output["gates"],
+        gates_per_s=output["gates"] / output["sim_s"],
+        success_prob=output["success_prob"],
+    )
+    return record
+
+
+def worker(simulator, num_qubits, precision, threads):
+    """Simulate the circuit with Qiskit Aer or qsim and print the JSON line."""
+    secret = secret_string(num_qubits)
+    if simulator == "aer":
+        from qiskit import QuantumCircuit
+        from qiskit_aer import AerSimulator
+
+        circuit = QuantumCircuit(num_qubits)
+        circuit.h(range(num_qubits))
+        for q, bit in enumerate(reversed(secret)):
+            if bit == "1":
+                circuit.z(q)
+        circuit.h(range(num_qubits))
+        circuit.save_amplitudes_squared([int(secret, 2)])
+        backend = AerSimulator(
+            method="statevector",
+            precision="single" if precision == "fp32" else "double",
+            max_parallel_threads=threads,
+        )
+        start = time.perf_counter()
+        result = backend.run(circuit).result()
+        sim_s = time.perf_counter() - start
+        success_prob = float(result.data()["amplitudes_squared"][0])
+        gates = circuit.size() - 1
+    elif simulator == "qsim":
+        import cirq
+        import qsimcirq
+
+        qubits = cirq.LineQubit.range(num_qubits)
+        ops = [cirq.H(q) for q in qubits]
+        ops += [cirq.Z(q) for q, bit in zip(qubits, reversed(secret)) if bit == "1"]
+        ops += [cirq.H(q) for q in qubits]
+        circuit = cirq.Circuit(ops)
+        backend = qsimcirq.QSimSimulator(qsimcirq.QSimOptions(cpu_threads=threads))
+        start = time.perf_counter()
+        # qsim orders the amplitudes with qubit 0 as the most significant bit
+        amplitude = backend.compute_amplitudes(circuit, [int(secret[::-1], 2)])[0]
+        sim_s = time.perf_counter() - start
+        success_prob = abs(amplitude) ** 2
+        gates = len(ops)
+    else:
+        raise ValueError(f"unknown simulator {simulator}")
+    print(json.dumps({"sim_s": sim_s, "gates": gates, "success_prob": success_prob}))
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def save_run(store, records, metadata):
+    """Write ``runs/<run id>.json`` and append the records to ``results.csv``."""
+    store = Path(store)
+    (store / "runs").mkdir(parents=True, exist_ok=True)
+    run = dict(metadata, schema=SCHEMA_VERSION, records=records)
+    (store / "runs" / f"{metadata['run_id']}.json").write_text(json.dumps(run, indent=1))
+
+    csv_path = store / "results.csv"
+    new_file = not csv_path.exists()
+    with open(csv_path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+        if new_file:
+            writer.writeheader()
+        for record in records:
+            writer.writerow(dict(record, run_id=metadata["run_id"]))
+
+
+def load_runs(store):
+    """Runs of the store, oldest first."""
+    runs = []
+    for path in sorted(Path(store).glob("runs/*.json")):
+        run = json.loads(path.read_text())
+        if run.get("schema") != SCHEMA_VERSION:
+            print(f"skipping {path.name}: schema {run.get('schema')}")
+            continue
+        runs.append(run)
+    return runs
+
+
+def regressions(baseline, current, tolerance=0.1, min_seconds=0.01, min_mb=5.0):
+    """Records of ``current`` that are slower or use more memory than ``baseline``.
+
+    Returns ``(record, field, baseline value, current value)`` for every time or
+    peak RSS that grew by more than ``tolerance`` and by more than ``min_seconds``
+    or ``min_mb``, so the noise of millisecond timings is not flagged.
+    """
+    floors = {"sim_s": min_seconds, "wall_s": min_seconds, "peak_rss_mb": min_mb}
+    previous = {
+        tuple(r[k] for k in KEY_FIELDS): r for r in baseline if r["status"] == "ok"
+    }
+    found = []
+    for record in current:
+        old = previous.get(tuple(record[k] for k in KEY_FIELDS))
+        if old is None or record["status"] != "ok":
+            continue
+        for field, floor in floors.items():
+            grown = record[field] - old[field]
+            if grown > old[field] * tolerance and grown > floor:
+                found.append((record, field, old[field], record[field]))
+    return found
+
+
+def best_configurations(records):
+    """Fastest successful configuration per simulated qubit count."""
+    best = {}
+    for record in records:
+        if record["status"] != "ok":
+            continue
+        current = best.get(record["qubits"])
+        if current is None or record["sim_s"] < current["sim_s"]:
+            best[record["qubits"]] = record
+    return [best[n] for n in sorted(best)]
+
+
+def _describe(record):
+    return (
+        f"{record['simulator']:14s} {record['precision']:5s} "
+        f"{record['threads']:3d} threads {record['ranks']:3d} ranks "
+        f"{record['qubits']:3d} qubits"
+    )
+
+
+def _print_record(record):
+    if record["status"] != "ok":
+        print(f"{_describe(record)}: {record['status']}")
+        return
+    print(
+        f"{_describe(record)}: {record['sim_s']:9.4f} s simulation, "
+        f"{record['wall_s']:8.2f} s wall, {record['peak_rss_mb']:8.1f} MB, "
+        f"{record['gates_per_s']:10.3g} gates/s, P(secret) {record['success_prob']:.4f}"
+    )
+
+
+def run(args):
+    now = datetime.datetime.now()
+    metadata = {
+        # microseconds keep the ids of quick successive runs apart and sortable
+        "run_id": now.strftime("%Y%m%dT%H%M%S%f"),
+        "created": now.isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "label": args.label,
+    }
+    records = []
+    failed = set()
+    for config in configurations(args):
+        # larger circuits of a failed configuration would fail as well
+        key = tuple(config[k] for k in KEY_FIELDS if k != "qubits")
+        if key in failed:
+            continue
+        repeats = []
+        for _ in range(args.repeats):
+            repeats.append(measure(config, args))
+            if repeats[-1]["status"] != "ok":
+                break
+        if repeats[-1]["status"] == "ok":
+            record = min(repeats, key=lambda r: r["sim_s"])
+        else:
+            record = repeats[-1]
+            failed.add(key)
+        _print_record(record)
+        records.append(record)
+    save_run(args.store, records, metadata)
+
+    runs = load_runs(args.store)
+    if len(runs) > 1:
+        _print_regressions(runs[-2], runs[-1], args)
+
+
+def _print_regressions(baseline, current, args):
+    found = regressions(
+        baseline["records"], current["records"], args.tolerance, args.min_seconds
+    )
+    print(
+        f"\n{len(found)} regressions of run {current['run_id']} "
+        f"against {baseline['run_id']}:"
+    )
+    for record, field, old, new in found:
+        print(f"  {_describe(record)}: {field} {old:.4g} -> {new:.4g}")
+    return found
+
+
+def compare(args):
+    runs = {run["run_id"]: run for run in load_runs(args.store)}
+    ids = list(runs)
+    if not ids:
+        sys.exit(f"no runs in {args.store}")
+    current = runs[args.run or ids[-1]]
+    if args.baseline:
+        baseline = runs[args.baseline]
+    elif ids.index(current["run_id"]) > 0:
+        baseline = runs[ids[ids.index(current["run_id"]) - 1]]
+    else:
+        sys.exit(f"no run before {current['run_id']} to compare against")
+    if baseline is current:
+        sys.exit(f"cannot compare run {current['run_id']} against itself")
+    if _print_regressions(baseline, current, args):
+        sys.exit(1)
+
+
+def best(args):
+    runs = load_runs(args.store)
+    records = (
+        [r for run in runs for r in run["records"]] if args.all else runs[-1]["records"]
+    )
+    for record in best_configurations(records):
+        _print_record(record)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--store", default="simbench-results")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="benchmark a configuration matrix")
+    run_parser.add_argument(
+        "--simulators",
+        nargs="+",
+        default=["aer"],
+        choices=["quest-st", "quest-omp", "quest-omp+mpi", "aer", "qsim"],
+    )
+    run_parser.add_argument("--qubits", nargs="+", type=int, default=[12, 16, 20])
+    run_parser.add_argument(
+        "--precisions", nargs="+", default=["fp64"], choices=list(BYTES_PER_REAL)
+    )
+    run_parser.add_argument("--threads", nargs="+", type=int, default=[1])
+    run_parser.add_argument("--ranks", nargs="+", type=int, default=[1])
+    run_parser.add_argument("--repeats", type=int, default=3)
+    run_parser.add_argument("--timeout", type=float, default=3600)
+    run_parser.add_argument("--max-memory-gb", type=float, default=16)
+    run_parser.add_argument("--modules", action="store_true", help="use eX3 modules")
+    run_parser.add_argument(
+        "--launcher", default="srun" if "SLURM_JOB_ID" in os.environ else "mpirun"
+    )
+    run_parser.add_argument("--build-dir", default="simbench-build")
+    run_parser.add_argument("--label", default="")
+    run_parser.add_argument("--tolerance", type=float, default=0.1)
+    run_parser.add_argument("--min-seconds", type=float, default=0.01)
+
+    compare_parser = commands.add_parser("compare", help="flag regressions")
+    compare_parser.add_argument("--run", help="run id, the latest by default")
+    compare_parser.add_argument("--baseline", help="run id, the previous by default")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1)
+    compare_parser.add_argument("--min-seconds", type=float, default=0.01)
+
+    best_parser = commands.add_parser("best", help="fastest configuration per size")
+    best_parser.add_argument("--all", action="store_true", help="over all runs")
+
+    worker_parser = commands.add_parser("worker")
+    worker_parser.add_argument("simulator")
+    worker_parser.add_argument("qubits", type=int)
+    worker_parser.add_argument("precision")
+    worker_parser.add_argument("threads", type=int)
+
+    args = parser.parse_args()
+    if args.command == "worker":
+        worker(args.simulator, args.qubits, args.precision, args.threads)
+    else:
+        {"run": run, "compare": compare, "best": best}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
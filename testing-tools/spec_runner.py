@@ -0,0 +1,604 @@
+"""Local execution of program-specification tests for Quito, QuSBT and QuCAT.
+
+The tutorials hand a configuration file to ``quito``, ``qusbt`` or ``qucat``, time
+the call with ``time.time()`` and move to ``sbatch`` when the test suites get large.
+For every test input the tools build a new circuit, call ``run(qc)`` of the program
+under test, transpile and simulate a fixed number of shots, one input after the
+other. :class:`SpecRunner` executes the test inputs of such a configuration file on
+one node:
+
+* the program under test is built and transpiled once per worker process; a test
+  input only prepends its ``X`` gates to the compiled circuit,
+* the test inputs are distributed across a process pool,
+* the shots of an input are doubled from ``min_shots`` up to ``max_shots`` only
+  until the oracles decide: an output that the specification does not allow fails
+  the test at once (uof/WOO), a chi-square test against the specified
+  distribution fails it (wodf/OPO), and it passes once every output probability is
+  known to within ``tolerance``. The bound shrinks with the observed spread
+  ``p (1 - p)`` of the outputs (:func:`deviation_bound`), so deterministic and
+  nearly deterministic outputs pass after a few hundred shots,
+* the counts of every input and number of shots are cached, so inputs that appear
+  in several test suites are simulated once,
+* every :class:`TestResult` records its shots, simulator calls and seconds.
+
+Bit strings follow the configuration files and Qiskit: the last character of an
+input is the qubit listed first in ``inputID``, the last character of an output is
+the first classical bit. A ``-`` in the specification matches both ``0`` and ``1``.
+
+Usage:
+    runner = SpecRunner.from_config("configuration.ini")
+    results = runner.run(runner.specified_inputs())
+    print(summary(results))
+
+Running this file tests a configuration on all inputs of its specification, or
+compares the runner with a serial fixed-shot loop on the QRAM example of
+``tutorial_qucat.ipynb`` without arguments:
+
+    python spec_runner.py configuration.ini --workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import configparser
+import importlib.util
+import itertools
+import math
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+from scipy import stats
+
+
+@dataclass
+class TestResult:
+    """Outcome of one test input."""
+
+    input: str
+    verdict: str  # "pass", "fail", "inconclusive" or "unspecified"
+    oracle: str = ""  # "uof" or "wodf" for failures
+    shots: int = 0
+    counts: dict = field(default_factory=dict, repr=False)
+    simulator_calls: int = 0
+    seconds: float = 0.0
+    cached: bool = False
+
+
+def load_program(root):
+    """The ``run(qc)`` function of a quantum program file."""
+    spec = importlib.util.spec_from_file_location(Path(root).stem, root)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.run
+
+
+def expand(pattern):
+    """All bit strings matched by a pattern with ``-`` wildcards."""
+    slots = [("0", "1") if char == "-" else (char,) for char in pattern]
+    return ["".join(bits) for bits in itertools.product(*slots)]
+
+
+def matches(pattern, bits):
+    return len(pattern) == len(bits) and all(p in ("-", b) for p, b in zip(pattern, bits))
+
+
+def shot_schedule(min_shots, max_shots):
+    """Cumulative shots of the stages, doubling from ``min_shots`` to ``max_shots``."""
+    schedule = [min_shots]
+    while schedule[-1] < max_shots:
+        schedule.append(min(2 * schedule[-1], max_shots))
+    return schedule
+
+
+def deviation_bound(frequencies, shots, alpha):
+    """Largest deviation of the observed ``frequencies`` from the output
+    probabilities, simultaneously for all outputs with probability ``1 - alpha``.
+
+    The smaller of the Hoeffding bound and the empirical Bernstein bound
+    ``sqrt(2 V ln(3/d) / n) + 3 ln(3/d) / n`` of Audibert, Munos and Szepesvari
+    (2009) with the observed variance ``V = f (1 - f)``, each at half of ``alpha``.
+    """
+    frequencies = np.asarray(frequencies, dtype=float)
+    delta = alpha / (2 * len(frequencies))
+    hoeffding = math.sqrt(math.log(2 / delta) / (2 * shots))
+    log_term = math.log(3 / delta)
+    variance = frequencies * (1 - frequencies)
+    bernstein = np.sqrt(2 * variance * log_term / shots) + 3 * log_term / shots
+    return np.minimum(bernstein, hoeffding)
+
+
+def oracle(counts, expected, alpha, tolerance):
+    """Verdict of the uof and wodf oracles, ``None`` while undecided.
+
+    Args:
+        counts: Observed counts of the outputs.
+        expected: Specified probabilities of the outputs.
+        alpha: Significance level of this look at the counts.
+        tolerance: Largest deviation of an output probability that may go
+            unnoticed by a passing test.
+
+    Returns:
+        ``(verdict, oracle)`` with the verdict ``"pass"`` or ``"fail"``, or ``None``.
+    """
+    if any(expected.get(output, 0) == 0 for output in counts):
+        return "fail", "uof"
+    shots = sum(counts.values())
+    outputs = list(expected)
+    if len(outputs) > 1:
+        probabilities = np.array([expected[output] for output in outputs])
+        observed = np.array([counts.get(output, 0) for output in outputs])
+        f_exp = shots * probabilities / probabilities.sum()
+        if stats.chisquare(observed, f_exp).pvalue < alpha:
+            return "fail", "wodf"
+    frequencies = [counts.get(output, 0) / shots for output in outputs]
+    if (deviation_bound(frequencies, shots, alpha) <= tolerance).all():
+        return "pass", ""
+    return None
+
+
+def adaptive_test(expected, counts_at, schedule, alpha, tolerance):
+    """Run the stages of ``schedule`` until the oracles decide.
+
+    Args:
+        expected: Specified output probabilities of the input.
+        counts_at: Called with the cumulative shots of a stage, returns the counts.
+        schedule: Cumulative shots of the stages, see :func:`shot_schedule`.
+        alpha: Significance level, split evenly between the stages.
+        tolerance: See :func:`oracle`.
+
+    Returns:
+        ``(verdict, oracle, shots, counts)``.
+    """
+    for shots in schedule:
+        counts = counts_at(shots)
+        decision = oracle(counts, expected, alpha / len(schedule), tolerance)
+        if decision is not None:
+            return (*decision, shots, counts)
+    return "inconclusive", "", shots, counts
+
+
+class SpecRunner:
+    """Executes the test inputs of a Quito, QuSBT or QuCAT configuration.
+
+    Args:
+        root: Quantum program file with the ``run(qc)`` function.
+        num_qubit: Number of qubits of the program.
+        input_ids: Input qubits, the first one is the last character of an input.
+        output_ids: Output qubits.
+        specification: Dict of ``(input pattern, output pattern)`` to probability.
+        alpha: Significance level of the wodf oracle.
+        tolerance: See :func:`oracle`.
+        min_shots: Shots of the first stage.
+        max_shots: Shots after which an undecided test is inconclusive.
+        max_workers: Number of processes, defaults to the number of CPUs.
+        seed: Seed of the simulator.
+    """
+
+    def __init__(
+        self,
+        root,
+        num_qubit,
+        input_ids,
+        output_ids,
+        specification,
+        alpha=0.01,
+        tolerance=0.05,
+        min_shots=64,
+        max_shots=8192,
+        max_workers=None,
+        seed=0,
+    ):
+        self.program = (str(root), num_qubit, tuple(input_ids), len(output_ids))
+        self.input_ids = tuple(input_ids)
+        self.output_ids = tuple(output_ids)
+        self.specification = specification
+        self.alpha = alpha
+        self.tolerance = tolerance
+        self.schedule = shot_schedule(min_shots, max_shots)
+        self.max_workers = max_workers or os.cpu_count()
+        self.seed = seed
+        # (input, cumulative shots) -> counts
+        self.cache = {}
+        self._pool = None
+
+    @classmethod
+    def from_config(cls, filename, **options):
+        """Runner of the ``[program]`` and ``[program_specification]`` of a file.
+
+        The significance level is read from ``confidence_level`` (Quito, QuSBT) or
+        ``significance_level`` (QuCAT) if ``alpha`` is not given.
+        """
+        config = configparser.ConfigParser(delimiters=("=",), interpolation=None)
+        config.optionxform = str
+        config.read(filename)
+        program = config["program"]
+
+        def ids(key):
+            return [int(i) for i in program[key].split(",")]
+
+        specification = {}
+        for key, value in config["program_specification"].items():
+            specification[tuple(key.strip().split(","))] = float(value)
+        if "alpha" not in options:
+            for section in config.sections():
+                for key in ("confidence_level", "significance_level"):
+                    if config.has_option(section, key):
+                        options["alpha"] = config.getfloat(section, key)
+        return cls(
+            program["root"].strip(),
+            int(program["num_qubit"]),
+            ids("inputID"),
+            ids("outputID"),
+            specification,
+            **options,
+        )
+
+    def expected(self, input):
+        """Specified output probabilities of ``input``, ``None`` if unspecified."""
+        expected = {}
+        for (input_pattern, output_pattern), probability in self.specification.items():
+            if matches(input_pattern, input):
+                for output in expand(output_pattern):
+                    expected[output] = probability
+        return expected or None
+
+    def specified_inputs(self):
+        """All inputs matched by the specification, e.g. for input coverage."""
+        patterns = {input_pattern for input_pattern, _ in self.specification}
+        return sorted({bits for pattern in patterns for bits in expand(pattern)})
+
+    def run(self, inputs):
+        """Test the ``inputs`` and return one :class:`TestResult` per input.
+
+        Inputs that occur more than once, or whose stages are cached from an
+        earlier call, are not simulated again.
+        """
+        results = {}
+        pending = {}
+        for input in dict.fromkeys(inputs):
+            expected = self.expected(input)
+            if expected is None:
+                results[input] = TestResult(input, "unspecified")
+                continue
+            try:
+                decision = adaptive_test(
+                    expected,
+                    lambda shots: self.cache[input, shots],
+                    self.schedule,
+                    self.alpha,
+                    self.tolerance,
+                )
+            except KeyError:
+                pending[input] = expected
+                continue
+            verdict, oracle_name, shots, counts = decision
+            results[input] = TestResult(
+                input, verdict, oracle_name, shots, counts, cached=True
+            )
+
+        if pending:
+            if self._pool is None:
+                # Aer's thread pool does not survive a fork of a process that has
+                # already run a simulation, so the workers are spawned
+                self._pool = ProcessPoolExecutor(
+                    self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=self.program,
+                )
+            futures = {
+                input: self._pool.submit(
+                    _test_input,
+                    input,
+                    expected,
+                    self.schedule,
+                    self.alpha,
+                    self.tolerance,
+                    {s: c for (i, s), c in self.cache.items() if i == input},
+                    self.seed,
+                )
+                for input, expected in pending.items()
+            }
+            for input, future in futures.items():
+                result, stages = future.result()
+                for shots, counts in stages.items():
+                    self.cache[input, shots] = counts
+                results[input] = result
+        return [results[input] for input in inputs]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# compiled program of a worker process
+_program = {}
+
+
+def _init_worker(root, num_qubit, input_ids, num_outputs):
+    from qiskit import QuantumCircuit, transpile
+    from qiskit_aer import AerSimulator
+
+    simulator = AerSimulator()
+    qc = QuantumCircuit(num_qubit, num_outputs)
+    load_program(root)(qc)
+    circuit = transpile(qc, simulator)
+    # the X gates of an input act on the physical qubits of the input qubits
+    if circuit.layout is None:
+        physical = list(range(num_qubit))
+    else:
+        physical = circuit.layout.initial_index_layout(filter_ancillas=True)
+    _program.update(
+        simulator=simulator,
+        circuit=circuit,
+        input_qubits=[physical[qubit] for qubit in input_ids],
+    )
+
+
+def _input_circuit(input):
+    from qiskit import QuantumCircuit
+
+    circuit = _program["circuit"]
+    prep = QuantumCircuit(circuit.num_qubits)
+    for qubit, bit in zip(_program["input_qubits"], reversed(input)):
+        if bit == "1":
+            prep.x(qubit)
+    return circuit.compose(prep, front=True)
+
+
+def _test_input(input, expected, schedule, alpha, tolerance, cached, seed):
+    start = time.perf_counter()
+    circuit = _input_circuit(input)
+    stages = dict(cached)
+    calls = 0
+
+    def counts_at(shots):
+        nonlocal calls
+        if shots not in stages:
+            previous = max((s for s in stages if s < shots), default=0)
+            seed_simulator = np.random.SeedSequence([seed, int(input, 2), shots])
+            job = _program["simulator"].run(
+                circuit,
+                shots=shots - previous,
+                seed_simulator=int(seed_simulator.generate_state(1)[0]),
+            )
+            counts = Counter(stages.get(previous, {}))
+            counts.update(job.result().get_counts())
+            stages[shots] = dict(counts)
+            calls += 1
+        return stages[shots]
+
+    verdict, oracle_name, shots, counts = adaptive_test(
+        expected, counts_at, schedule, alpha, tolerance
+    )
+    result = TestResult(
+        input,
+        verdict,
+        oracle_name,
+        shots,
+        counts,
+        simulator_calls=calls,
+        seconds=time.perf_counter() - start,
+    )
+    return result, stages
+
+
+def summary(results):
+    """One line per verdict plus the shots, simulator calls and the slowest test."""
+    # run() returns the result of a repeated input once per occurrence: it is
+    # simulated once and every other occurrence is served from the cache
+    simulated = list({id(r): r for r in results if not r.cached}.values())
+    from_cache = len(results) - len(simulated)
+    unique = {}
+    for result in results:
+        unique.setdefault(result.input, result)
+    lines = []
+    for verdict in ("fail", "pass", "inconclusive", "unspecified"):
+        selected = [r for r in unique.values() if r.verdict == verdict]
+        if selected:
+            lines.append(f"{verdict:12s} {len(selected):6d}")
+    lines.append(
+        f"{sum(r.shots for r in simulated)} shots in "
+        f"{sum(r.simulator_calls for r in simulated)} simulator calls, "
+        f"{sum(r.seconds for r in simulated):.2f} s in the workers, "
+        f"{from_cache} tests from the cache"
+    )
+    if simulated:
+        slowest = max(simulated, key=lambda r: r.seconds)
+        lines.append(
+            f"slowest test: input {slowest.input}, {slowest.seconds:.3f} s, "
+            f"{slowest.shots} shots"
+        )
+    return "\n".join(lines)
+
+
+def exact_specification(root, num_qubit, input_ids, output_ids, inputs):
+    """Specification of a reference program from its exact output probabilities."""
+    from qiskit import QuantumCircuit
+    from qiskit.quantum_info import Statevector
+
+    run = load_program(root)
+    specification = {}
+    for input in inputs:
+        qc = QuantumCircuit(num_qubit, len(output_ids))
+        for qubit, bit in zip(input_ids, reversed(input)):
+            if bit == "1":
+                qc.x(qubit)
+        run(qc)
+        state = Statevector(qc.remove_final_measurements(inplace=False))
+        probabilities = state.probabilities_dict(qargs=list(output_ids), decimals=12)
+        for output, probability in probabilities.items():
+            if probability > 0:
+                specification[input, output] = probability
+    return specification
+
+
+QRAM = """
+import math
+
+
+def run(qc):
+    qc.h(4)
+    qc.p(math.pi / 3, 4)
+    {mutation}
+    qc.h(4)
+
+    qc.barrier()
+
+    qc.cswap(4, 5, 9)
+    qc.cswap(4, 6, 10)
+    qc.cswap(4, 7, 11)
+    qc.cswap(4, 8, 12)
+
+    qc.barrier()
+
+    qc.swap(0, 5)
+    qc.swap(1, 6)
+    qc.swap(2, 7)
+    qc.swap(3, 8)
+
+    qc.barrier()
+
+    qc.mcx([0, 1, 2], 3)
+    qc.mcx([0, 1], 2)
+    qc.cx(0, 1)
+    qc.x(0)
+
+    qc.barrier()
+
+    qc.measure([0, 1, 2, 3], [0, 1, 2, 3])
+"""
+
+
+def _serial_suite(root, num_qubit, input_ids, num_outputs, specification, inputs, shots):
+    """Loop of the tools: new circuit per input, fixed shots, uof and wodf oracles."""
+    from qiskit import QuantumCircuit, transpile
+    from qiskit_aer import AerSimulator
+
+    simulator = AerSimulator()
+    run = load_program(root)
+    verdicts = []
+    for input in inputs:
+        qc = QuantumCircuit(num_qubit, num_outputs)
+        for qubit, bit in zip(input_ids, reversed(input)):
+            if bit == "1":
+                qc.x(qubit)
+        run(qc)
+        counts = (
+            simulator.run(transpile(qc, simulator), shots=shots).result().get_counts()
+        )
+        expected = {o: p for (i, o), p in specification.items() if i == input}
+        decision = oracle(counts, expected, 0.01, 0)
+        verdicts.append(decision[0] if decision else "pass")
+    return verdicts
+
+
+def benchmark(num_suites, suite_size, shots, max_workers):
+    """Test the mutated QRAM of the QuCAT tutorial with random test suites."""
+    with tempfile.TemporaryDirectory() as folder:
+        _benchmark(Path(folder), num_suites, suite_size, shots, max_workers)
+
+
+def _benchmark(folder, num_suites, suite_size, shots, max_workers):
+    num_qubit, input_ids, output_ids = 13, list(range(4, 13)), [0, 1, 2, 3]
+    reference = folder / "qram.py"
+    reference.write_text(QRAM.format(mutation=""))
+    mutant = folder / "qram_m3.py"
+    mutant.write_text(QRAM.format(mutation="qc.mcx([5, 7, 9, 11], 12)  # M3"))
+
+    all_inputs = [format(i, "09b") for i in range(2**9)]
+    specification = exact_specification(
+        reference, num_qubit, input_ids, output_ids, all_inputs
+    )
+    # inputs on which the mutant differs from the reference
+    mutant_specification = exact_specification(
+        mutant, num_qubit, input_ids, output_ids, all_inputs
+    )
+    faulty = {
+        input
+        for input in all_inputs
+        if not np.isclose(
+            [specification.get((input, format(o, "04b")), 0) for o in range(16)],
+            [mutant_specification.get((input, format(o, "04b")), 0) for o in range(16)],
+        ).all()
+    }
+    rng = np.random.default_rng(0)
+    suites = [
+        [all_inputs[i] for i in rng.choice(len(all_inputs), suite_size, replace=False)]
+        for _ in range(num_suites)
+    ]
+    print(
+        f"{num_suites} suites of {suite_size} inputs, "
+        f"{len({i for s in suites for i in s})} distinct inputs"
+    )
+
+    start = time.perf_counter()
+    serial = [
+        _serial_suite(mutant, num_qubit, input_ids, 4, specification, suite, shots)
+        for suite in suites
+    ]
+    elapsed = time.perf_counter() - start
+    print(f"serial loop, {shots} shots per test: {elapsed:.2f} s")
+
+    start = time.perf_counter()
+    with SpecRunner(
+        mutant,
+        num_qubit,
+        input_ids,
+        output_ids,
+        specification,
+        max_shots=shots,
+        max_workers=max_workers,
+    ) as runner:
+        results = [runner.run(suite) for suite in suites]
+    elapsed = time.perf_counter() - start
+    print(f"SpecRunner: {elapsed:.2f} s")
+    print(summary([r for suite in results for r in suite]))
+    tests = [
+        (i, v) for suite, verdicts in zip(suites, serial) for i, v in zip(suite, verdicts)
+    ]
+    runner_tests = [(r.input, r.verdict) for suite in results for r in suite]
+    for name, verdicts in [("serial loop", tests), ("SpecRunner", runner_tests)]:
+        found = sum(v == "fail" for i, v in verdicts if i in faulty)
+        false = sum(v == "fail" for i, v in verdicts if i not in faulty)
+        print(
+            f"{name}: {found} of {sum(i in faulty for i, _ in verdicts)} tests of "
+            f"faulty inputs failed, {false} false failures"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config", nargs="?", help="configuration file of the tools")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-shots", type=int, default=8192)
+    parser.add_argument("--suites", type=int, default=20)
+    parser.add_argument("--suite-size", type=int, default=50)
+    args = parser.parse_args()
+    if args.config is None:
+        benchmark(args.suites, args.suite_size, args.max_shots, args.workers)
+    else:
+        start = time.perf_counter()
+        with SpecRunner.from_config(
+            args.config, max_shots=args.max_shots, max_workers=args.workers
+        ) as runner:
+            results = runner.run(runner.specified_inputs())
+        for result in results:
+            if result.verdict != "pass":
+                print(result.input, result.verdict, result.oracle, result.shots)
+        print(summary(results))
+        print(f"total: {time.perf_counter() - start:.2f} s")
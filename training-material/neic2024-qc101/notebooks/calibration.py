@@ -0,0 +1,355 @@
+"""Pooled, cached calibration metrics of IQM devices and a columnar metric store.
+
+``get_calibration_data`` in ``utils.py`` used to open a new connection for every
+request, and ``plot_metrics`` scans all keys of ``data["metrics"]`` for every
+plotted metric. For time series over hundreds of calibration sets this module
+provides
+
+* :class:`CalibrationClient`, which reuses the connections of one
+  ``requests.Session`` and caches the metrics per calibration set UUID, in memory
+  and optionally as JSON files, since historical calibration sets never change,
+* :class:`CalibrationStore`, which keeps the values by metric name, qubit and
+  calibration set, so queries only touch the entries of the requested metric.
+
+Usage:
+    client = CalibrationClient.from_iqm_client(backend.client, cache_dir="calibration")
+    store = CalibrationStore()
+    for set_id, data in zip(set_ids, client.get_many(set_ids)):
+        store.add(set_id, data)
+    t1 = store.table("t1_time")  # shape (calibration sets, qubits)
+
+Running this file serves synthetic calibration sets from a local HTTP server and
+compares the per-call requests of the notebook with the client:
+
+    python calibration.py --sets 300 --qubits 20 --latency 0.02
+"""
+
+import argparse
+import copy
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CalibrationClient:
+    """Calibration metrics of an IQM server with pooled connections and a cache.
+
+    Args:
+        base_url: URL of the IQM server, as ``IQMClient._base_url``.
+        get_token: Callable returning the ``Authorization`` header value, or ``None``.
+        user_agent: Value of the ``User-Agent`` header.
+        cache_dir: Directory for ``<calibration set id>.json`` files, or ``None`` to
+            cache in memory only.
+        pool_size: Maximum number of pooled connections.
+    """
+
+    def __init__(
+        self, base_url, get_token=None, user_agent=None, cache_dir=None, pool_size=8
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.get_token = get_token
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.num_requests = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if user_agent:
+            self.session.headers["User-Agent"] = user_agent
+
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_iqm_client(cls, client, **kwargs):
+        """Client for the server and credentials of an ``IQMClient``."""
+        return cls(
+            client._base_url,
+            get_token=client._get_bearer_token,
+            user_agent=client._signature,
+            **kwargs,
+        )
+
+    def _cache_file(self, calibration_set_id):
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / f"{calibration_set_id}.json"
+
+    def _download(self, calibration_set_id):
+        url = f"{self.base_url}/calibration/metrics/{calibration_set_id or 'latest'}"
+        headers = {"Authorization": self.get_token()} if self.get_token else {}
+        response = self.session.get(url, headers=headers)
+        response.raise_for_status()  # will raise an HTTPError if the response was not ok
+        with self._lock:
+            self.num_requests += 1
+        return response.json()
+
+    def _remember(self, calibration_set_id, data):
+        with self._lock:
+            self._cache[calibration_set_id] = data
+        path = self._cache_file(calibration_set_id)
+        if path is not None and not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # written next to the target and renamed, so that an interrupted write or
+            # a concurrent reader never sees a partial file
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+    def get(self, calibration_set_id=None):
+        """Metrics of a calibration set, or of the latest one if no id is given.
+
+        The latest calibration set is always downloaded, and cached under its id if
+        the response contains ``calibration_set_id``. The result is a copy, so
+        changing it leaves the cache untouched.
+        """
+        return copy.deepcopy(self._get(calibration_set_id))
+
+    def _get(self, calibration_set_id):
+        if calibration_set_id is None:
+            data = self._download(None)
+            if data.get("calibration_set_id"):
+                self._remember(str(data["calibration_set_id"]), data)
+            return data
+
+        calibration_set_id = str(calibration_set_id)
+        if calibration_set_id in self._cache:
+            return self._cache[calibration_set_id]
+        path = self._cache_file(calibration_set_id)
+        if path is not None and path.exists():
+            data = json.loads(path.read_text())
+        else:
+            data = self._download(calibration_set_id)
+        self._remember(calibration_set_id, data)
+        return data
+
+    def get_many(self, calibration_set_ids, max_workers=8):
+        """Copies of the metrics of several sets, downloading missing ones in parallel."""
+        calibration_set_ids = [str(c) for c in calibration_set_ids]
+        with ThreadPoolExecutor(max_workers) as executor:
+            list(executor.map(self._get, dict.fromkeys(calibration_set_ids)))
+        return [copy.deepcopy(self._cache[c]) for c in calibration_set_ids]
+
+
+class CalibrationStore:
+    """Calibration metric values by metric name, qubit and calibration set.
+
+    A key ``"QB1.t1_time"`` of ``data["metrics"]`` is stored as metric ``t1_time``
+    of qubit ``QB1``, the labels of ``plot_metrics``. Every metric keeps its own
+    columns of calibration set indices, qubit indices and values.
+    """
+
+    def __init__(self):
+        self.calibration_sets = []
+        self.qubits = []
+        self._set_index = {}
+        self._qubit_index = {}
+        self._columns = {}
+        self._tables = {}
+
+    @property
+    def metrics(self):
+        return list(self._columns)
+
+    def __contains__(self, calibration_set_id):
+        return str(calibration_set_id) in self._set_index
+
+    def add(self, calibration_set_id, data):
+        """Add the metrics of one calibration set, unless it is already stored."""
+        calibration_set_id = str(calibration_set_id)
+        if calibration_set_id in self._set_index:
+            return
+        s = self._set_index[calibration_set_id] = len(self.calibration_sets)
+        self.calibration_sets.append(calibration_set_id)
+
+        for key, metric_data in data["metrics"].items():
+            try:
+                value = float(metric_data["value"])
+            except (TypeError, ValueError):
+                continue
+            qubit = key.split(".")[0]
+            metric = key.rsplit(".", 1)[-1]
+            if qubit not in self._qubit_index:
+                self._qubit_index[qubit] = len(self.qubits)
+                self.qubits.append(qubit)
+            sets, qubits, values = self._columns.setdefault(metric, ([], [], []))
+            sets.append(s)
+            qubits.append(self._qubit_index[qubit])
+            values.append(value)
+            self._tables.pop(metric, None)
+
+    def table(self, metric):
+        """Values of shape ``(calibration sets, qubits)``, NaN where not measured."""
+        shape = (len(self.calibration_sets), len(self.qubits))
+        # rebuilt if sets or qubits were added by other metrics in the meantime
+        if metric not in self._tables or self._tables[metric].shape != shape:
+            sets, qubits, values = self._columns[metric]
+            table = np.full(shape, np.nan)
+            table[sets, qubits] = values
+            self._tables[metric] = table
+        return self._tables[metric]
+
+    def values(self, metric, calibration_set_id=None):
+        """Qubit labels and values of one calibration set, the last added by default."""
+        if metric not in self._columns:
+            return [], np.array([])
+        if calibration_set_id is None:
+            s = len(self.calibration_sets) - 1
+        else:
+            s = self._set_index[str(calibration_set_id)]
+        row = self.table(metric)[s]
+        measured = np.flatnonzero(~np.isnan(row))
+        return [self.qubits[q] for q in measured], row[measured]
+
+    def series(self, metric, qubit):
+        """Values of one qubit over all calibration sets, NaN where not measured."""
+        return self.table(metric)[:, self._qubit_index[qubit]]
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """``GET /calibration/metrics/<id>`` of a :func:`serve_calibration_sets` server."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, so the client can reuse connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        calibration_set_id = self.path.rstrip("/").rsplit("/", 1)[-1]
+        if calibration_set_id == "latest":
+            calibration_set_id = next(reversed(self.server.calibration_sets))
+        data = self.server.calibration_sets.get(calibration_set_id)
+        self.server.num_requests += 1
+        if data is None:
+            self.send_error(404)
+            return
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_calibration_sets(calibration_sets, latency=0.0):
+    """Serve ``{id: data}`` on a local HTTP server in a background thread.
+
+    Every response is delayed by ``latency`` seconds, like a remote server.
+
+    Returns the server and its base URL; call ``server.shutdown()`` when done.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+    server.calibration_sets = calibration_sets
+    server.num_requests = 0
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def synthetic_calibration_sets(num_sets, num_qubits, rng=None):
+    """Calibration sets shaped like the responses of the IQM server."""
+    rng = rng or np.random.default_rng()
+    qubits = [f"QB{q + 1}" for q in range(num_qubits)]
+    pairs = [f"{a}__{b}" for a, b in zip(qubits, qubits[1:])]
+    metrics = {
+        "t1_time": (qubits, 4e-5, 1e-5),
+        "t2_time": (qubits, 2e-5, 5e-6),
+        "t2_echo_time": (qubits, 3e-5, 5e-6),
+        "single_shot_readout_fidelity": (qubits, 0.95, 0.02),
+        "fidelity_1qb_gates_averaged": (qubits, 0.998, 0.001),
+        "fidelity_2qb_cliffords_averaged": (pairs, 0.96, 0.02),
+    }
+    calibration_sets = {}
+    for s in range(num_sets):
+        calibration_set_id = f"00000000-0000-0000-0000-{s:012d}"
+        data = {"calibration_set_id": calibration_set_id, "metrics": {}}
+        for metric, (labels, mean, std) in metrics.items():
+            for label, value in zip(labels, rng.normal(mean, std, len(labels))):
+                data["metrics"][f"{label}.{metric}"] = {"value": str(value), "unit": ""}
+        calibration_sets[calibration_set_id] = data
+    return calibration_sets
+
+
+def _notebook_series(base_url, calibration_set_ids, metric):
+    """One ``requests.get`` per calibration set and an ``endswith`` scan per metric."""
+    series = []
+    for calibration_set_id in calibration_set_ids:
+        response = requests.get(f"{base_url}/calibration/metrics/{calibration_set_id}")
+        response.raise_for_status()
+        data = response.json()
+        json.dumps(data, indent=4)
+        series.append(
+            [
+                float(metric_data["value"])
+                for key, metric_data in data["metrics"].items()
+                if key.endswith(metric)
+            ]
+        )
+    return np.array(series)
+
+
+def benchmark(num_sets, num_qubits, latency):
+    calibration_sets = synthetic_calibration_sets(
+        num_sets, num_qubits, np.random.default_rng(0)
+    )
+    server, base_url = serve_calibration_sets(calibration_sets, latency)
+    set_ids = list(calibration_sets)
+    metrics = ["t1_time", "t2_time", "t2_echo_time", "single_shot_readout_fidelity"]
+    try:
+        start = time.perf_counter()
+        reference = {m: _notebook_series(base_url, set_ids, m) for m in metrics}
+        print(
+            f"notebook functions: {time.perf_counter() - start:6.2f} s, "
+            f"{server.num_requests} requests for {len(metrics)} time series"
+        )
+
+        client = CalibrationClient(base_url)
+        store = CalibrationStore()
+        for label in ["client, cold cache", "client, warm cache"]:
+            server.num_requests = 0
+            start = time.perf_counter()
+            for set_id, data in zip(set_ids, client.get_many(set_ids)):
+                store.add(set_id, data)
+            tables = {m: store.table(m) for m in metrics}
+            print(
+                f"{label}: {time.perf_counter() - start:6.2f} s, "
+                f"{server.num_requests} requests"
+            )
+        # the tables have a column for every qubit and pair, NaN where not measured
+        measured = {m: tables[m][:, ~np.isnan(tables[m]).all(axis=0)] for m in metrics}
+        same = all(np.array_equal(measured[m], reference[m]) for m in metrics)
+        print(f"same values: {same}")
+
+        start = time.perf_counter()
+        for m in metrics:
+            store.values(m)
+        elapsed = (time.perf_counter() - start) / len(metrics)
+        print(f"plot data of the latest set: {elapsed * 1e3:.3f} ms per metric")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sets", type=int, default=300)
+    parser.add_argument("--qubits", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+    benchmark(args.sets, args.qubits, args.latency)
@@ -1,11 +1,14 @@
-import os
 import json
-import requests
-
 
 import matplotlib.pyplot as plt
+from calibration import CalibrationClient, CalibrationStore
 from iqm.iqm_client import IQMClient
 
+# one pooled, caching calibration client per IQM server and credentials, keyed on
+# (base URL, id of the IQMClient that owns the token getter); the cached client holds
+# the bound token getter and with it the IQMClient, so the id is not reused
+_calibration_clients = {}
+
 
 def get_calibration_data(
     client: IQMClient, calibration_set_id=None, filename: str = None
@@ -14,46 +17,51 @@ def get_calibration_data(
     Return the calibration data and figures of merit using IQMClient.
     Optionally you can input a calibration set id (UUID) to query historical results
     Optionally save the response to a json file, if filename is provided
+    Historical calibration sets are downloaded only once, see calibration.py
     """
-    headers = {"User-Agent": client._signature}
-    bearer_token = client._get_bearer_token()
-    headers["Authorization"] = bearer_token
-
-    if calibration_set_id:
-        url = os.path.join(client._base_url, "calibration/metrics/", calibration_set_id)
-    else:
-        url = os.path.join(client._base_url, "calibration/metrics/latest")
-
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()  # will raise an HTTPError if the response was not ok
-
-    data = response.json()
-    data_str = json.dumps(data, indent=4)
+    key = (client._base_url, id(client))
+    if key not in _calibration_clients:
+        _calibration_clients[key] = CalibrationClient.from_iqm_client(client)
+    data = _calibration_clients[key].get(calibration_set_id or None)
 
     if filename:
         with open(filename, "w") as f:
-            f.write(data_str)
+            json.dump(data, f, indent=4)
         print(f"Data saved to {filename}")
 
     return data
 
 
 def plot_metrics(
-    metric: str, title: str, ylabel: str, xlabel: str, data: dict, limits: list = []
+    metric: str,
+    title: str,
+    ylabel: str,
+    xlabel: str,
+    data: dict,
+    limits: list = [],
+    calibration_set_id=None,
 ):
-    # Initialize lists to store the values and labels
-    values = []
-    labels = []
+    """
+    Plot a metric of every qubit.
+    The data is either the response of get_calibration_data or a CalibrationStore,
+    where calibration_set_id selects the set (the last added one by default)
+    """
+    if isinstance(data, CalibrationStore):
+        labels, values = data.values(metric, calibration_set_id)
+    else:
+        # Initialize lists to store the values and labels
+        values = []
+        labels = []
 
-    # Iterate over the calibration data and collect values and labels based on the metric
-    for key, metric_data in data["metrics"].items():
-        if key.endswith(metric):
-            values.append(float(metric_data["value"]))
-            # Extract the qubit label from the key
-            labels.append(key.split(".")[0])
+        # Iterate over the calibration data and collect values and labels
+        for key, metric_data in data["metrics"].items():
+            if key.endswith(metric):
+                values.append(float(metric_data["value"]))
+                # Extract the qubit label from the key
+                labels.append(key.split(".")[0])
 
     # Check if values were found for the given metric
-    if not values:
+    if not len(values):
         return f"{metric} not in quality metrics set!"
 
     # Set the width and gap between the bars
@@ -0,0 +1,192 @@
+"""Exact depth-1 QAOA landscapes for MaxCut, evaluated on the whole grid at once.
+
+The landscape of ``QAOA.sample_cost_landscape`` simulates and samples one circuit per
+``(gamma, beta)`` grid point. For MaxCut with the X mixer and the ``|+>`` initial
+state the cost is diagonal, so this module computes the cost vector of all 2^n
+bitstrings once and evolves batches of grid points as NumPy statevectors:
+
+    |gamma, beta> = exp(i beta sum_k X_k) exp(-i gamma E) |+>^n
+
+with the energy ``E(z) = -cut(z)`` used by the ``qaoa`` package (``rx(-2 beta)``
+mixer). Expectation value and variance come from the same pass and are memoized by
+(graph, grid resolution, angle bounds), so ``plot_E`` and ``plot_Var`` share the
+work.
+
+Running this file compares the batched engine with a per-point circuit evaluation:
+
+    python landscape.py 10 12 14 16 18 20
+"""
+
+import hashlib
+import sys
+import time
+
+import networkx as nx
+import numpy as np
+
+_landscapes = {}
+
+
+def _edges(G):
+    """Edges of ``G`` as ``(i, j, weight)`` with integer qubit indices."""
+    try:
+        index = {node: int(node) for node in G.nodes}
+    except (TypeError, ValueError):
+        index = {node: i for i, node in enumerate(G.nodes)}
+    return [
+        (index[u], index[v], float(data.get("weight", 1.0)))
+        for u, v, data in G.edges(data=True)
+    ]
+
+
+def graph_hash(G):
+    """Hash of the weighted edge list of ``G``."""
+    edges = sorted((min(i, j), max(i, j), w) for i, j, w in _edges(G))
+    text = repr((G.number_of_nodes(), edges))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def cut_values(G, bitstrings):
+    """Cut weight of integer ``bitstrings``; bit ``i`` of a bitstring is node ``i``."""
+    z = np.asarray(bitstrings)
+    bit = z.dtype.type
+    cut = np.zeros(z.shape)
+    for i, j, w in _edges(G):
+        cut += w * (((z >> bit(i)) ^ (z >> bit(j))) & bit(1))
+    return cut
+
+
+def cost_diagonal(G):
+    """Energy ``-cut(z)`` of every bitstring ``z``; bit ``i`` of ``z`` is node ``i``."""
+    return -cut_values(G, np.arange(2 ** G.number_of_nodes(), dtype=np.int64))
+
+
+def _mixer_block(betas, num_qubits):
+    """``exp(i beta X)`` on ``num_qubits`` qubits for every beta, shape (B, 2^k, 2^k)."""
+    c, s = np.cos(betas), 1j * np.sin(betas)
+    single = np.stack([np.stack([c, s], -1), np.stack([s, c], -1)], -2)
+    block = np.ones((len(betas), 1, 1), dtype=complex)
+    for _ in range(num_qubits):
+        block = np.einsum("bij,bkl->bikjl", block, single).reshape(
+            len(betas), 2 * block.shape[1], 2 * block.shape[2]
+        )
+    return block
+
+
+def _apply_mixer(psi, betas, num_qubits, block_size=4):
+    """Apply ``exp(i beta X)`` to every qubit, ``block_size`` qubits per matmul."""
+    for q in range(0, num_qubits, block_size):
+        k = min(block_size, num_qubits - q)
+        block = _mixer_block(betas, k)
+        view = psi.reshape(len(betas), -1, 2**k, 2**q)
+        psi = np.matmul(block[:, None], view)
+    return psi.reshape(len(betas), -1)
+
+
+def evaluate_grid(energies, gammas, betas, max_bytes=2**28):
+    """Expectation value and variance of ``energies`` on a ``(beta, gamma)`` grid.
+
+    The grid points are evolved in chunks whose statevectors take at most
+    ``max_bytes`` of memory.
+    """
+    num_qubits = int(np.log2(len(energies)))
+    levels, inverse = np.unique(energies, return_inverse=True)
+    gamma_grid, beta_grid = np.meshgrid(gammas, betas)
+    gamma_grid, beta_grid = gamma_grid.ravel(), beta_grid.ravel()
+    chunk = max(1, max_bytes // (16 * len(energies)))
+
+    exp = np.empty(len(gamma_grid))
+    second = np.empty(len(gamma_grid))
+    for start in range(0, len(gamma_grid), chunk):
+        g = gamma_grid[start : start + chunk]
+        b = beta_grid[start : start + chunk]
+        # few distinct energies: evaluate the phases once per level
+        phases = np.exp(-1j * np.outer(g, levels)) / np.sqrt(len(energies))
+        psi = _apply_mixer(phases[:, inverse], b, num_qubits)
+        probabilities = psi.real**2 + psi.imag**2
+        exp[start : start + chunk] = probabilities @ energies
+        second[start : start + chunk] = probabilities @ energies**2
+
+    shape = (len(betas), len(gammas))
+    return exp.reshape(shape), (second - exp**2).reshape(shape)
+
+
+def exact_landscape(G, angles):
+    """Memoized ``(expectation, variance)`` landscape of MaxCut on ``G``.
+
+    ``angles`` has the format of ``QAOA.sample_cost_landscape``, e.g.
+    ``{"gamma": [0, 2 * np.pi, 20], "beta": [0, 2 * np.pi, 20]}``.
+    """
+    key = (graph_hash(G), tuple(angles["gamma"]), tuple(angles["beta"]))
+    if key not in _landscapes:
+        gammas = np.linspace(*angles["gamma"][:2], angles["gamma"][2], endpoint=False)
+        betas = np.linspace(*angles["beta"][:2], angles["beta"][2], endpoint=False)
+        _landscapes[key] = evaluate_grid(cost_diagonal(G), gammas, betas)
+    return _landscapes[key]
+
+
+def qaoa_landscape(qaoa_instance, angles):
+    """``exact_landscape`` of the problem graph of ``qaoa_instance``.
+
+    Raises ``ValueError`` unless ``qaoa_instance`` combines ``MaxCut`` with the ``X``
+    mixer and the ``Plus`` initial state, the only ansatz this module evaluates.
+    """
+    from qaoa.initialstates import Plus
+    from qaoa.mixers import X
+    from qaoa.problems import MaxCut
+
+    # exact types: subclasses such as MaxCutOrbit change the parametrization
+    supported = (
+        type(qaoa_instance.problem) is MaxCut
+        and type(qaoa_instance.mixer) is X
+        and type(qaoa_instance.initialstate) is Plus
+    )
+    if not supported:
+        raise ValueError(
+            "exact landscapes need MaxCut with the X mixer and the Plus initial state, "
+            f"got {type(qaoa_instance.problem).__name__}, "
+            f"{type(qaoa_instance.mixer).__name__} and "
+            f"{type(qaoa_instance.initialstate).__name__}"
+        )
+    return exact_landscape(qaoa_instance.problem.G, angles)
+
+
+def _circuit_landscape(G, gammas, betas):
+    """Reference path: one statevector simulation per grid point."""
+    from qiskit import QuantumCircuit
+    from qiskit.quantum_info import Statevector
+
+    n = G.number_of_nodes()
+    energies = cost_diagonal(G)
+    exp = np.empty((len(betas), len(gammas)))
+    for bi, beta in enumerate(betas):
+        for gi, gamma in enumerate(gammas):
+            qc = QuantumCircuit(n)
+            qc.h(range(n))
+            for i, j, w in _edges(G):
+                qc.rzz(w * gamma, i, j)
+            qc.rx(-2 * beta, range(n))
+            exp[bi, gi] = Statevector(qc).probabilities() @ energies
+    return exp
+
+
+def benchmark(sizes, resolution=10, circuit_limit=16):
+    angles = {"gamma": [0, np.pi, resolution], "beta": [0, np.pi, resolution]}
+    gammas = np.linspace(0, np.pi, resolution, endpoint=False)
+    for n in sizes:
+        G = nx.barabasi_albert_graph(n, 4, seed=0)
+        start = time.perf_counter()
+        exp, _ = exact_landscape(G, angles)
+        batched = time.perf_counter() - start
+        line = f"n = {n:2d}: batched {batched:8.3f} s"
+        if n <= circuit_limit:
+            start = time.perf_counter()
+            reference = _circuit_landscape(G, gammas, gammas)
+            per_point = time.perf_counter() - start
+            error = np.max(np.abs(reference - exp))
+            line += f", per point {per_point:8.3f} s, max. deviation {error:.1e}"
+        print(line)
+
+
+if __name__ == "__main__":
+    benchmark([int(n) for n in sys.argv[1:]] or [10, 12, 14, 16])
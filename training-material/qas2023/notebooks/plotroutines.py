@@ -2,13 +2,18 @@ import matplotlib.pyplot as pl
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from matplotlib.ticker import MaxNLocator
 
+import weakref
+
 import numpy as np
 
 from qaoa import QAOA
 from qaoa.mixers.constrained_mixer import Constrained
+from qaoa.problems import MaxCut
 
 from qaoa.util import Statistic
 
+from landscape import cut_values, qaoa_landscape
+
 def __plot_landscape(A, extent, fig):
     if not fig:
         fig = pl.figure(figsize=(6, 6), dpi=80, facecolor="w", edgecolor="k")
@@ -22,26 +27,38 @@ def __plot_landscape(A, extent, fig):
     _ = pl.colorbar(im, cax=cax)
 
 
-def plot_E(qaoa_instance, fig=None):
-    angles = qaoa_instance.landscape_p1_angles
-    extent = [
+def __extent(angles):
+    return [
         angles["gamma"][0],
         angles["gamma"][1],
         angles["beta"][0],
         angles["beta"][1],
     ]
-    return __plot_landscape(qaoa_instance.exp_landscape(), extent, fig=fig)
 
 
-def plot_Var(qaoa_instance, fig=None):
-    angles = qaoa_instance.landscape_p1_angles
-    extent = [
-        angles["gamma"][0],
-        angles["gamma"][1],
-        angles["beta"][0],
-        angles["beta"][1],
-    ]
-    return __plot_landscape(qaoa_instance.var_landscape(), extent, fig=fig)
+def plot_E(qaoa_instance, fig=None, exact=False, angles=None):
+    """
+    plot the depth-1 landscape sampled by sample_cost_landscape or, if exact is set,
+    the exact MaxCut landscape of the problem graph, see landscape.py
+    """
+    angles = angles or qaoa_instance.landscape_p1_angles
+    if exact:
+        E, _ = qaoa_landscape(qaoa_instance, angles)
+    else:
+        E = qaoa_instance.exp_landscape()
+    return __plot_landscape(E, __extent(angles), fig=fig)
+
+
+def plot_Var(qaoa_instance, fig=None, exact=False, angles=None):
+    """
+    same as plot_E for the variance, the exact landscape is computed only once for both
+    """
+    angles = angles or qaoa_instance.landscape_p1_angles
+    if exact:
+        _, Var = qaoa_landscape(qaoa_instance, angles)
+    else:
+        Var = qaoa_instance.var_landscape()
+    return __plot_landscape(Var, __extent(angles), fig=fig)
 
 
 def plot_ApproximationRatio(
@@ -103,28 +120,86 @@ def plot_successprob(
     ax.xaxis.set_major_locator(MaxNLocator(integer=True))
 
 
-def __apprrat_successprob(qaoa_instance, depth, shots=10**4):
+# sampled histograms per QAOA instance, keyed by (depth, shots), and memoized
+# (isFeasible, cost) tables per problem, so that plot_ApproximationRatio and
+# plot_successprob share one sampling run and evaluate every bitstring only once
+__histograms = weakref.WeakKeyDictionary()
+__cost_tables = weakref.WeakKeyDictionary()
+
+
+def __packed_hist(qaoa_instance, depth, shots):
     """
-    approximation ratio post processed with feasibility and success probability
+    histogram of the best angles at the given depth as arrays of bitstrings packed into
+    uint64 (bit i is qubit i) and counts, sampled again only if the angles changed
     """
-    hist = qaoa_instance.hist(
-        qaoa_instance.optimization_results[depth].get_best_angles(), shots=shots
+    angles = np.asarray(
+        qaoa_instance.optimization_results[depth].get_best_angles(), dtype=float
     )
+    store = __histograms.setdefault(qaoa_instance, {})
+    entry = store.get((depth, shots))
+    if entry is None or not np.array_equal(entry[0], angles):
+        hist = qaoa_instance.hist(angles, shots=shots)
+        num_bits = len(next(iter(hist)))
+        if num_bits > 64:
+            raise ValueError("bitstrings with more than 64 bits cannot be packed")
+        packed = np.fromiter((int(key, 2) for key in hist), np.uint64, len(hist))
+        counts = np.fromiter(hist.values(), np.int64, len(hist))
+        entry = (angles, packed, counts, num_bits)
+        store[(depth, shots)] = entry
+    return entry[1:]
+
+
+def __feasible_cost(problem, packed, num_bits):
+    """
+    problem.isFeasible and problem.cost of packed bitstrings; the problem is only
+    called for bitstrings that have not been seen before, MaxCut is evaluated directly
+    on the packed bitstrings
+    """
+    if type(problem) is MaxCut and not getattr(problem, "fix_one_node", False):
+        return np.ones(len(packed), bool), cut_values(problem.G, packed)
 
-    counts = 0
-
-    stat = Statistic(cvar=qaoa_instance.cvar)
+    keys, feasible, cost = __cost_tables.get(
+        problem, (np.empty(0, np.uint64), np.empty(0, bool), np.empty(0))
+    )
+    index = np.minimum(np.searchsorted(keys, packed), max(len(keys) - 1, 0))
+    known = keys[index] == packed if len(keys) else np.zeros(len(packed), bool)
 
-    for key in hist:
+    new = np.unique(packed[~known])
+    if len(new):
         # Qiskit uses big endian encoding, cost function uses litle endian encoding.
         # Therefore the string is reversed before passing it to the cost function.
-        string = key[::-1]
-        if qaoa_instance.problem.isFeasible(string):
-            cost = qaoa_instance.problem.cost(string)
-            counts += hist[key]
-            stat.add_sample(cost, hist[key])
+        strings = [format(int(x), "0%db" % num_bits)[::-1] for x in new]
+        new_feasible = np.array([problem.isFeasible(s) for s in strings], dtype=bool)
+        new_cost = np.array(
+            [problem.cost(s) if f else np.nan for s, f in zip(strings, new_feasible)]
+        )
+        keys = np.concatenate([keys, new])
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        feasible = np.concatenate([feasible, new_feasible])[order]
+        cost = np.concatenate([cost, new_cost])[order]
+        __cost_tables[problem] = (keys, feasible, cost)
+        index = np.searchsorted(keys, packed)
+
+    return feasible[index], cost[index]
+
+
+def __apprrat_successprob(qaoa_instance, depth, shots=10**4):
+    """
+    approximation ratio post processed with feasibility and success probability
+    """
+    packed, counts, num_bits = __packed_hist(qaoa_instance, depth, shots)
+    feasible, cost = __feasible_cost(qaoa_instance.problem, packed, num_bits)
+
+    # one sample per distinct cost value instead of one per bitstring
+    values, inverse = np.unique(cost[feasible], return_inverse=True)
+    weights = np.bincount(inverse, weights=counts[feasible], minlength=len(values))
+
+    stat = Statistic(cvar=qaoa_instance.cvar)
+    for value, weight in zip(values, weights):
+        stat.add_sample(value, int(weight))
 
-    return -stat.get_CVaR(), counts / shots
+    return -stat.get_CVaR(), counts[feasible].sum() / shots
 
 
 def plot_angles(qaoa_instance, depth, label, style="", fig=None):
@@ -0,0 +1,280 @@
+"""Canonical quantum amplitude estimation (QAE) for the option pricing tutorial.
+
+``AECircuit`` is the circuit of ``option_pricing.ipynb``: Hadamards on the ancillas,
+the state preparation ``A``, controlled powers ``Q^(2^j)`` of the Grover operator and
+an inverse QFT on the ancillas. On top of it this module provides
+
+- controlled Grover powers ``Q^(2^j)`` as single unitary gates, squared from the
+  matrix of ``Q`` (:class:`GroverPowers`). The simulator applies one matrix per
+  power instead of ``2^j`` copies of ``Q``, and a sweep over the number of
+  ancillas shares the powers between its circuits,
+- vectorized post-processing that merges duplicate estimates with ``np.unique`` and
+  ``np.bincount``,
+- :func:`estimate_ae_sweep`, which builds the circuits of all ancilla counts from
+  the same powers and submits them to the sampler as one batch,
+- a classical Monte Carlo baseline on the same discretized log-normal payoff.
+
+Running this file compares the precision and wall time of both:
+
+    python ae_circuit.py --max-ancillas 7 --shots 100
+"""
+
+import argparse
+import time
+
+import numpy as np
+from qiskit import AncillaRegister, ClassicalRegister, QuantumCircuit, QuantumRegister
+from qiskit.circuit.library import (
+    QFT,
+    GroverOperator,
+    LinearAmplitudeFunction,
+    UnitaryGate,
+)
+from qiskit.primitives import StatevectorSampler as Sampler
+from qiskit.quantum_info import Operator
+
+
+def grover_operator(state_preparation_circuit, objective_qubit):
+    """Grover operator ``Q`` that marks ``|1>`` of the objective qubit."""
+    oracle = QuantumCircuit(
+        max(
+            state_preparation_circuit.num_qubits - state_preparation_circuit.num_ancillas,
+            1,
+        )
+    )
+    oracle.h(objective_qubit)
+    oracle.x(objective_qubit)
+    oracle.h(objective_qubit)
+    return GroverOperator(oracle, state_preparation_circuit)
+
+
+class GroverPowers:
+    """Controlled powers ``Q^(2^j)`` of the Grover operator of one circuit.
+
+    ``Q^(2^j)`` is the square of ``Q^(2^(j-1))``, so every power costs one matrix
+    product. The gate of a power acts on the control qubit first and then on the
+    state qubits.
+    """
+
+    def __init__(self, state_preparation_circuit, objective_qubit):
+        Q = grover_operator(state_preparation_circuit, objective_qubit)
+        self._matrices = [Operator(Q).data]
+        self._gates = {}
+
+    def __call__(self, j):
+        """Controlled ``Q^(2^j)``."""
+        if j not in self._gates:
+            while len(self._matrices) <= j:
+                self._matrices.append(self._matrices[-1] @ self._matrices[-1])
+            power = self._matrices[j]
+            # the control is the least significant qubit of the gate
+            controlled = np.kron(power, np.diag([0, 1])) + np.kron(
+                np.eye(len(power)), np.diag([1, 0])
+            )
+            self._gates[j] = UnitaryGate(
+                controlled, label=f"$cQ^{{{2**j}}}$", check_input=False
+            )
+        return self._gates[j]
+
+
+class AECircuit(QuantumCircuit):
+    def __init__(
+        self,
+        state_preparation_circuit,
+        num_ancilla_qubits,
+        objective_qubit,
+        grover_powers=None,
+    ):
+        self.state_preparation_circuit = (
+            state_preparation_circuit  # The cirtuit implementing operator A
+        )
+        self.num_ancilla_qubits = (
+            num_ancilla_qubits  # Number of ancilla qubits (m in IQAE paper)
+        )
+        self.num_state_qubits = (
+            state_preparation_circuit.num_qubits
+        )  # Number of qubits in circuit A (n+1 in the IQAE paper)
+        # Index of the objective qubit within the circuit A
+        # (0<=objective_qubit<=num_state_qubits)
+        self.objective_qubit = objective_qubit
+
+        # Initialize circuit
+        ancilla_register = AncillaRegister(self.num_ancilla_qubits, name="ancilla")
+        state_register = QuantumRegister(self.num_state_qubits, name="state")
+        classical_register = ClassicalRegister(self.num_ancilla_qubits, name="creg")
+        super().__init__(ancilla_register, state_register, classical_register)
+
+        # Hadamard gates on the ancilla qubits
+        for j in range(self.num_ancilla_qubits):
+            self.h(ancilla_register[j])
+
+        # Circuit A on the state and objective qubits
+        A_gate = self.state_preparation_circuit.to_gate(label="$A$")
+        self.append(A_gate, state_register[:])
+
+        self.barrier()
+
+        # Powers of Q, can be shared between circuits with different numbers of
+        # ancillas
+        if grover_powers is None:
+            grover_powers = GroverPowers(
+                self.state_preparation_circuit, self.objective_qubit
+            )
+        for j in range(num_ancilla_qubits):
+            Qj = grover_powers(j)
+            # Apply the controlled Q^{2j} gate on state and objective qubits,
+            # controlled by the j-th ancilla qubit
+            self.append(
+                Qj,
+                [ancilla_register[self.num_ancilla_qubits - j - 1]] + state_register[:],
+            )
+
+        self.barrier()
+
+        # Inverse QFT
+        QFT_gate = QFT(
+            num_qubits=self.num_ancilla_qubits, inverse=True, do_swaps=False
+        ).to_gate(label=r"$QFT^\dagger$")
+        self.compose(QFT_gate, ancilla_register, inplace=True)
+
+        self.barrier()
+
+        # Measure the ancilla qubits
+        self.measure(ancilla_register, classical_register)
+
+    def groverOp(self, state_preparation_circuit, objective_qubit):
+        return grover_operator(state_preparation_circuit, objective_qubit)
+
+
+def qae_post_processing(counts, num_ancilla_qubits):
+    """Merge the measured grid points into distinct estimates ``sin^2(q pi / M)``.
+
+    Returns the estimates and their probabilities, sorted by estimate.
+    """
+    M = 2**num_ancilla_qubits  # Number of grid points = 2^num_ancilla_qubits
+    q = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+    estimates = np.round(np.sin(q * np.pi / M) ** 2, 15)
+
+    # Combine duplicates (q and M - q give the same estimate)
+    estimates, inverse = np.unique(estimates, return_inverse=True)
+    probabilities = np.bincount(inverse, weights=weights, minlength=len(estimates))
+    return estimates, probabilities / probabilities.sum()
+
+
+def estimate_ae_sweep(
+    state_preparation_circuit, objective_qubit, ancillas_range, shots=100, sampler=None
+):
+    """Most likely QAE estimate for every number of ancillas in ``ancillas_range``.
+
+    All circuits share the Grover powers and are submitted to the sampler in a
+    single ``run`` call.
+    """
+    powers = GroverPowers(state_preparation_circuit, objective_qubit)
+    circuits = [
+        AECircuit(state_preparation_circuit, m, objective_qubit, powers)
+        for m in ancillas_range
+    ]
+    result = (sampler or Sampler()).run(circuits, shots=shots).result()
+    modes = []
+    for m, pub_result in zip(ancillas_range, result):
+        estimates, probabilities = qae_post_processing(
+            pub_result.data.creg.get_int_counts(), m
+        )
+        modes.append(estimates[np.argmax(probabilities)])
+    return np.array(modes)
+
+
+def european_call(
+    num_uncertainty_qubits=3,
+    S=2.0,
+    vol=0.4,
+    r=0.05,
+    T=40 / 365,
+    strike_price=1.896,
+    c_approx=0.25,
+):
+    """State preparation and payoff objective of the tutorial.
+
+    Returns ``(circuit, objective_qubit, objective, uncertainty_model, payoff)``;
+    ``payoff`` is evaluated on the grid of the uncertainty model.
+    """
+    from qiskit_finance.circuit.library import LogNormalDistribution
+
+    mu = (r - 0.5 * vol**2) * T + np.log(S)
+    sigma = vol * np.sqrt(T)
+    mean = np.exp(mu + sigma**2 / 2)
+    variance = (np.exp(sigma**2) - 1) * np.exp(2 * mu + sigma**2)
+    stddev = np.sqrt(variance)
+    low = np.maximum(0, mean - 3 * stddev)
+    high = mean + 3 * stddev
+
+    uncertainty_model = LogNormalDistribution(
+        num_uncertainty_qubits, mu=mu, sigma=sigma**2, bounds=(low, high)
+    )
+    objective = LinearAmplitudeFunction(
+        num_uncertainty_qubits,
+        [0, 1],
+        [0, 0],
+        domain=(low, high),
+        image=(0, high - strike_price),
+        breakpoints=[low, strike_price],
+        rescaling_factor=c_approx,
+    )
+    num_qubits = objective.num_qubits
+    circuit = QuantumCircuit(
+        QuantumRegister(num_uncertainty_qubits, "s"),
+        QuantumRegister(1, "q"),
+        AncillaRegister(num_qubits - num_uncertainty_qubits - 1, "a"),
+    )
+    circuit.append(uncertainty_model, range(num_uncertainty_qubits))
+    circuit.append(objective, range(num_qubits))
+    circuit = circuit.decompose(reps=6)
+    payoff = np.maximum(0, np.asarray(uncertainty_model.values) - strike_price)
+    return circuit, num_uncertainty_qubits, objective, uncertainty_model, payoff
+
+
+def classical_mc(uncertainty_model, payoff, num_samples, rng=None):
+    """Monte Carlo estimate of the expected payoff from ``num_samples`` samples."""
+    rng = rng or np.random.default_rng()
+    samples = rng.choice(
+        len(payoff), size=num_samples, p=np.asarray(uncertainty_model.probabilities)
+    )
+    return payoff[samples].mean()
+
+
+def benchmark(ancillas_range, shots, repeats=20):
+    circuit, objective_qubit, objective, model, payoff = european_call()
+    exact = np.dot(model.probabilities, payoff)
+    print(f"exact expected payoff (discretized): {exact:.4f}")
+
+    start = time.perf_counter()
+    modes = estimate_ae_sweep(circuit, objective_qubit, ancillas_range, shots=shots)
+    elapsed = time.perf_counter() - start
+    print(f"QAE sweep m = {list(ancillas_range)}: {elapsed:.2f} s in one submission")
+    for m, mode in zip(ancillas_range, modes):
+        # every m uses shots * (2^m - 1) applications of Q
+        error = abs(objective.post_processing(mode) - exact)
+        print(f"  m = {m}: error {error:.2e}, {shots * (2**m - 1):8d} Q calls")
+
+    rng = np.random.default_rng(0)
+    for m in ancillas_range:
+        num_samples = shots * 2**m
+        start = time.perf_counter()
+        errors = [
+            abs(classical_mc(model, payoff, num_samples, rng) - exact)
+            for _ in range(repeats)
+        ]
+        elapsed = (time.perf_counter() - start) / repeats
+        print(
+            f"  MC {num_samples:8d} samples: mean error {np.mean(errors):.2e}, "
+            f"{elapsed * 1e3:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-ancillas", type=int, default=7)
+    parser.add_argument("--shots", type=int, default=100)
+    args = parser.parse_args()
+    benchmark(range(1, args.max_ancillas + 1), args.shots)
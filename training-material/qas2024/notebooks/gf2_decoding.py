@@ -0,0 +1,273 @@
+"""Bit-packed GF(2) syndrome decoding with precomputed lookup tables.
+
+The helpers of ``decoding_excercise.ipynb`` compute ``H @ e mod 2`` with dense integer
+arrays for every candidate and enumerate candidates with ``itertools.product``. Here
+error vectors and syndromes of codes with up to 64 bits are packed into ``uint64``
+integers, bit ``i`` holding entry ``i`` of the vector. Syndrome bit ``j`` is then the
+parity of ``popcount(H[j] & e)``, computed for whole arrays of errors at once.
+
+:class:`LookupDecoder` stores one minimum-weight error (coset leader) per syndrome
+in a table of size ``2**m`` for ``m`` checks, so decoding a batch of syndromes is a
+single NumPy indexing operation. Tables can be cached on disk, keyed by ``H``.
+
+Usage:
+    decoder = LookupDecoder(hamming_7_4())
+    errors = decoder.decode_batch(syndromes)  # (N, m) bits -> (N, n) bits
+    packed_errors = decoder.decode_packed(packed_syndromes)
+
+Running this file compares the lookup decoder with the greedy decoder of the
+exercise:
+
+    python gf2_decoding.py --shots 1000000 --p 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+from itertools import combinations
+
+import numpy as np
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def hamming_7_4() -> np.ndarray:
+    """Parity-check matrix of the [7,4] Hamming code used in the exercise."""
+    return np.array(
+        [
+            [1, 1, 0, 1, 1, 0, 0],
+            [1, 0, 1, 1, 0, 1, 0],
+            [0, 1, 1, 1, 0, 0, 1],
+        ]
+    )
+
+
+def steane() -> np.ndarray:
+    """Parity checks of the Steane code on symplectic errors ``(x | z)``.
+
+    The X-type checks detect Z errors and the Z-type checks detect X errors, both
+    with the Hamming matrix.
+    """
+    H = hamming_7_4()
+    zeros = np.zeros_like(H)
+    return np.block([[H, zeros], [zeros, H]])
+
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    """Pack the last axis of a 0/1 array (at most 64 entries) into ``uint64``."""
+    bits = np.asarray(bits, dtype=np.uint64)
+    if bits.shape[-1] > 64:
+        raise ValueError("At most 64 bits can be packed into one integer")
+    return bits @ (np.uint64(1) << np.arange(bits.shape[-1], dtype=np.uint64))
+
+
+def unpack_bits(packed: np.ndarray, num_bits: int) -> np.ndarray:
+    """Inverse of :func:`pack_bits`."""
+    shifts = np.arange(num_bits, dtype=np.uint64)
+    return ((np.asarray(packed, dtype=np.uint64)[..., None] >> shifts) & 1).astype(
+        np.uint8
+    )
+
+
+def popcount(packed: np.ndarray) -> np.ndarray:
+    """Number of set bits of every ``uint64`` entry."""
+    packed = np.ascontiguousarray(packed, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(packed)
+    return _POPCOUNT8[packed.view(np.uint8)].reshape(*packed.shape, 8).sum(-1)
+
+
+def syndromes(H_packed: np.ndarray, errors: np.ndarray) -> np.ndarray:
+    """Packed syndromes ``H @ e mod 2`` of packed errors, for packed rows of ``H``."""
+    errors = np.asarray(errors, dtype=np.uint64)
+    result = np.zeros(errors.shape, dtype=np.uint64)
+    for j, row in enumerate(H_packed):
+        parity = popcount(errors & row) & 1
+        result |= parity.astype(np.uint64) << np.uint64(j)
+    return result
+
+
+def gf2_rank(H_packed: np.ndarray) -> int:
+    """Rank over GF(2) of a matrix given as packed rows."""
+    pivots = {}  # leading bit -> reduced row
+    for row in np.asarray(H_packed, dtype=np.uint64).tolist():
+        while row:
+            lead = row.bit_length() - 1
+            if lead not in pivots:
+                pivots[lead] = row
+                break
+            row ^= pivots[lead]
+    return len(pivots)
+
+
+class LookupDecoder:
+    """Minimum-weight decoder with a syndrome -> error lookup table.
+
+    Args:
+        H: Parity-check matrix with at most 64 columns. The table has ``2**m``
+            entries for ``m`` rows, so ``m`` should stay below about 30.
+        cache_dir: Directory of an on-disk table cache. By default the table is
+            built in memory only.
+    """
+
+    def __init__(self, H: np.ndarray, cache_dir: str | None = None):
+        self.H = np.asarray(H, dtype=np.uint8) % 2
+        self.num_checks, self.num_bits = self.H.shape
+        self.H_packed = pack_bits(self.H)
+        self.cache_dir = cache_dir
+        self.table = self._load() if cache_dir else None
+        if self.table is None:
+            self.table = self._build()
+            if cache_dir:
+                self._store()
+        # the coset leader of a nonzero syndrome is never the zero error, so the
+        # zero entries mark the syndromes outside the column space of H
+        self.reachable = self.table != 0
+        self.reachable[0] = True
+
+    @property
+    def key(self) -> str:
+        digest = hashlib.sha256(self.H.tobytes() + str(self.H.shape).encode())
+        return digest.hexdigest()[:32]
+
+    def _path(self) -> str:
+        return os.path.join(self.cache_dir, self.key + ".npy")
+
+    def _load(self) -> np.ndarray | None:
+        if not os.path.exists(self._path()):
+            return None
+        return np.load(self._path())
+
+    def _store(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, self.table)
+            os.replace(tmp, self._path())
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _build(self) -> np.ndarray:
+        """Fill the table with errors of increasing weight until every reachable
+        syndrome has its coset leader."""
+        size = 2**self.num_checks
+        table = np.zeros(size, dtype=np.uint64)
+        found = np.zeros(size, dtype=bool)
+        found[0] = True
+        reachable = 2 ** gf2_rank(self.H_packed)
+        for weight in range(1, self.num_bits + 1):
+            if found.sum() >= reachable:
+                break
+            positions = np.array(
+                list(combinations(range(self.num_bits), weight)), dtype=np.uint64
+            )
+            errors = np.bitwise_or.reduce(np.uint64(1) << positions, axis=1)
+            s = syndromes(self.H_packed, errors)
+            # the first error of each new syndrome, in lexicographic order
+            s, first = np.unique(s, return_index=True)
+            new = ~found[s]
+            table[s[new]] = errors[first[new]]
+            found[s[new]] = True
+        return table
+
+    def syndrome(self, errors: np.ndarray) -> np.ndarray:
+        """Packed syndromes of packed errors."""
+        return syndromes(self.H_packed, errors)
+
+    def decode_batch(self, s: np.ndarray) -> np.ndarray:
+        """Minimum-weight errors for syndromes given as 0/1 rows of shape ``(N, m)``.
+
+        Returns the errors as 0/1 rows of shape ``(N, n)``.
+        """
+        s = np.asarray(s)
+        if s.shape[-1] != self.num_checks:
+            raise ValueError(
+                f"Syndrome rows have {s.shape[-1]} bits, expected {self.num_checks}"
+            )
+        return unpack_bits(self.decode_packed(pack_bits(s)), self.num_bits)
+
+    def decode_packed(self, s: np.ndarray) -> np.ndarray:
+        """Packed minimum-weight errors for packed syndromes of any shape.
+
+        Raises ``ValueError`` for syndromes that no error produces, i.e. outside the
+        column space of ``H``.
+        """
+        index = np.asarray(s, dtype=np.uint64).astype(np.intp)
+        unreachable = ~self.reachable[index]
+        if unreachable.any():
+            raise ValueError(
+                f"{np.count_nonzero(unreachable)} syndromes are not produced by any "
+                f"error, e.g. {int(index[unreachable][0])}"
+            )
+        return self.table[index]
+
+    def decode(self, s: np.ndarray) -> np.ndarray:
+        """Decode a single syndrome given as a 0/1 vector."""
+        return self.decode_batch(np.asarray(s)[None])[0]
+
+
+def compute_syndrome(H, e):
+    return np.mod(H @ e, 2)
+
+
+def greedy_decoder(H, s, max_iter=10):
+    """Greedy decoder of the exercise, kept for comparison."""
+    steps = 0
+    n = H.shape[1]
+    e = np.zeros(n, dtype=int)
+    for _ in range(max_iter):
+        steps += 1
+        syndrome = compute_syndrome(H, e)
+        if np.array_equal(syndrome, s):
+            break
+        flip_index = np.random.choice(np.where(syndrome != s)[0])
+        e[flip_index] ^= 1
+    return e, steps
+
+
+def benchmark(H: np.ndarray, shots: int, p: float, greedy_shots: int = 10_000):
+    """Decode random i.i.d. errors with the lookup table and the greedy decoder."""
+    rng = np.random.default_rng(0)
+    errors = (rng.random((shots, H.shape[1])) < p).astype(np.uint8)
+
+    start = time.perf_counter()
+    decoder = LookupDecoder(H, cache_dir=None)
+    build = time.perf_counter() - start
+
+    packed = pack_bits(errors)
+    start = time.perf_counter()
+    s = decoder.syndrome(packed)
+    corrections = decoder.decode_packed(s)
+    lookup = time.perf_counter() - start
+    lookup_ok = np.mean(corrections == packed)
+
+    np.random.seed(0)
+    start = time.perf_counter()
+    greedy_ok = 0
+    for e in errors[:greedy_shots]:
+        decoded, _ = greedy_decoder(H, compute_syndrome(H, e))
+        greedy_ok += np.array_equal(decoded, e)
+    greedy = (time.perf_counter() - start) * shots / min(greedy_shots, shots)
+
+    print(f"{H.shape[0]}x{H.shape[1]} checks, {shots} shots, p = {p}")
+    print(f"  table build   {build * 1e3:8.2f} ms")
+    print(f"  lookup        {lookup:8.3f} s, {lookup_ok:.4f} exact")
+    print(
+        f"  greedy (est.) {greedy:8.3f} s, "
+        f"{greedy_ok / min(greedy_shots, shots):.4f} exact"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shots", type=int, default=10**6)
+    parser.add_argument("--p", type=float, default=0.05)
+    args = parser.parse_args()
+    for H in (hamming_7_4(), steane()):
+        benchmark(H, args.shots, args.p)
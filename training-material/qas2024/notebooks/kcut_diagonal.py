@@ -0,0 +1,369 @@
+"""Cost diagonal and statevector fast path for k-colouring ``GraphProblem`` subclasses.
+
+``Max4Cut``, ``Max3CutFullH`` and ``Max3Cut`` of ``qaoa_exercise.ipynb`` encode every
+node with ``N_qubits_per_node`` qubits and map the bitstring of a node to a colour
+with ``bitstring_to_color``. The phase separator is one edge circuit per edge, and
+the cost of a sample is evaluated bitstring by bitstring. Since all edge circuits
+are diagonal, this module
+
+* computes the weighted cut of all ``2^N`` basis states at once
+  (:func:`cost_diagonal`), with one vectorized pass per edge that reads the colour
+  of both nodes from a lookup table indexed by the bits of the node, and caches the
+  result on the problem instance,
+* evolves depth-``p`` QAOA states with the X mixer from ``|+>`` as NumPy
+  statevectors (:func:`qaoa_states`): the phase separator multiplies the state by
+  ``exp(i gamma cut)``, the mixer ``rx(-2 beta)`` is applied four qubits per
+  matrix product,
+* optimizes layer by layer with COBYLA from the best point of a ``(gamma, beta)``
+  grid at depth 1 and from the interpolation of the previous optimum at higher
+  depths (:func:`optimize`).
+
+The edge circuits of the notebook apply the phase ``exp(-i theta)`` to equally
+coloured nodes, which is ``exp(i theta cut)`` up to a global phase;
+:func:`check_edge_circuit` verifies that an implementation of
+``create_edge_circuit`` does exactly this. Energies follow the ``qaoa`` package:
+the energy of a bitstring is minus its cut, so ``-energy / max cut`` is the
+approximation ratio.
+
+Usage:
+    cut = cost_diagonal(max4cut)
+    results = optimize(max4cut, depth=5)
+    ratios = [-energy / cut.max() for _, energy in results]
+
+Running this file optimizes the 8-node example of the notebook and larger random
+graphs, and compares with the circuit simulation of the ``qaoa`` package:
+
+    python kcut_diagonal.py --nodes 8 10 --depth 5
+"""
+
+import argparse
+import time
+
+import numpy as np
+from scipy.optimize import minimize
+
+
+def _graph(problem):
+    """Graph of the problem with the nodes relabeled ``0, ..., num_V - 1``."""
+    handler = getattr(problem, "graph_handler", None)
+    return handler.G if handler is not None else problem.G
+
+
+def color_table(problem):
+    """Colour index of every node bitstring, indexed by the qubits of the node.
+
+    Bit ``m`` of the index is qubit ``m`` of the node, i.e. character ``m`` of the
+    node label of ``slice_string``. Labels without a colour share one index, as
+    ``same_color`` treats them as equal.
+    """
+    k = problem.N_qubits_per_node
+    names = {name: c for c, name in enumerate(problem.colors)}
+    table = np.full(2**k, len(names), dtype=np.int8)
+    for raw in range(2**k):
+        label = "".join(str((raw >> m) & 1) for m in range(k))
+        color = problem.bitstring_to_color.get(label)
+        if color is not None:
+            table[raw] = names[color]
+    return table
+
+
+def cost_diagonal(problem):
+    """Weighted cut of every basis state, cached on the problem instance.
+
+    The index of the returned array is the Qiskit basis state index: bit ``q`` is
+    qubit ``q``. A node fixed by ``fix_one_node`` has the first colour.
+    """
+    cut = getattr(problem, "_cost_diagonal", None)
+    if cut is not None:
+        return cut
+
+    G = _graph(problem)
+    k = problem.N_qubits_per_node
+    num_free = problem.N_qubits // k
+    table = color_table(problem)
+    index = np.arange(2**problem.N_qubits, dtype=np.int64)
+
+    # a node fixed by fix_one_node has the label colors["color1"][0]
+    fixed = table[int(problem.colors["color1"][0][::-1], 2)]
+
+    def colors(node):
+        if node >= num_free:
+            return fixed
+        return table[(index >> (node * k)) & (2**k - 1)]
+
+    cut = np.zeros(len(index))
+    for i, j, data in G.edges(data=True):
+        cut += data.get("weight", 1) * (colors(i) != colors(j))
+    problem._cost_diagonal = cut
+    return cut
+
+
+def check_edge_circuit(problem, theta=0.7):
+    """Whether ``create_edge_circuit(theta)`` is ``exp(-i theta)`` on equal colours.
+
+    The comparison is exact and up to a global phase, on the ``2 k`` qubits of one
+    edge.
+    """
+    from qiskit.quantum_info import Operator
+
+    k = problem.N_qubits_per_node
+    table = color_table(problem)
+    index = np.arange(2 ** (2 * k))
+    same = table[index & (2**k - 1)] == table[index >> k]
+    expected = np.diag(np.exp(-1j * theta * same))
+    actual = Operator(problem.create_edge_circuit(theta)).data
+    return Operator(actual).equiv(Operator(expected))
+
+
+def _mixer_block(betas, num_qubits):
+    """``rx(-2 beta)`` on ``num_qubits`` qubits for every beta, shape (B, 2^k, 2^k)."""
+    c, s = np.cos(betas), 1j * np.sin(betas)
+    single = np.stack([np.stack([c, s], -1), np.stack([s, c], -1)], -2)
+    block = np.ones((len(betas), 1, 1), dtype=complex)
+    for _ in range(num_qubits):
+        block = np.einsum("bij,bkl->bikjl", block, single).reshape(
+            len(betas), 2 * block.shape[1], 2 * block.shape[2]
+        )
+    return block
+
+
+def _apply_x_mixer(psi, betas, num_qubits, block_size=4):
+    """Apply ``rx(-2 beta)`` to every qubit, ``block_size`` qubits per matmul."""
+    for q in range(0, num_qubits, block_size):
+        k = min(block_size, num_qubits - q)
+        view = psi.reshape(len(betas), -1, 2**k, 2**q)
+        psi = np.matmul(_mixer_block(betas, k)[:, None], view)
+    return psi.reshape(len(betas), -1)
+
+
+def qaoa_states(cut, angles, levels=None):
+    """QAOA statevectors for a batch of angles.
+
+    Args:
+        cut: Cost diagonal of :func:`cost_diagonal`.
+        angles: Array of shape ``(batch, 2 p)`` in the order of the ``qaoa``
+            package, ``gamma_1, beta_1, ..., gamma_p, beta_p``.
+        levels: ``np.unique(cut, return_inverse=True)``, computed if not given.
+
+    Returns:
+        Array of shape ``(batch, 2^N)``.
+    """
+    angles = np.atleast_2d(angles)
+    num_qubits = int(np.log2(len(cut)))
+    values, inverse = levels or np.unique(cut, return_inverse=True)
+    psi = np.full((len(angles), len(cut)), 1 / np.sqrt(len(cut)), dtype=complex)
+    for gammas, betas in zip(angles[:, 0::2].T, angles[:, 1::2].T):
+        # few distinct cut values: one exponential per value
+        psi *= np.exp(1j * np.outer(gammas, values))[:, inverse]
+        psi = _apply_x_mixer(psi, betas, num_qubits)
+    return psi
+
+
+def energies(cut, angles, levels=None, max_bytes=2**28):
+    """Energies ``-<cut>`` for a batch of angles, in memory-bounded chunks."""
+    angles = np.atleast_2d(angles)
+    levels = levels or np.unique(cut, return_inverse=True)
+    chunk = max(1, max_bytes // (16 * len(cut)))
+    result = np.empty(len(angles))
+    for start in range(0, len(angles), chunk):
+        psi = qaoa_states(cut, angles[start : start + chunk], levels)
+        result[start : start + chunk] = -(psi.real**2 + psi.imag**2) @ cut
+    return result
+
+
+def interpolate(angles):
+    """Depth ``p + 1`` starting point from optimal depth ``p`` angles (INTERP)."""
+    p = len(angles) // 2
+    new = np.zeros(2 * (p + 1))
+    for offset in (0, 1):
+        old = np.concatenate([[0], angles[offset::2], [0]])
+        i = np.arange(1, p + 2)
+        new[offset::2] = (i - 1) / p * old[i - 1] + (p - i + 1) / p * old[i]
+    return new
+
+
+def optimize(
+    problem,
+    depth,
+    angles={"gamma": [0, np.pi, 20], "beta": [0, np.pi, 20]},
+    maxiter=100,
+    tol=1e-3,
+    rhobeg=0.1,
+):
+    """Optimize depth 1 to ``depth`` with COBYLA on the statevector fast path.
+
+    Args:
+        problem: k-colouring ``GraphProblem`` with ``colors`` and
+            ``bitstring_to_color``.
+        depth: Largest depth.
+        angles: Grid of the depth-1 starting point, as in ``QAOA.optimize``.
+        maxiter, tol, rhobeg: Settings of COBYLA, as in the notebook.
+
+    Returns:
+        List of ``(angles, energy)`` of the depths ``1, ..., depth``.
+    """
+    cut = cost_diagonal(problem)
+    levels = np.unique(cut, return_inverse=True)
+    gammas = np.linspace(*angles["gamma"][:2], angles["gamma"][2])
+    betas = np.linspace(*angles["beta"][:2], angles["beta"][2])
+    grid = np.stack(np.meshgrid(gammas, betas), axis=-1).reshape(-1, 2)
+    x0 = grid[np.argmin(energies(cut, grid, levels))]
+
+    results = []
+    for p in range(1, depth + 1):
+        if p > 1:
+            x0 = interpolate(results[-1][0])
+        res = minimize(
+            lambda x: energies(cut, x, levels)[0],
+            x0,
+            method="COBYLA",
+            tol=tol,
+            options={"maxiter": maxiter, "rhobeg": rhobeg},
+        )
+        results.append((res.x, res.fun))
+    return results
+
+
+def _notebook_graph():
+    import networkx as nx
+
+    G = nx.Graph()
+    G.add_nodes_from(range(8))
+    G.add_edges_from(
+        [
+            (0, 1),
+            (0, 2),
+            (1, 3),
+            (1, 4),
+            (2, 4),
+            (2, 5),
+            (3, 6),
+            (4, 7),
+            (5, 6),
+            (6, 7),
+            (7, 3),
+            (3, 5),
+        ]
+    )
+    return G
+
+
+def _max4cut_class():
+    """``Max4Cut`` of the notebook with the edge circuit of ``Max3Cut``."""
+    from qaoa.problems import GraphProblem
+    from qiskit import QuantumCircuit
+    from qiskit.circuit.library import PhaseGate
+
+    class Max4Cut(GraphProblem):
+        def __init__(self, G):
+            super().__init__(G, 2)
+            self.colors = {
+                "color1": ["00"],
+                "color2": ["01"],
+                "color3": ["10"],
+                "color4": ["11"],
+            }
+            self.bitstring_to_color = {
+                index: key for key, indices in self.colors.items() for index in indices
+            }
+
+        def create_edge_circuit(self, theta):
+            qc = QuantumCircuit(4)
+            qc.cx(0, 2)
+            qc.cx(1, 3)
+            qc.x([2, 3])
+            qc.append(PhaseGate(-theta).control(1), [2, 3])
+            qc.x([2, 3])
+            qc.cx(1, 3)
+            qc.cx(0, 2)
+            return qc
+
+        def create_edge_circuit_fixed_node(self, theta):
+            pass
+
+    return Max4Cut
+
+
+def _circuit_energy(problem, angles):
+    """Energy of the circuit of the ``qaoa`` package, from its exact statevector."""
+    from qiskit import QuantumCircuit
+    from qiskit.quantum_info import Statevector
+
+    problem.create_circuit()
+    n = problem.N_qubits
+    qc = QuantumCircuit(n)
+    qc.h(range(n))
+    for gamma, beta in zip(angles[0::2], angles[1::2]):
+        qc.compose(problem.circuit.assign_parameters([gamma]), range(n), inplace=True)
+        qc.rx(-2 * beta, range(n))
+    return -Statevector(qc).probabilities() @ cost_diagonal(problem)
+
+
+def benchmark(sizes, depth, package_depth):
+    import networkx as nx
+
+    Max4Cut = _max4cut_class()
+    for num_nodes in sizes:
+        if num_nodes == 8:
+            G = _notebook_graph()
+        else:
+            G = nx.random_regular_graph(3, num_nodes, seed=num_nodes)
+        problem = Max4Cut(G)
+        start = time.perf_counter()
+        cut = cost_diagonal(problem)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        results = optimize(problem, depth)
+        elapsed = time.perf_counter() - start
+        ratios = ", ".join(f"{-energy / cut.max():.3f}" for _, energy in results)
+        print(
+            f"{num_nodes} nodes, {problem.N_qubits} qubits: cost diagonal {built:.3f} s "
+            f"(edge circuit ok: {check_edge_circuit(problem)}), depth 1-{depth} "
+            f"in {elapsed:.2f} s, approximation ratios {ratios}"
+        )
+        if num_nodes <= 8:
+            angles, energy = results[-1]
+            error = abs(_circuit_energy(problem, angles) - energy)
+            print(f"    deviation from the package circuit at depth {depth}: {error:.1e}")
+
+        if package_depth and num_nodes <= 8:
+            from qaoa import QAOA
+            from qaoa.initialstates import Plus
+            from qaoa.mixers import X
+            from qiskit_algorithms.optimizers import COBYLA
+
+            settings = {"maxiter": 100, "tol": 1e-3, "rhobeg": 0.1}
+            qaoa = QAOA(
+                initialstate=Plus(),
+                problem=Max4Cut(G),
+                mixer=X(),
+                optimizer=[COBYLA, settings],
+            )
+            start = time.perf_counter()
+            qaoa.optimize(
+                depth=package_depth,
+                angles={"gamma": [0, np.pi, 20], "beta": [0, np.pi, 20]},
+            )
+            elapsed = time.perf_counter() - start
+            ratios = ", ".join(
+                f"{-qaoa.get_energy(p) / cut.max():.3f}"
+                for p in range(1, package_depth + 1)
+            )
+            print(
+                f"    qaoa package, depth 1-{package_depth}: {elapsed:.2f} s, "
+                f"approximation ratios {ratios} (sampled)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, nargs="+", default=[8, 10])
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument(
+        "--package-depth",
+        type=int,
+        default=2,
+        help="depth of the qaoa package run for comparison, 0 to skip",
+    )
+    args = parser.parse_args()
+    benchmark(args.nodes, args.depth, args.package_depth)
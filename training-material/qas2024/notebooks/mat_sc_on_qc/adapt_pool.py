@@ -0,0 +1,233 @@
+"""ADAPT operator pool and vectorized commutator gradients for the embedding client.
+
+With ``--adapt``, ``client-vqe-ucc.py`` turns every Pauli term of the ``UCC``
+operators into a pool operator, and ``AdaptVQE`` builds the commutator
+``i[H, A_k]`` of every pool operator with the Hamiltonian again in each ADAPT
+iteration. For larger active spaces the pool has thousands of entries and the
+commutators dominate the classical run time. This module
+
+- builds the pool with the loop of the client (:func:`build_operator_pool`),
+  which is already fast: terms with an even number of ``Y`` are dropped. With
+  ``unique=True`` the terms are filtered on their symplectic (z|x) form, and
+  repeated and sign-flipped Pauli strings, e.g. of custom excitation lists, are
+  merged with ``np.unique``,
+- computes all commutators at once (:class:`PoolCommutators`): a Hamiltonian term
+  contributes to ``[H, A_k]`` only if it anticommutes with ``A_k``, which is one
+  matrix product of the symplectic forms, and the commutator then is
+  ``2 i c_j a_k P_j P_k``. The Pauli strings and phases are kept per set of
+  Hamiltonian Pauli strings, so updated CP2K coefficients only cost a gather,
+- evaluates the gradients of the whole pool in one estimator call and skips the
+  operators that commute with the Hamiltonian (:func:`pool_gradients`).
+
+Usage:
+    pool = build_operator_pool(ucc.operators)
+    commutators = PoolCommutators(pool)
+    gradients = pool_gradients(estimator, ansatz, commutators(hamiltonian), theta)
+
+Running this file compares the commutators with the loop of ``AdaptVQE`` for random
+integrals:
+
+    python adapt_pool.py --nalpha 2 --nbeta 2 --norbs 6
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import time
+
+import numpy as np
+from qiskit.quantum_info import PauliList, SparsePauliOp
+
+
+def build_operator_pool(
+    operators: list[SparsePauliOp], unique: bool = False
+) -> list[SparsePauliOp]:
+    """Single-term ADAPT pool of the Pauli terms of ``operators``.
+
+    Args:
+        operators: Excitation operators, e.g. ``UCC(...).operators``.
+        unique: Keep only the first term of every Pauli string. Terms that differ
+            only in the sign of the coefficient generate the same rotation and are
+            merged as well. Custom excitation lists can repeat strings; the default
+            excitations of ``UCC`` do not.
+
+    Returns:
+        One operator per Pauli term with an odd number of ``Y``, in order.
+    """
+    if not unique:
+        operator_pool = []
+        for op in operators:
+            for pauli, coeff in zip(op.paulis, op.coeffs):
+                if sum(pauli.x & pauli.z) % 2 == 0:
+                    continue
+                operator_pool.append(SparsePauliOp([pauli], coeffs=[coeff]))
+        return operator_pool
+
+    z = np.vstack([op.paulis.z for op in operators])
+    x = np.vstack([op.paulis.x for op in operators])
+    coeffs = np.concatenate([op.coeffs for op in operators])
+
+    (keep,) = np.nonzero(np.count_nonzero(z & x, axis=1) % 2)
+    # the sign lives in the coefficient, so equal (z|x) rows merge +P and -P
+    symplectic = np.packbits(np.hstack([z[keep], x[keep]]), axis=1)
+    _, first = np.unique(symplectic, axis=0, return_index=True)
+    keep = keep[np.sort(first)]
+
+    pool = SparsePauliOp(PauliList.from_symplectic(z[keep], x[keep]), coeffs[keep])
+    return [pool[i] for i in range(len(pool))]
+
+
+class PoolCommutators:
+    """Commutators ``i[H, A_k]`` of all operators of a single-term pool.
+
+    Args:
+        pool: Single-term operators, see :func:`build_operator_pool`.
+    """
+
+    def __init__(self, pool: list[SparsePauliOp]):
+        if any(len(op) != 1 for op in pool):
+            raise ValueError("PoolCommutators needs single-term pool operators")
+        self.pool = pool
+        self._z = np.vstack([op.paulis.z for op in pool])
+        self._x = np.vstack([op.paulis.x for op in pool])
+        self._coeffs = np.array([op.coeffs[0] for op in pool])
+        self._key = None
+        self._terms = None
+        self._operator = None
+        self._commutators = None
+
+    def _build_terms(self, paulis: PauliList):
+        """Anticommuting rows, product strings and prefactors of all pool operators."""
+        # P_j and A_k anticommute iff their symplectic product is odd (the float
+        # matmul goes through BLAS and is exact for these small integers)
+        anti = self._z.astype(np.float32) @ paulis.x.T.astype(np.float32)
+        anti += self._x.astype(np.float32) @ paulis.z.T.astype(np.float32)
+        pool_index, rows = np.nonzero(anti % 2 == 1)
+        pool = PauliList.from_symplectic(self._z[pool_index], self._x[pool_index])
+        products = paulis[rows].dot(pool)
+        # i (P_j A_k - A_k P_j) = 2 i P_j A_k; the phase of the product goes into the
+        # prefactor
+        factors = 2j * self._coeffs[pool_index] * (-1j) ** products.phase
+        products.phase = 0
+        bounds = np.searchsorted(pool_index, np.arange(len(self.pool) + 1))
+        return rows, products, factors, bounds
+
+    def __call__(self, operator: SparsePauliOp) -> list[SparsePauliOp | None]:
+        """Return ``i[operator, A_k]`` per pool operator, ``None`` where it is zero."""
+        if operator is self._operator:
+            return self._commutators
+
+        paulis = operator.paulis
+        digest = hashlib.sha256(paulis.z.tobytes() + paulis.x.tobytes())
+        digest.update(str(paulis.z.shape).encode())
+        if digest.digest() != self._key:
+            self._terms = self._build_terms(paulis)
+            self._key = digest.digest()
+
+        rows, products, factors, bounds = self._terms
+        coeffs = (operator.coeffs * (-1j) ** paulis.phase)[rows] * factors
+        self._commutators = [
+            SparsePauliOp(
+                products[start:stop], coeffs[start:stop], ignore_pauli_phase=True
+            )
+            if stop > start
+            else None
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        self._operator = operator
+        return self._commutators
+
+
+def pool_gradients(estimator, ansatz, commutators, theta) -> list[tuple[float, dict]]:
+    """Gradients of all pool operators, in the format of ``AdaptVQE._compute_gradients``.
+
+    Commutators that vanish are not sent to the estimator; all others are evaluated
+    with a single call.
+
+    Args:
+        estimator: The estimator of the VQE solver.
+        ansatz: The current ADAPT ansatz; its layout is applied to the commutators.
+        commutators: Output of :class:`PoolCommutators`.
+        theta: Current parameters of ``ansatz``.
+    """
+    from qiskit_algorithms.observables_evaluator import estimate_observables
+
+    nonzero = [k for k, commutator in enumerate(commutators) if commutator is not None]
+    observables = [commutators[k] for k in nonzero]
+    if ansatz.layout:
+        observables = [
+            observable.apply_layout(ansatz.layout) for observable in observables
+        ]
+
+    gradients = [(0.0, {})] * len(commutators)
+    if observables:
+        values = estimate_observables(estimator, ansatz, observables, theta)
+        for k, value in zip(nonzero, values):
+            gradients[k] = value
+    return gradients
+
+
+def _random_hamiltonian(num_orbs, mapper, seed=7):
+    """Qubit Hamiltonian of random real integrals with the symmetries of ERIs."""
+    from qiskit_nature.second_q.hamiltonians import ElectronicEnergy
+
+    rng = np.random.default_rng(seed)
+    h1 = rng.normal(size=(num_orbs, num_orbs))
+    h1 = (h1 + h1.T) / 2
+    h2 = rng.normal(size=(num_orbs,) * 4) * 0.1
+    for axes in [(1, 0, 2, 3), (0, 1, 3, 2), (2, 3, 0, 1)]:
+        h2 = (h2 + h2.transpose(axes)) / 2
+    energy = ElectronicEnergy.from_raw_integrals(h1, h2)
+    return mapper.map(energy.second_q_op())
+
+
+def benchmark(num_alpha, num_beta, num_orbs):
+    """Compare the commutators with the loop of ``AdaptVQE``."""
+    from qiskit_nature.second_q.circuit.library import UCC
+    from qiskit_nature.second_q.mappers import ParityMapper
+
+    mapper = ParityMapper()
+    operators = UCC(num_orbs, (num_alpha, num_beta), "sd", mapper).operators
+    hamiltonian = _random_hamiltonian(num_orbs, mapper)
+    num_terms = sum(len(op) for op in operators)
+
+    pool = build_operator_pool(operators)
+    print(
+        f"{num_orbs} orbitals, {hamiltonian.num_qubits} qubits, {num_terms} UCC terms, "
+        f"{len(pool)} pool operators, {len(hamiltonian)} Hamiltonian terms"
+    )
+
+    start = time.perf_counter()
+    reference = [1j * (hamiltonian @ exc - exc @ hamiltonian) for exc in pool]
+    reference_time = time.perf_counter() - start
+    commutators = PoolCommutators(pool)
+    start = time.perf_counter()
+    result = commutators(hamiltonian)
+    first_time = time.perf_counter() - start
+    start = time.perf_counter()
+    commutators(SparsePauliOp(hamiltonian.paulis, 2 * hamiltonian.coeffs))
+    update_time = time.perf_counter() - start
+
+    deviation = max(
+        np.abs((ref - (res if res is not None else 0 * ref)).simplify().coeffs).max()
+        for ref, res in zip(reference, result)
+    )
+    num_zero = sum(res is None for res in result)
+    print(
+        f"  commutators: AdaptVQE {reference_time:.3f} s per iteration, first build "
+        f"{first_time:.3f} s, new coefficients {update_time:.3f} s"
+    )
+    print(
+        f"  {num_zero} of {len(pool)} pool operators commute with H, "
+        f"max deviation {deviation:.1e}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nalpha", type=int, default=2)
+    parser.add_argument("--nbeta", type=int, default=2)
+    parser.add_argument("--norbs", type=int, default=6)
+    args = parser.parse_args()
+    benchmark(args.nalpha, args.nbeta, args.norbs)
@@ -0,0 +1,180 @@
+"""Asyncio execution mode that keeps several estimator jobs in flight.
+
+The solvers of ``client-vqe-ucc.py`` block on every estimator result, although many
+of the evaluations they request are independent: the +/- perturbation pair of each
+SPSA step, the commutator gradients of all ADAPT pool operators and the QEOM matrix
+elements. :class:`ConcurrentEstimator` splits large runs, like the gradient
+screening, into chunks and submits them from an asyncio event loop to a pool of
+estimators, so up to one job per estimator waits in a backend queue at the same
+time. Runs with fewer than ``2 * min_chunk_size`` circuits, like the +/- pair of an
+SPSA step, stay one job; splitting them would only queue more jobs.
+
+Running this file compares the serial and the concurrent path on a local backend
+with simulated queue latency:
+
+    python async_driver.py --latency 0.5 --circuit-time 0.05 --jobs 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import threading
+import time
+import warnings
+
+import numpy as np
+from pretranspiled_estimator import JobCountingBackend, PretranspiledEstimator
+from qiskit import QuantumCircuit
+from qiskit.primitives import BaseEstimatorV1, EstimatorResult
+from qiskit.primitives.primitive_job import PrimitiveJob
+
+
+class ConcurrentEstimator(BaseEstimatorV1):
+    """Estimator (V1) that evaluates the chunks of each run concurrently.
+
+    Args:
+        estimators: Pool of estimators; each one runs at most one job at a time, so
+            the pool size is the number of jobs in flight. The estimators must not
+            share mutable state, see :meth:`.PretranspiledEstimator.clone`.
+        min_chunk_size: Smallest number of circuits per job.
+        options: Default run options.
+    """
+
+    def __init__(
+        self,
+        estimators: list[BaseEstimatorV1],
+        min_chunk_size: int = 8,
+        options: dict | None = None,
+    ):
+        super().__init__(options=options)
+        self.estimators = list(estimators)
+        self.min_chunk_size = min_chunk_size
+        self._idle = asyncio.Queue()
+        for estimator in self.estimators:
+            self._idle.put_nowait(estimator)
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+
+    @property
+    def num_submissions(self) -> int:
+        return sum(getattr(e, "num_submissions", 0) for e in self.estimators)
+
+    @property
+    def num_evaluations(self) -> int:
+        return sum(getattr(e, "num_evaluations", 0) for e in self.estimators)
+
+    def _run(self, circuits, observables, parameter_values, **run_options):
+        job = PrimitiveJob(
+            self._call, circuits, observables, parameter_values, **run_options
+        )
+        job._submit()
+        return job
+
+    def _call(self, circuits, observables, parameter_values, **run_options):
+        coroutine = self.evaluate(circuits, observables, parameter_values, **run_options)
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def evaluate(
+        self, circuits, observables, parameter_values, **run_options
+    ) -> EstimatorResult:
+        """Evaluate all expectation values in at most one chunk per estimator."""
+        num_chunks = min(len(self.estimators), len(circuits) // self.min_chunk_size)
+        chunks = np.array_split(np.arange(len(circuits)), max(num_chunks, 1))
+        results = await asyncio.gather(
+            *(
+                self._submit(
+                    [circuits[i] for i in chunk],
+                    [observables[i] for i in chunk],
+                    [parameter_values[i] for i in chunk],
+                    run_options,
+                )
+                for chunk in chunks
+                if len(chunk)
+            )
+        )
+        values = np.concatenate([result.values for result in results] or [[]])
+        metadata = [meta for result in results for meta in result.metadata]
+        return EstimatorResult(values, metadata)
+
+    async def _submit(self, circuits, observables, parameter_values, run_options):
+        estimator = await self._idle.get()
+        try:
+            return await asyncio.to_thread(
+                lambda: estimator.run(
+                    circuits, observables, parameter_values, **run_options
+                ).result()
+            )
+        finally:
+            self._idle.put_nowait(estimator)
+
+
+class LatencyBackend(JobCountingBackend):
+    """Job-counting fake backend with simulated queue and execution time.
+
+    Every job waits ``latency`` seconds plus ``circuit_time`` seconds per circuit,
+    like a remote device that queues jobs and executes their circuits in order.
+    """
+
+    def __init__(
+        self, num_qubits: int, latency: float = 0.5, circuit_time: float = 0.05, **kwargs
+    ):
+        super().__init__(num_qubits, **kwargs)
+        self.latency = latency
+        self.circuit_time = circuit_time
+
+    def run(self, run_input, **options):
+        num_circuits = 1 if isinstance(run_input, QuantumCircuit) else len(run_input)
+        time.sleep(self.latency + self.circuit_time * num_circuits)
+        return super().run(run_input, **options)
+
+
+def benchmark(latency: float, circuit_time: float, jobs: int, iterations: int = 10):
+    """Time SPSA steps and ADAPT-style gradient screening, serial vs. concurrent."""
+    from qiskit.circuit.library import EfficientSU2
+    from qiskit.quantum_info import SparsePauliOp
+    from qiskit_algorithms import VQE
+    from qiskit_algorithms.observables_evaluator import estimate_observables
+    from qiskit_algorithms.optimizers import SPSA
+
+    rng = np.random.default_rng(0)
+    hamiltonian = SparsePauliOp(["ZZII", "IZZI", "IIZZ", "XIII", "IXII"], rng.random(5))
+    ansatz = EfficientSU2(4, reps=1)
+    pool = {
+        f"op{k}": SparsePauliOp("".join(rng.choice(list("IXYZ"), 4))) for k in range(24)
+    }
+    point = rng.random(ansatz.num_parameters)
+
+    for label, num_jobs in (("serial", 1), ("concurrent", jobs)):
+        backend = LatencyBackend(4, latency=latency, circuit_time=circuit_time, seed=1)
+        estimator = PretranspiledEstimator.from_backend(backend, options={"shots": 1000})
+        if num_jobs > 1:
+            estimator = ConcurrentEstimator(
+                [estimator] + [estimator.clone() for _ in range(num_jobs - 1)]
+            )
+
+        start = time.perf_counter()
+        optimizer = SPSA(maxiter=iterations, learning_rate=0.05, perturbation=0.05)
+        VQE(estimator, ansatz, optimizer, initial_point=point).compute_minimum_eigenvalue(
+            hamiltonian
+        )
+        spsa_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        estimate_observables(estimator, ansatz, pool, point)
+        screening_time = time.perf_counter() - start
+
+        print(
+            f"{label:>10}: SPSA {spsa_time:6.2f} s, "
+            f"pool screening {screening_time:6.2f} s, {backend.num_jobs} jobs"
+        )
+
+
+if __name__ == "__main__":
+    warnings.filterwarnings("ignore")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--circuit-time", type=float, default=0.05)
+    parser.add_argument("--jobs", type=int, default=4)
+    args = parser.parse_args()
+    benchmark(args.latency, args.circuit_time, args.jobs)
@@ -0,0 +1,257 @@
+"""Checkpoint and resume for long runs of the embedding client.
+
+An SPSA optimization of ``client-vqe-ucc.py`` on Braket or IBM hardware runs for
+hours, and a dropped socket or the end of the job allocation used to lose every
+estimator result. :class:`Checkpoint` keeps the run restartable:
+
+- every estimator result is appended to ``evaluations.jsonl`` and flushed to disk
+  before it is returned, keyed by a digest of the circuit, the observable, the
+  parameter values and the run options (:class:`CheckpointingEstimator`),
+- the random seed of the initial point and of the SPSA perturbations is kept in
+  ``state.json``, which is written to disk and replaced atomically on every
+  update.
+
+With ``--resume`` the client starts again from the stored seed, so SPSA, ADAPT and
+QEOM request the same evaluations in the same order; the evaluations loaded from
+the log are answered from it without submitting a job, each one once and in the
+order it was recorded, and the run continues from the first evaluation that was
+not completed. Evaluations of the current run are only appended to the log, so a
+point that SPSA requests again is sampled again, as it is without a checkpoint.
+Everything else that depends on the progress of the run, e.g. the selected ADAPT
+operators or the shot budget of ``--adaptive-shots``, which grows once per SPSA
+iteration, is rebuilt by the replay. A line that was cut off by the interruption is
+ignored. CP2K has to send the same integrals again, since the Hamiltonian is part of
+the key.
+
+Usage:
+    checkpoint = Checkpoint(".checkpoint", resume=args.resume)
+    algorithm_globals.random_seed = checkpoint.seed()
+    estimator = CheckpointingEstimator(estimator, checkpoint)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import defaultdict, deque
+
+import numpy as np
+from qiskit import QuantumCircuit
+from qiskit.circuit.library import get_standard_gate_name_mapping
+from qiskit.primitives import BaseEstimatorV1, EstimatorResult
+from qiskit.primitives.primitive_job import PrimitiveJob
+from qiskit.quantum_info import SparsePauliOp
+
+logger = logging.getLogger(__name__)
+
+STATE = "state.json"
+EVALUATIONS = "evaluations.jsonl"
+
+
+class Checkpoint:
+    """Run state and evaluation log in ``directory``.
+
+    Args:
+        directory: Directory of the checkpoint, created if it does not exist.
+        resume: Continue from the checkpoint in ``directory``. Otherwise an existing
+            checkpoint is discarded.
+    """
+
+    def __init__(self, directory: str = ".checkpoint", resume: bool = False):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.state = {}
+        # evaluations loaded from disk, consumed in order by replay()
+        self.evaluations = defaultdict(deque)
+        if resume:
+            self._load()
+        else:
+            for name in (STATE, EVALUATIONS):
+                if os.path.exists(self._path(name)):
+                    logger.warning("Discarding the checkpoint in %s", directory)
+                    os.remove(self._path(name))
+        self._log = open(self._path(EVALUATIONS), "a")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if os.path.exists(self._path(STATE)):
+            with open(self._path(STATE)) as f:
+                self.state = json.load(f)
+        if os.path.exists(self._path(EVALUATIONS)):
+            with open(self._path(EVALUATIONS)) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # cut off by the interruption
+                        continue
+                    self.evaluations[entry["key"]].append(
+                        (entry["value"], entry["metadata"])
+                    )
+        logger.info(
+            "Resuming from %s with %d stored evaluations",
+            self.directory,
+            sum(map(len, self.evaluations.values())),
+        )
+
+    def update(self, **fields):
+        """Set ``fields`` in the run state and write it atomically."""
+        self.state.update(fields)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.state, f, default=_to_json)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._path(STATE))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def seed(self) -> int:
+        """Seed of the run, drawn on the first call and kept on resume."""
+        if "seed" not in self.state:
+            self.update(seed=int(np.random.SeedSequence().entropy % 2**32))
+        return self.state["seed"]
+
+    def replay(self, key: str) -> tuple[float, dict] | None:
+        """Next stored evaluation of ``key`` that was not replayed yet, if any."""
+        stored = self.evaluations.get(key)
+        if not stored:
+            return None
+        return stored.popleft()
+
+    def record(self, key: str, value: float, metadata: dict):
+        """Append one evaluation of the current run to the log, durably."""
+        metadata = {
+            name: item
+            for name, item in metadata.items()
+            if isinstance(item, (int, float, np.number))
+        }
+        line = json.dumps(
+            {"key": key, "value": float(value), "metadata": metadata}, default=_to_json
+        )
+        self._log.write(line + "\n")
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.number):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def circuit_digest(circuit: QuantumCircuit) -> str:
+    """Digest of the gates of ``circuit`` that is stable across processes.
+
+    Parameters enter by name, evolution gates by their operator and composite
+    gates by their definition, so the digest tells ADAPT ansatzes with different
+    operators apart.
+    """
+    standard_gates = get_standard_gate_name_mapping()
+    digest = hashlib.sha256()
+
+    def visit(circ):
+        for instruction in circ.data:
+            operation = instruction.operation
+            qubits = [circ.find_bit(qubit).index for qubit in instruction.qubits]
+            digest.update(f"{operation.name}{qubits}{operation.params}".encode())
+            operator = getattr(operation, "operator", None)
+            if operator is not None:
+                for op in operator if isinstance(operator, list) else [operator]:
+                    op = SparsePauliOp(op)
+                    digest.update(op.paulis.z.tobytes() + op.paulis.x.tobytes())
+                    digest.update(np.asarray(op.coeffs, dtype=complex).tobytes())
+            elif operation.name not in standard_gates and operation.definition:
+                visit(operation.definition)
+
+    visit(circuit)
+    return digest.hexdigest()
+
+
+class CheckpointingEstimator(BaseEstimatorV1):
+    """Estimator (V1) that replays from and records into a :class:`Checkpoint`.
+
+    Only the evaluations of a ``run`` that have no stored evaluation left to replay
+    are passed to ``estimator``, in one call.
+
+    Args:
+        estimator: The estimator that runs the new evaluations.
+        checkpoint: Stores the results.
+    """
+
+    def __init__(self, estimator: BaseEstimatorV1, checkpoint: Checkpoint):
+        super().__init__()
+        self.estimator = estimator
+        self.checkpoint = checkpoint
+        self.num_replayed = 0
+        self._digests = {}
+
+    def __getattr__(self, name):
+        # counters like num_submissions of the wrapped estimator
+        if name == "estimator":
+            raise AttributeError(name)
+        return getattr(self.estimator, name)
+
+    def _circuit_digest(self, circuit: QuantumCircuit) -> str:
+        # the ADAPT ansatz changes in place, so the entry is checked against its
+        # size and operators
+        operators = getattr(circuit, "operators", None) or ()
+        fingerprint = (
+            circuit.num_parameters,
+            len(circuit.data),
+            tuple(map(id, operators)),
+        )
+        entry = self._digests.get(id(circuit))
+        if entry is None or entry[0] is not circuit or entry[1] != fingerprint:
+            entry = (circuit, fingerprint, circuit_digest(circuit))
+            self._digests[id(circuit)] = entry
+        return entry[2]
+
+    def key(self, circuit, observable, parameter_values, run_options) -> str:
+        observable = SparsePauliOp(observable)
+        digest = hashlib.sha256(self._circuit_digest(circuit).encode())
+        digest.update(observable.paulis.z.tobytes() + observable.paulis.x.tobytes())
+        digest.update(np.asarray(observable.coeffs, dtype=complex).tobytes())
+        digest.update(np.asarray(parameter_values, dtype=float).tobytes())
+        digest.update(repr(sorted(run_options.items())).encode())
+        return digest.hexdigest()
+
+    def _run(self, circuits, observables, parameter_values, **run_options):
+        job = PrimitiveJob(
+            self._call, circuits, observables, parameter_values, **run_options
+        )
+        job._submit()
+        return job
+
+    def _call(self, circuits, observables, parameter_values, **run_options):
+        keys = [
+            self.key(circuit, observable, values, run_options)
+            for circuit, observable, values in zip(
+                circuits, observables, parameter_values
+            )
+        ]
+        answers = [self.checkpoint.replay(key) for key in keys]
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+        self.num_replayed += len(keys) - len(missing)
+        if missing:
+            result = self.estimator.run(
+                [circuits[i] for i in missing],
+                [observables[i] for i in missing],
+                [parameter_values[i] for i in missing],
+                **run_options,
+            ).result()
+            for i, value, metadata in zip(missing, result.values, result.metadata):
+                self.checkpoint.record(keys[i], value, metadata)
+                answers[i] = (float(value), metadata)
+
+        values, metadata = zip(*answers)
+        return EstimatorResult(np.array(values), [dict(item) for item in metadata])
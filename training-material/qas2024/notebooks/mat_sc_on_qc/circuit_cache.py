@@ -0,0 +1,243 @@
+"""Persistent on-disk cache for the start-up artifacts of the embedding client.
+
+Building the ``UCC`` ansatz, the ADAPT operator pool and transpiling for the backend
+takes minutes for large active spaces, although the result only depends on the
+command line of ``client-vqe-ucc.py``. :class:`CircuitCache` stores these artifacts
+in one directory per configuration, keyed by a hash of that configuration:
+
+- circuits are serialized with QPY,
+- Pauli operators are stored as ``.npy`` arrays of their symplectic (z|x) form and
+  loaded memory-mapped; named operators such as the qEOM matrix elements are
+  stored concatenated, with their names and offsets,
+- qubit-wise commuting groupings are stored as one group label per Pauli term and
+  keyed by the Pauli strings only, so they stay valid when CP2K updates the
+  coefficients of the Hamiltonian.
+
+Entries are evicted least-recently-used first once the cache exceeds ``max_bytes``.
+
+Usage:
+    cache = CircuitCache(".circuit_cache")
+    key = cache.key(nalpha=1, nbeta=1, norbs=5, two_qubit_reduce=False, adapt=True,
+                    backend=backend_fingerprint(backend))
+    pool = cache.load_operators(key, "operator_pool")
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import rustworkx as rx
+from qiskit import QuantumCircuit, qpy
+from qiskit.quantum_info import PauliList, SparsePauliOp
+
+logger = logging.getLogger(__name__)
+
+GROUPINGS = "groupings"
+
+
+class CircuitCache:
+    """Content-addressed directory cache with LRU eviction by total size.
+
+    Args:
+        directory: Root directory of the cache, created if it does not exist.
+        max_bytes: Size limit of the cache; the least recently used entries are
+            removed when it is exceeded.
+    """
+
+    def __init__(self, directory: str = ".circuit_cache", max_bytes: int = 2**31):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._groupings = {}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(**fields) -> str:
+        """Return the cache key of a configuration given as keyword arguments."""
+        text = json.dumps(fields, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+    def _path(self, key: str, name: str) -> str:
+        return os.path.join(self.directory, key, name)
+
+    def _touch(self, key: str):
+        os.utime(os.path.join(self.directory, key))
+
+    def _write(self, key: str, name: str, write):
+        """Write a file atomically through a temporary file in the entry directory."""
+        entry = os.path.join(self.directory, key)
+        os.makedirs(entry, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=entry, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, self._path(key, name))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._touch(key)
+
+    def load_circuit(self, key: str, name: str) -> QuantumCircuit | None:
+        """Return the cached circuit, or ``None`` if it is not in the cache."""
+        path = self._path(key, name + ".qpy")
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            circuit = qpy.load(f)[0]
+        self._touch(key)
+        logger.info("Loaded %s from the circuit cache", name)
+        return circuit
+
+    def store_circuit(self, key: str, name: str, circuit: QuantumCircuit):
+        self._write(key, name + ".qpy", lambda f: qpy.dump(circuit, f))
+        self.evict()
+
+    def load_operators(self, key: str, name: str) -> list[SparsePauliOp] | None:
+        """Return the cached list of single-term operators, or ``None``."""
+        arrays = [
+            self._load_array(self._path(key, f"{name}.{part}.npy"))
+            for part in ("z", "x", "coeffs")
+        ]
+        if any(array is None for array in arrays):
+            return None
+        z, x, coeffs = arrays
+        paulis = PauliList.from_symplectic(z, x)
+        self._touch(key)
+        logger.info("Loaded %s from the circuit cache", name)
+        return [
+            SparsePauliOp(pauli, coeffs=[coeff]) for pauli, coeff in zip(paulis, coeffs)
+        ]
+
+    def store_operators(self, key: str, name: str, operators: list[SparsePauliOp]):
+        """Store a list of single-term operators, e.g. the ADAPT operator pool."""
+        paulis = PauliList([op.paulis[0] for op in operators])
+        coeffs = np.array([op.coeffs[0] for op in operators])
+        # the sign of the Pauli is folded into the coefficient
+        coeffs = coeffs * (-1j) ** paulis.phase
+        for part, array in (("z", paulis.z), ("x", paulis.x), ("coeffs", coeffs)):
+            self._write(key, f"{name}.{part}.npy", lambda f, a=array: np.save(f, a))
+        self.evict()
+
+    def load_operator_dict(self, key: str, name: str) -> dict[str, SparsePauliOp] | None:
+        """Return the cached dictionary of operators, or ``None``."""
+        arrays = [
+            self._load_array(self._path(key, f"{name}.{part}.npy"))
+            for part in ("names", "offsets", "z", "x", "coeffs")
+        ]
+        if any(array is None for array in arrays):
+            return None
+        names, offsets, z, x, coeffs = arrays
+        self._touch(key)
+        logger.info("Loaded %s from the circuit cache", name)
+        return {
+            str(label): SparsePauliOp(
+                PauliList.from_symplectic(z[start:stop], x[start:stop]),
+                coeffs=coeffs[start:stop],
+            )
+            for label, start, stop in zip(names, offsets[:-1], offsets[1:])
+        }
+
+    def store_operator_dict(
+        self, key: str, name: str, operators: dict[str, SparsePauliOp]
+    ):
+        """Store a dictionary of operators, e.g. the qEOM matrix element operators."""
+        paulis = [op.paulis for op in operators.values()]
+        sizes = [len(op) for op in operators.values()]
+        coeffs = [op.coeffs * (-1j) ** op.paulis.phase for op in operators.values()]
+        parts = (
+            ("names", np.array(list(operators), dtype=str)),
+            ("offsets", np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])),
+            ("z", np.vstack([p.z for p in paulis])),
+            ("x", np.vstack([p.x for p in paulis])),
+            ("coeffs", np.concatenate(coeffs)),
+        )
+        for part, array in parts:
+            self._write(key, f"{name}.{part}.npy", lambda f, a=array: np.save(f, a))
+        self.evict()
+
+    @staticmethod
+    def _load_array(path: str) -> np.ndarray | None:
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def group_commuting(self, operator: SparsePauliOp) -> list[SparsePauliOp]:
+        """Qubit-wise commuting grouping of ``operator``, cached by its Pauli strings.
+
+        Drop-in replacement for ``operator.group_commuting(qubit_wise=True)``.
+        """
+        paulis = operator.paulis
+        digest = hashlib.sha256(paulis.z.tobytes() + paulis.x.tobytes())
+        digest.update(str(paulis.z.shape).encode())
+        name = digest.hexdigest()[:32]
+
+        labels = self._groupings.get(name)
+        if labels is None:
+            path = os.path.join(self.directory, GROUPINGS, name + ".npy")
+            labels = self._load_array(path)
+            if labels is None:
+                labels = _group_indices(paulis)
+                self._write(GROUPINGS, name + ".npy", lambda f: np.save(f, labels))
+            self._groupings[name] = labels
+
+        order = np.argsort(labels, kind="stable")
+        bounds = np.flatnonzero(np.diff(labels[order])) + 1
+        return [operator[indices] for indices in np.split(order, bounds)]
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        """Return ``(last access, size in bytes, path)`` for every cache entry."""
+        result = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(path):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(root, file))
+                for root, _, files in os.walk(path)
+                for file in files
+            )
+            result.append((os.path.getmtime(path), size, path))
+        return result
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits into ``max_bytes``.
+
+        The groupings are shared by all entries and never evicted.
+        """
+        groupings = os.path.join(self.directory, GROUPINGS)
+        entries = sorted(entry for entry in self.entries() if entry[2] != groupings)
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            logger.info("Evicting %s from the circuit cache", path)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def backend_fingerprint(backend) -> str:
+    """Name of ``backend`` and a hash of its instruction set and coupling map.
+
+    Devices picked at run time, e.g. by ``least_busy``, differ in both, so circuits
+    transpiled for one of them must not be reused on another.
+    """
+    digest = hashlib.sha256(str(backend.num_qubits).encode())
+    target = backend.target
+    for name in sorted(target.operation_names):
+        qargs = target.qargs_for_operation_name(name)
+        digest.update(f"{name}:{sorted(qargs) if qargs else None};".encode())
+    return f"{backend.name}:{digest.hexdigest()[:16]}"
+
+
+def _group_indices(paulis: PauliList) -> np.ndarray:
+    """Group label of every term, colored like ``SparsePauliOp.group_commuting``."""
+    coloring = rx.graph_greedy_color(paulis.noncommutation_graph(qubit_wise=True))
+    labels = np.empty(len(paulis), dtype=np.int64)
+    for index, color in coloring.items():
+        labels[index] = color
+    return labels
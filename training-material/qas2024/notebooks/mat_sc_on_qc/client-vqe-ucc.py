@@ -11,22 +11,19 @@ import argparse
 import json
 import logging
 import numpy as np
-import socket
-import time
 
 import numpy as np
 from qiskit_algorithms.optimizers import L_BFGS_B, SPSA
+from qiskit_algorithms.utils import algorithm_globals
 from qiskit_algorithms import NumPyMinimumEigensolver
 from qiskit.circuit.library import EvolvedOperatorAnsatz
 from qiskit.primitives import Estimator
 from qiskit.primitives import StatevectorEstimator
-from qiskit.quantum_info import SparsePauliOp
 from qiskit_aer import Aer
 from qiskit_aer.primitives import Estimator as AerEstimator
 from qiskit_nature.logging import logging as nature_logging
 from qiskit_nature.second_q.algorithms import GroundStateEigensolver
-from qiskit_nature.second_q.algorithms.excited_states_solvers import (
-    QEOM, EvaluationRule)
+from qiskit_nature.second_q.algorithms.excited_states_solvers import EvaluationRule
 from qiskit_nature.second_q.circuit.library import UCC, HartreeFock
 from qiskit_nature.second_q.circuit.library.ansatzes.utils import \
     generate_fermionic_excitations
@@ -40,13 +37,22 @@ from qiskit_nature_cp2k.stateful_vqe import StatefulVQE
 from braket.aws import AwsDevice
 from braket.devices import Devices
 from braket.jobs import hybrid_job, save_job_result
-from qiskit.primitives import BackendEstimator
 
 from qiskit_braket_provider import BraketProvider
 from qiskit_braket_provider import BraketLocalBackend
 
 from qiskit_ibm_runtime import QiskitRuntimeService
 
+from pretranspiled_estimator import JobCountingBackend, PretranspiledEstimator
+from circuit_cache import CircuitCache, backend_fingerprint
+from cp2k_transport import CP2KConnection
+from async_driver import ConcurrentEstimator
+from adapt_pool import PoolCommutators, build_operator_pool, pool_gradients
+from shot_allocation import ShotAllocatingEstimator
+from tracing import Tracer, TracingEstimator
+from checkpoint import Checkpoint, CheckpointingEstimator
+from lazy_qeom import LazyQEOM
+
 np.set_printoptions(linewidth=500, precision=6, suppress=True)
 
 logger = logging.getLogger(__name__)
@@ -69,6 +75,7 @@ if __name__ == "__main__":
     UNIX = True #True
     shots = 0
     backend_name = ""
+    backend = None
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--nalpha", type=int, default=None)
@@ -85,6 +92,14 @@ if __name__ == "__main__":
     parser.add_argument("--local", action="store_true") # run on braket local
     parser.add_argument("--sv1", action="store_true") # run on braket sv1
     parser.add_argument("--aria1", action="store_true") # run on braket aria 1
+    parser.add_argument("--fake", action="store_true") # run on local job-counting backend
+    parser.add_argument("--cache-dir", default=None) # reuse circuits from this cache
+    parser.add_argument("--async-jobs", type=int, default=1) # estimator jobs in flight
+    parser.add_argument("--adaptive-shots", action="store_true") # variance-aware shots
+    parser.add_argument("--trace", action="store_true") # write a per-phase profile
+    parser.add_argument("--checkpoint-dir", default=None) # keep the run restartable
+    parser.add_argument("--resume", action="store_true") # continue from the checkpoint
+    parser.add_argument("--qeom-aux", nargs="*", default=None) # excited-state observables
     args = parser.parse_args()
 
     if args.nalpha is None or args.nbeta is None or args.norbs is None:
@@ -98,38 +113,18 @@ if __name__ == "__main__":
     else:
         mapper = ParityMapper()
 
-    initial_state = HartreeFock(
-        num_orbs,
-        (num_alpha, num_beta),
-        mapper,
-    )
-    ansatz = UCC(
-        num_orbs,
-        (num_alpha, num_beta),
-        "sd",
-        mapper,
-        # generalized=True,
-        # preserve_spin=False,
-        initial_state=initial_state,
-    )
-
-    def _no_fail(*args, **kwargs):
-        return True
+    # without --trace the spans below record nothing
+    tracer = Tracer(enabled=args.trace)
 
-    ansatz._check_ucc_configuration = _no_fail
+    checkpoint = None
+    if args.checkpoint_dir or args.resume:
+        checkpoint = Checkpoint(args.checkpoint_dir or ".checkpoint", resume=args.resume)
+        # a resumed run draws the same initial point and SPSA perturbations and
+        # gets the evaluations it already did from the checkpoint
+        algorithm_globals.random_seed = checkpoint.seed()
 
-    if args.adapt:
-        operator_pool = []
-        for op in ansatz.operators:
-            for pauli, coeff in zip(op.paulis, op.coeffs):
-                if sum(pauli.x & pauli.z) % 2 == 0:
-                    continue
-                operator_pool.append(SparsePauliOp([pauli], coeffs=[coeff]))
-
-        ansatz = EvolvedOperatorAnsatz(
-            operators=operator_pool,
-            initial_state=initial_state,
-        )
+    cache = CircuitCache(args.cache_dir) if args.cache_dir else None
+    group_commuting = cache.group_commuting if cache else None
 
     if args.aer:
         # Configure the Aer simulator with the desired number of shots
@@ -153,7 +148,9 @@ if __name__ == "__main__":
             logger.info("=== Amazon Braket backend activated ===")
             backend = BraketLocalBackend()
             logger.info("Using Braket Local Simulator backend")
-            estimator = BackendEstimator(backend=backend, options={"shots":1000})
+            estimator = PretranspiledEstimator.from_backend(
+                backend, options={"shots":1000}, group_commuting=group_commuting
+            )
             shots = 1000
             backend_name = "Braket Local"
             logger.info(f"Configured estimator with 1000 shots")
@@ -176,7 +173,9 @@ if __name__ == "__main__":
 
             backend = sv1_backends[0]
             logger.info("Using Braket SV1 Simulator backend")
-            estimator = BackendEstimator(backend=backend, options={"shots":1000})
+            estimator = PretranspiledEstimator.from_backend(
+                backend, options={"shots":1000}, group_commuting=group_commuting
+            )
             shots = 1000
             backend_name = "Braket SV1"
             logger.info(f"Configured estimator with 1000 shots")
@@ -199,7 +198,9 @@ if __name__ == "__main__":
             backend = aria1_backends[0]
 
             logger.info("Using IONQ aria 1 backend")
-            estimator = BackendEstimator(backend=backend, options={"shots":1000})
+            estimator = PretranspiledEstimator.from_backend(
+                backend, options={"shots":1000}, group_commuting=group_commuting
+            )
             shots = 1000
             backend_name = "Braket IONQ Aria 1"
             logger.info(f"Configured estimator with 1000 shots")
@@ -219,15 +220,138 @@ if __name__ == "__main__":
         #)
 
         service = QiskitRuntimeService()
-        backend = service.least_busy(operational=True, simulator=False, min_num_qubits=127)
+        backend = service.least_busy(
+            operational=True, simulator=False, min_num_qubits=127
+        )
         logger.info(f"Running on IBM hw {backend.name}")
-        estimator = BackendEstimator(backend=backend, options={"shots":100})
+        estimator = PretranspiledEstimator.from_backend(
+            backend, options={"shots":100}, group_commuting=group_commuting
+        )
         shots = 100
         backend_name = "Qiskit HW"
 
+    if args.fake:
+        # local stand-in for a remote backend, counts the submitted jobs
+        backend = JobCountingBackend(2 * num_orbs, seed=42)
+        logger.info("=== Job-counting fake backend activated with 1000 shots ===")
+        estimator = PretranspiledEstimator.from_backend(
+            backend, options={"shots":1000}, group_commuting=group_commuting
+        )
+        shots = 1000
+        backend_name = "Fake Job Counter"
+
+    allocator = None
+    if args.adaptive_shots:
+        if args.aer:
+            backend = Aer.get_backend("aer_simulator")
+        if args.aer or isinstance(estimator, PretranspiledEstimator):
+            # shots becomes the per-group budget, split by the group variances
+            logger.info(f"Allocating up to {shots} shots per measurement group")
+            allocator = ShotAllocatingEstimator(
+                backend, shots=shots, group_commuting=group_commuting
+            )
+            estimator = PretranspiledEstimator(allocator, backend=backend)
+        else:
+            logger.warning("--adaptive-shots needs a sampling backend, using fixed shots")
+
+    if args.trace and backend is not None:
+        tracer.trace_jobs(backend)
+
+    cache_key = CircuitCache.key(
+        nalpha=num_alpha,
+        nbeta=num_beta,
+        norbs=num_orbs,
+        two_qubit_reduce=args.two_qubit_reduce,
+        adapt=args.adapt,
+        # the resolved device, --hw picks the least busy one on every run
+        backend=backend_name if backend is None else backend_fingerprint(backend),
+    )
+
+    initial_state = HartreeFock(
+        num_orbs,
+        (num_alpha, num_beta),
+        mapper,
+    )
+
+    def build_ucc():
+        ansatz = UCC(
+            num_orbs,
+            (num_alpha, num_beta),
+            "sd",
+            mapper,
+            # generalized=True,
+            # preserve_spin=False,
+            initial_state=initial_state,
+        )
+
+        def _no_fail(*args, **kwargs):
+            return True
+
+        ansatz._check_ucc_configuration = _no_fail
+        return ansatz
+
+    if args.trace and isinstance(estimator, PretranspiledEstimator):
+        tracer.wrap(estimator, "prepare", "transpile")
+
+    with tracer.span("build.ansatz"):
+        if args.adapt:
+            operator_pool = None
+            if cache:
+                operator_pool = cache.load_operators(cache_key, "operator_pool")
+            if operator_pool is None:
+                operator_pool = build_operator_pool(build_ucc().operators)
+                if cache:
+                    cache.store_operators(cache_key, "operator_pool", operator_pool)
+
+            ansatz = EvolvedOperatorAnsatz(
+                operators=operator_pool,
+                initial_state=initial_state,
+            )
+        else:
+            ansatz = cache.load_circuit(cache_key, "ansatz") if cache else None
+            if ansatz is None:
+                ansatz = build_ucc()
+                if cache:
+                    cache.store_circuit(cache_key, "ansatz", ansatz)
+
+    transpiles_once = (
+        isinstance(estimator, PretranspiledEstimator) and estimator.backend is not None
+    )
+    # AdaptVQE replaces the operators of the ansatz, the full pool is never run
+    if cache and transpiles_once and not args.adapt:
+        transpiled = cache.load_circuit(cache_key, "transpiled_ansatz")
+        if transpiled is None:
+            transpiled = estimator.prepare(ansatz)
+            cache.store_circuit(cache_key, "transpiled_ansatz", transpiled)
+        estimator.add_prepared(ansatz, transpiled)
+
+    if args.async_jobs > 1:
+        if allocator is not None:
+            logger.warning("--async-jobs is not supported with --adaptive-shots")
+        elif transpiles_once:
+            logger.info(f"Keeping up to {args.async_jobs} estimator jobs in flight")
+            estimator = ConcurrentEstimator(
+                [estimator] + [estimator.clone() for _ in range(args.async_jobs - 1)]
+            )
+        else:
+            logger.warning(
+                "--async-jobs needs a backend estimator, running synchronously"
+            )
+
+    if args.trace:
+        estimator = TracingEstimator(estimator, tracer)
+
+    if checkpoint is not None:
+        estimator = CheckpointingEstimator(estimator, checkpoint)
 
     def callback(nfev, parameters, energy, stepsize):
         logger.info(f"Iteration {nfev}: Energy = {energy:.6f}")
+        tracer.lap("optimizer.iteration", nfev=nfev, energy=energy)
+        # SPSA evaluates one +/- pair per iteration. Replayed evaluations are
+        # reported too, so a resumed run gets the same budget. An SPSA callback
+        # would cost one more evaluation per iteration.
+        if allocator is not None and nfev % 2 == 0:
+            allocator.advance()
         return False
 
     # Try using SPSA optimizer
@@ -235,12 +359,16 @@ if __name__ == "__main__":
         maxiter=1000,
         learning_rate=0.005,
         perturbation=0.05,
-        last_avg=1
+        last_avg=1,
     )
 
 
     # Use random initial parameters
-    initial_point = np.random.rand(ansatz.num_parameters)
+    if checkpoint is not None:
+        rng = np.random.default_rng(checkpoint.seed())
+        initial_point = rng.random(ansatz.num_parameters)
+    else:
+        initial_point = np.random.rand(ansatz.num_parameters)
 
     if args.stateless:
         solver = VQE(
@@ -266,6 +394,21 @@ if __name__ == "__main__":
                 self.previous_energies = []
                 self.convergence_window = 3
                 self.convergence_threshold = 1e-6
+                self.pool_commutators = None
+
+            def _compute_gradients(self, theta, operator):
+                # commutators are built once per Hamiltonian, not per ADAPT iteration
+                if (
+                    self.pool_commutators is None
+                    or self.pool_commutators.pool is not self._excitation_pool
+                ):
+                    self.pool_commutators = PoolCommutators(self._excitation_pool)
+                return pool_gradients(
+                    self.solver.estimator,
+                    self.solver.ansatz,
+                    self.pool_commutators(operator),
+                    theta,
+                )
 
             def solve(self, problem):
                 result = super().solve(problem)
@@ -292,15 +435,22 @@ if __name__ == "__main__":
     if args.numpy:
         solver = NumPyMinimumEigensolver()
 
+    if args.trace:
+        # separates the solver time from the wait for CP2K within cp2k.run
+        tracer.wrap(solver, "compute_minimum_eigenvalue", "solver.solve")
+
     algo = GroundStateEigensolver(mapper, solver)
 
     logger.info(
         "Starting CP2KIntegration"
         )
     integ = CP2KIntegration(algo)
-    integ.connect_to_socket(HOST, PORT, UNIX)
-    integ.run()
-    problem = integ.construct_problem()
+    connection = CP2KConnection(HOST, PORT, UNIX, tracer=tracer if args.trace else None)
+    connection.connect(integ)
+    with tracer.span("cp2k.run"):
+        integ.run()
+    with tracer.span("cp2k.construct_problem"):
+        problem = integ.construct_problem()
 
     def my_generator(num_spatial_orbitals, num_particles):
         singles = generate_fermionic_excitations(
@@ -318,12 +468,14 @@ if __name__ == "__main__":
         "Creating QEOM"
         )
 
-    qeom = QEOM(
+    qeom = LazyQEOM(
         algo,
         estimator,
         excitations=my_generator,
         aux_eval_rules=EvaluationRule.ALL,
-        tol=1e-6
+        tol=1e-6,
+        aux_names=args.qeom_aux,
+        cache=cache,
     )
 
     logger.info(
@@ -331,7 +483,12 @@ if __name__ == "__main__":
     )
     problem.properties.electronic_density = None
 
-    excited_state_result = qeom.solve(problem)
+    if allocator is not None:
+        # the QEOM matrix elements are measured once, use the full budget
+        allocator.budget = 1.0
+
+    with tracer.span("qeom.solve"):
+        excited_state_result = qeom.solve(problem)
 
     # Print clear separation for results
     summary = f"""
@@ -370,6 +527,18 @@ Convergence Status: {'Converged' if hasattr(solver, '_converged') and solver._co
 {'='*80}
 """
 
+    if hasattr(estimator, "num_submissions"):
+        summary += f"Estimator submissions: {estimator.num_submissions} "
+        summary += f"({estimator.num_evaluations} evaluations)\n"
+    if checkpoint is not None:
+        summary += f"Evaluations replayed from the checkpoint: {estimator.num_replayed}\n"
+    if allocator is not None:
+        summary += f"Shots used: {allocator.num_shots}\n"
+    if args.fake:
+        summary += (
+            f"Fake backend jobs: {backend.num_jobs} ({backend.num_circuits} circuits)\n"
+        )
+
     # Print to both console and log file
     print(summary)
     logger.info(summary)
@@ -382,7 +551,9 @@ Convergence Status: {'Converged' if hasattr(solver, '_converged') and solver._co
             "num_alpha": num_alpha,
             "num_beta": num_beta,
             "num_orbs": num_orbs,
-            "num_shots": shots
+            "num_shots": shots,
+            "num_submissions": getattr(estimator, "num_submissions", None),
+            "shots_used": allocator.num_shots if allocator is not None else None,
         },
         "results": {
             "ground_state_energy": float(excited_state_result.groundstate_energy) if hasattr(excited_state_result, 'groundstate_energy') else None,
@@ -399,37 +570,9 @@ Convergence Status: {'Converged' if hasattr(solver, '_converged') and solver._co
 
     logger.info("Results have been saved to 'quantum_calculation_results.json'")
 
-class CP2KIntegration:
-    def __init__(self, algo):
-        self.algo = algo
-        self.socket = None
-
-    def connect_to_socket(self, host, port, unix):
-        try:
-            if unix:
-                self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                self.socket.connect(host)
-            else:
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket.connect((host, port))
-            logger.info("Connected to socket successfully.")
-        except socket.error as e:
-            logger.error(f"Socket connection error: {e}")
-            self.socket = None
-
-    def run(self):
-        if not self.socket:
-            logger.error("No socket connection available.")
-            return
-
-        try:
-            # Ensure the socket is connected before sending data
-            self.socket.send(self.Messages.HAVEDATA.value)
-        except BrokenPipeError:
-            logger.error("Broken pipe error: Unable to send data. The connection may have been closed.")
-            self.reconnect()
-
-    def reconnect(self):
-        logger.info("Attempting to reconnect to the socket...")
-        time.sleep(5)  # Wait before attempting to reconnect
-        self.connect_to_socket(HOST, PORT, UNIX)
+    if args.trace:
+        tracer.write("quantum_calculation_trace.json")
+        with open("quantum_calculation_trace.txt", "w") as f:
+            f.write(tracer.summary() + "\n")
+        logger.info("Trace summary:\n%s", tracer.summary())
+        logger.info("Trace has been saved to 'quantum_calculation_trace.json'")
@@ -0,0 +1,317 @@
+"""i-PI socket transport for the CP2K integration of the embedding client.
+
+CP2K talks to ``qiskit_nature_cp2k.cp2k_integration.CP2KIntegration`` with the i-PI
+protocol: every message starts with a 12-byte ASCII header such as ``HAVEDATA``,
+and the size of the payload that follows is fixed by the protocol, e.g. an int32
+count followed by float64 integrals. A plain ``socket.recv(n)`` may return fewer
+than ``n`` bytes and ``socket.send`` may write only part of a message.
+:class:`IPISocket` replaces the connected socket of the integration and keeps the
+wire format:
+
+- :meth:`IPISocket.recv_exact` returns exactly ``n`` bytes, read with
+  ``recv_into`` into one preallocated buffer that only grows, and ``send`` writes
+  the whole message with ``sendall``; ``recv`` keeps the semantics of
+  ``socket.recv`` and returns what is available,
+- :meth:`IPISocket.recv_array` reads integral arrays as NumPy views into that
+  buffer, without the copies of joining partial reads.
+
+:class:`CP2KConnection` connects the integration and reconnects it after a broken
+pipe with exponential backoff; the backoff state is kept between attempts.
+
+The live integration does not use :meth:`IPISocket.recv_exact` or
+:meth:`IPISocket.recv_array`: ``CP2KIntegration`` parses its messages itself and
+reads through ``recv``, which is forwarded to the socket unchanged. With the
+integration the wrapper only contributes ``sendall`` and the reconnect backoff; the
+preallocated buffer and the zero-copy integral views are used by code that reads
+the messages itself, like the benchmark below.
+
+Usage:
+    integ = CP2KIntegration(algo)
+    CP2KConnection(HOST, PORT, UNIX).connect(integ)
+    integ.run()
+
+Running this file starts a UNIX-socket stand-in for CP2K that sends integrals in the
+i-PI format and compares the transfer throughput with plain ``recv`` loops for
+growing active spaces:
+
+    python cp2k_transport.py 10 20 30 40
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from enum import Enum
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HDRLEN = 12
+
+
+class Messages(Enum):
+    """Message headers exchanged with CP2K."""
+
+    STATUS = b"STATUS".ljust(HDRLEN)
+    READY = b"READY".ljust(HDRLEN)
+    HAVEDATA = b"HAVEDATA".ljust(HDRLEN)
+    GETDATA = b"GETDATA".ljust(HDRLEN)
+    DATA = b"DATA".ljust(HDRLEN)
+    EXIT = b"EXIT".ljust(HDRLEN)
+
+
+class ExponentialBackoff:
+    """Delays of ``initial * factor**attempt``, capped at ``max_delay``.
+
+    Args:
+        initial: Delay before the first retry in seconds.
+        factor: Growth factor of the delay per failed attempt.
+        max_delay: Upper bound of a single delay in seconds.
+        max_attempts: Number of attempts before giving up, ``None`` for no limit.
+    """
+
+    def __init__(
+        self,
+        initial: float = 0.5,
+        factor: float = 2.0,
+        max_delay: float = 60.0,
+        max_attempts: int | None = 10,
+    ):
+        self.initial = initial
+        self.factor = factor
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.attempt = 0
+
+    def next_delay(self) -> float | None:
+        """Return the delay before the next attempt, or ``None`` once exhausted."""
+        if self.max_attempts is not None and self.attempt >= self.max_attempts:
+            return None
+        delay = min(self.initial * self.factor**self.attempt, self.max_delay)
+        self.attempt += 1
+        return delay
+
+    def reset(self):
+        self.attempt = 0
+
+
+class IPISocket:
+    """Connected socket with complete sends and receives of i-PI messages.
+
+    Methods that are not defined here, e.g. ``recv``, ``close`` or ``settimeout``,
+    are forwarded to the wrapped socket. Since the i-PI protocol fixes the size of
+    every message, :meth:`recv_exact` blocks until all ``n`` bytes have arrived.
+
+    Args:
+        sock: The connected socket.
+        buffer_size: Initial size of the receive buffer in bytes.
+    """
+
+    def __init__(self, sock: socket.socket, buffer_size: int = 1 << 20):
+        self.socket = sock
+        self._buffer = bytearray(buffer_size)
+
+    def __getattr__(self, name):
+        if name == "socket":
+            raise AttributeError(name)
+        return getattr(self.socket, name)
+
+    def _recv_exact(self, view: memoryview):
+        while view.nbytes:
+            received = self.socket.recv_into(view)
+            if not received:
+                raise ConnectionError("Socket closed by peer")
+            view = view[received:]
+
+    def _read(self, nbytes: int) -> memoryview:
+        """Receive ``nbytes`` into the buffer and return a view of them."""
+        if nbytes > len(self._buffer):
+            self._buffer = bytearray(max(nbytes, 2 * len(self._buffer)))
+        view = memoryview(self._buffer)[:nbytes]
+        self._recv_exact(view)
+        return view
+
+    def recv_exact(self, nbytes: int) -> bytes:
+        """Receive exactly ``nbytes``, unlike ``recv``."""
+        return bytes(self._read(nbytes))
+
+    def send(self, data, flags: int = 0) -> int:
+        self.socket.sendall(data)
+        return memoryview(data).nbytes
+
+    def sendall(self, data, flags: int = 0):
+        self.socket.sendall(data)
+
+    def recv_header(self) -> bytes:
+        """Receive a 12-byte message header, without the padding."""
+        return self.recv_exact(HDRLEN).strip()
+
+    def send_header(self, message: Messages | bytes):
+        header = message.value if isinstance(message, Messages) else message
+        self.sendall(header.ljust(HDRLEN))
+
+    def recv_array(self, dtype, shape) -> np.ndarray:
+        """Receive an array of known dtype and shape.
+
+        The array is a read-only view into the receive buffer and is only valid
+        until the next receive; copy it if it has to be kept longer.
+        """
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        view = self._read(count * dtype.itemsize)
+        return np.frombuffer(view, dtype=dtype).reshape(shape)
+
+    def send_array(self, array: np.ndarray):
+        """Send the raw data of ``array``, without copying contiguous arrays."""
+        self.sendall(memoryview(np.ascontiguousarray(array)).cast("B"))
+
+
+class CP2KConnection:
+    """Connects a ``CP2KIntegration`` and reconnects it with exponential backoff.
+
+    Args:
+        host: Path of the UNIX socket, or the host name for TCP.
+        port: TCP port.
+        unix: Whether ``host`` is a UNIX socket.
+        backoff: Reconnect policy, defaults to :class:`ExponentialBackoff`.
+        buffer_size: Initial size of the receive buffer in bytes.
+        tracer: Records every read of the socket as a ``cp2k.recv`` span, i.e. the
+            time spent waiting for CP2K, see :class:`.Tracer`.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        unix: bool = True,
+        backoff: ExponentialBackoff | None = None,
+        buffer_size: int = 1 << 20,
+        tracer=None,
+    ):
+        self.host = host
+        self.port = port
+        self.unix = unix
+        self.backoff = backoff or ExponentialBackoff()
+        self.buffer_size = buffer_size
+        self.tracer = tracer
+        self.integration = None
+
+    def connect(self, integration):
+        """Connect ``integration`` and replace its socket with an :class:`IPISocket`.
+
+        The ``reconnect`` of the integration, which it calls after a broken pipe,
+        is replaced by :meth:`reconnect`.
+        """
+        self.integration = integration
+        while True:
+            try:
+                integration.connect_to_socket(self.host, self.port, self.unix)
+            except OSError as e:
+                logger.error(f"Socket connection error: {e}")
+                integration.socket = None
+            if integration.socket is not None:
+                break
+            delay = self.backoff.next_delay()
+            if delay is None:
+                raise ConnectionError(f"Could not connect to {self.host}")
+            logger.info("Attempting to reconnect to the socket in %.1f s...", delay)
+            time.sleep(delay)
+        self.backoff.reset()
+        integration.socket = IPISocket(integration.socket, self.buffer_size)
+        if self.tracer is not None:
+            # reads go through the forwarded recv or through _recv_exact
+            self.tracer.wrap(integration.socket, "recv", "cp2k.recv")
+            self.tracer.wrap(integration.socket, "_recv_exact", "cp2k.recv")
+        integration.reconnect = self.reconnect
+        return integration
+
+    def reconnect(self):
+        if self.integration.socket is not None:
+            self.integration.socket.close()
+            self.integration.socket = None
+        self.connect(self.integration)
+
+
+def serve_integrals(path: str, num_orbs: int, ready: threading.Event):
+    """Stand-in for CP2K that answers ``GETDATA`` with ``DATA``, the number of
+    orbitals as int32 and the one- and two-electron integrals as float64."""
+    rng = np.random.default_rng(0)
+    one_body = rng.random((num_orbs, num_orbs))
+    two_body = rng.random((num_orbs,) * 4)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(path)
+        server.listen(1)
+        ready.set()
+        conn, _ = server.accept()
+        transport = IPISocket(conn)
+        while transport.recv_header() != Messages.EXIT.value.strip():
+            transport.send_header(Messages.DATA)
+            transport.send_array(np.array([num_orbs], dtype=np.int32))
+            transport.send_array(one_body)
+            transport.send_array(two_body)
+        conn.close()
+
+
+def _recv_plain(sock: socket.socket, nbytes: int) -> bytes:
+    """Receive ``nbytes`` by joining the chunks of plain ``recv`` calls."""
+    chunks = []
+    while nbytes:
+        chunk = sock.recv(nbytes)
+        if not chunk:
+            raise ConnectionError("Socket closed by peer")
+        chunks.append(chunk)
+        nbytes -= len(chunk)
+    return b"".join(chunks)
+
+
+def _receive_integrals(sock, plain: bool) -> int:
+    """Request and receive one set of integrals, return the number of bytes."""
+    sock.sendall(Messages.GETDATA.value)
+    if plain:
+        _recv_plain(sock, HDRLEN)
+        (num_orbs,) = np.frombuffer(_recv_plain(sock, 4), dtype=np.int32)
+        one_body = np.frombuffer(_recv_plain(sock, 8 * num_orbs**2))
+        two_body = np.frombuffer(_recv_plain(sock, 8 * num_orbs**4))
+    else:
+        sock.recv_header()
+        (num_orbs,) = sock.recv_array(np.int32, (1,))
+        one_body = sock.recv_array(np.float64, (num_orbs,) * 2).copy()
+        two_body = sock.recv_array(np.float64, (num_orbs,) * 4)
+    return one_body.nbytes + two_body.nbytes
+
+
+def benchmark(num_orbs: int, plain: bool, repeats: int = 5) -> float:
+    """Return the integral transfer throughput in MB/s for ``num_orbs`` orbitals."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "embedding_socket")
+        ready = threading.Event()
+        server = threading.Thread(target=serve_integrals, args=(path, num_orbs, ready))
+        server.start()
+        ready.wait()
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        client = sock if plain else IPISocket(sock)
+        nbytes = 0
+        start = time.perf_counter()
+        for _ in range(repeats):
+            nbytes += _receive_integrals(client, plain)
+        elapsed = time.perf_counter() - start
+        client.sendall(Messages.EXIT.value)
+        client.close()
+        server.join()
+    return nbytes / elapsed / 1e6
+
+
+if __name__ == "__main__":
+    for norbs in map(int, sys.argv[1:] or [10, 20, 40]):
+        print(
+            f"norbs = {norbs:3d}: IPISocket {benchmark(norbs, False):8.1f} MB/s, "
+            f"plain recv {benchmark(norbs, True):8.1f} MB/s"
+        )
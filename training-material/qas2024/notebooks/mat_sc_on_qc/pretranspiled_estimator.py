@@ -0,0 +1,214 @@
+"""Transpile-once estimator wrapper for the CP2K + Qiskit Nature embedding client.
+
+A ``BackendEstimator`` created with a backend transpiles every circuit again on each
+``run`` call, which for the UCC and ADAPT ansatzes of ``client-vqe-ucc.py`` costs more
+than the evaluation itself on simulators. :class:`PretranspiledEstimator` transpiles each
+circuit once and reuses the transpiled copy, mapping the observables onto its layout,
+on every later call.
+
+The solvers already pass evaluations that belong together in one call: ``VQE``
+evaluates SPSA's +/- perturbation pair at once, ``QEOM`` all matrix elements and
+ADAPT all pool gradients. Each call is forwarded as one job (split only above
+``max_batch_size``); separate calls are not merged. The submissions are counted so
+the job count of a run can be checked, e.g. against :class:`JobCountingBackend`.
+
+Usage:
+    estimator = PretranspiledEstimator.from_backend(backend, options={"shots": 1000})
+"""
+
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+from qiskit import QuantumCircuit, transpile
+from qiskit.primitives import BackendEstimator, BaseEstimatorV1, EstimatorResult
+from qiskit.primitives.primitive_job import PrimitiveJob
+from qiskit.providers.fake_provider import GenericBackendV2
+from qiskit.quantum_info import Pauli, PauliList
+
+
+class PretranspiledEstimator(BaseEstimatorV1):
+    """Estimator (V1) wrapper that transpiles every circuit once.
+
+    Args:
+        estimator: The estimator that runs the transpiled circuits.
+        backend: If given, circuits are transpiled for this backend once and the
+            observables are mapped onto the transpiled layout. Pass the backend only
+            when ``estimator`` does not transpile by itself, see :meth:`from_backend`.
+        max_batch_size: Maximum number of circuits per submission, or ``None`` to
+            send all circuits of a call at once.
+        options: Default run options.
+    """
+
+    def __init__(
+        self,
+        estimator: BaseEstimatorV1,
+        backend=None,
+        max_batch_size: int | None = None,
+        options: dict | None = None,
+    ):
+        super().__init__(options=options)
+        self.estimator = estimator
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.num_submissions = 0
+        self.num_evaluations = 0
+        self._circuits = {}
+        self._make_estimator = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_backend(
+        cls, backend, options: dict | None = None, group_commuting=None, **kwargs
+    ):
+        """Wrap ``backend`` in a ``BackendEstimator`` without per-call transpilation.
+
+        ``group_commuting`` optionally replaces the qubit-wise commuting grouping of
+        the observables, e.g. with the cached :meth:`.CircuitCache.group_commuting`.
+        """
+
+        def make_estimator():
+            return GroupingBackendEstimator(
+                backend=backend,
+                options=options,
+                skip_transpilation=True,
+                group_commuting=group_commuting,
+            )
+
+        estimator = cls(make_estimator(), backend=backend, **kwargs)
+        estimator._make_estimator = make_estimator
+        return estimator
+
+    def clone(self) -> PretranspiledEstimator:
+        """Return an independent estimator that shares the transpiled circuits.
+
+        Only estimators created with :meth:`from_backend` can be cloned.
+        """
+        if self._make_estimator is None:
+            raise ValueError("Only estimators created with from_backend can be cloned")
+        clone = PretranspiledEstimator(
+            self._make_estimator(),
+            backend=self.backend,
+            max_batch_size=self.max_batch_size,
+            options=self.options.__dict__,
+        )
+        clone._make_estimator = self._make_estimator
+        clone._circuits = self._circuits
+        clone._lock = self._lock
+        return clone
+
+    def add_prepared(self, circuit: QuantumCircuit, prepared: QuantumCircuit):
+        """Use ``prepared``, e.g. loaded from a cache, as transpiled ``circuit``."""
+        fingerprint = (circuit.num_parameters, len(circuit.data))
+        self._circuits[id(circuit)] = (circuit, fingerprint, prepared)
+
+    def prepare(self, circuit: QuantumCircuit) -> QuantumCircuit:
+        """Return the transpiled copy of ``circuit``, building it on first use.
+
+        The ansatz of an ADAPT run is modified in place when operators are added, so
+        the cache entry is also checked against the size of the circuit.
+        """
+        fingerprint = (circuit.num_parameters, len(circuit.data))
+        # the transpiler is not thread-safe and clones share the cache
+        with self._lock:
+            entry = self._circuits.get(id(circuit))
+            if entry is None or entry[0] is not circuit or entry[1] != fingerprint:
+                if self.backend is None:
+                    prepared = circuit
+                else:
+                    prepared = transpile(circuit, self.backend, optimization_level=1)
+                entry = (circuit, fingerprint, prepared)
+                self._circuits[id(circuit)] = entry
+        return entry[2]
+
+    def _run(self, circuits, observables, parameter_values, **run_options):
+        job = PrimitiveJob(
+            self._call, circuits, observables, parameter_values, **run_options
+        )
+        job._submit()
+        return job
+
+    def _call(self, circuits, observables, parameter_values, **run_options):
+        prepared_circuits, prepared_observables = [], []
+        for circuit, observable in zip(circuits, observables):
+            prepared = self.prepare(circuit)
+            if prepared.layout is not None:
+                observable = observable.apply_layout(prepared.layout)
+            prepared_circuits.append(prepared)
+            prepared_observables.append(observable)
+
+        values, metadata = [], []
+        step = self.max_batch_size or max(len(circuits), 1)
+        for start in range(0, len(circuits), step):
+            stop = start + step
+            result = self.estimator.run(
+                prepared_circuits[start:stop],
+                prepared_observables[start:stop],
+                parameter_values[start:stop],
+                **run_options,
+            ).result()
+            self.num_submissions += 1
+            values.extend(result.values)
+            metadata.extend(result.metadata)
+        self.num_evaluations += len(circuits)
+        return EstimatorResult(np.asarray(values), metadata)
+
+
+class GroupingBackendEstimator(BackendEstimator):
+    """``BackendEstimator`` with a replaceable qubit-wise commuting grouping.
+
+    ``BackendEstimator`` groups every observable again on each call. Passing a
+    cached ``group_commuting`` function avoids recomputing the grouping of the
+    same Hamiltonian for every SPSA step.
+    """
+
+    def __init__(self, *args, group_commuting=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._group_commuting = group_commuting
+
+    def _preprocessing(self):
+        if self._group_commuting is None or not self._abelian_grouping:
+            return super()._preprocessing()
+
+        preprocessed_circuits = []
+        for circuit_index, observable_index in self._grouping:
+            circuit = self._circuits[circuit_index]
+            observable = self._observables[observable_index]
+            diff_circuits = []
+            for obs in self._group_commuting(observable):
+                z, x = obs.paulis.z, obs.paulis.x
+                basis = Pauli((np.logical_or.reduce(z), np.logical_or.reduce(x)))
+                meas_circuit, indices = self._measurement_circuit(
+                    circuit.num_qubits, basis
+                )
+                paulis = PauliList.from_symplectic(
+                    obs.paulis.z[:, indices],
+                    obs.paulis.x[:, indices],
+                    obs.paulis.phase,
+                )
+                meas_circuit.metadata = {
+                    "paulis": paulis,
+                    "coeffs": np.real_if_close(obs.coeffs),
+                }
+                diff_circuits.append(meas_circuit)
+            preprocessed_circuits.append((circuit.copy(), diff_circuits))
+        return preprocessed_circuits
+
+
+class JobCountingBackend(GenericBackendV2):
+    """Noiseless local fake backend that counts the jobs and circuits it receives."""
+
+    def __init__(self, num_qubits: int, **kwargs):
+        kwargs.setdefault("noise_info", False)
+        kwargs.setdefault("pulse_channels", False)
+        super().__init__(num_qubits, **kwargs)
+        self.num_jobs = 0
+        self.num_circuits = 0
+
+    def run(self, run_input, **options):
+        self.num_jobs += 1
+        if isinstance(run_input, QuantumCircuit):
+            run_input = [run_input]
+        self.num_circuits += len(run_input)
+        return super().run(run_input, **options)
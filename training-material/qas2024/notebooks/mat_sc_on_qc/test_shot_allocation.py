@@ -0,0 +1,86 @@
+"""Tests of the variance-aware shot allocation.
+
+python -m pytest test_shot_allocation.py
+"""
+
+import numpy as np
+import pytest
+from qiskit import QuantumCircuit, transpile
+from qiskit.providers.fake_provider import GenericBackendV2
+from qiskit.quantum_info import SparsePauliOp, Statevector
+from shot_allocation import ShotAllocatingEstimator, allocate_shots
+
+
+class RecordingBackend:
+    """Forwards to ``backend`` and records the circuits and shots of every job."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.jobs = []
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def run(self, circuits, shots, **options):
+        self.jobs.append((len(circuits), shots))
+        return self.backend.run(circuits, shots=shots, **options)
+
+
+def test_allocate_shots_is_proportional():
+    units = allocate_shots([1.0, 2.0, 3.0, 4.0], 104)
+    np.testing.assert_array_equal(units, [11, 21, 31, 41])
+
+
+@pytest.mark.parametrize("num_units", [5, 17, 100, 1001])
+def test_allocate_shots_keeps_the_total(num_units):
+    weights = np.random.default_rng(num_units).random(5)
+    units = allocate_shots(weights, num_units)
+    assert units.sum() == num_units
+    assert units.min() >= 1
+    share = (num_units - len(weights)) * weights / weights.sum()
+    assert np.all(np.abs(units - 1 - share) < 1)
+
+
+def test_allocate_shots_without_weights():
+    np.testing.assert_array_equal(allocate_shots([0.0, 0.0, 0.0], 9), [3, 3, 3])
+
+
+def test_estimator_splits_the_budget_by_deviation():
+    circuit = QuantumCircuit(2)
+    circuit.h(0)
+    circuit.cx(0, 1)
+    circuit.ry(0.3, 1)
+    # three qubit-wise commuting groups with sum |coeff| of 3, 0.5 and 0.1
+    observable = SparsePauliOp.from_list(
+        [("ZZ", 2.0), ("ZI", 1.0), ("XX", 0.5), ("YY", 0.1)]
+    )
+    backend = RecordingBackend(GenericBackendV2(2, seed=1))
+    allocator = ShotAllocatingEstimator(backend, shots=1000, unit=10, min_fraction=0.5)
+
+    transpiled = transpile(circuit, backend.backend, initial_layout=[0, 1])
+    result = allocator.run([transpiled], [observable], [[]]).result()
+
+    # 0.5 * 1000 shots for each of the 3 groups, one circuit per group
+    expected = 10 * allocate_shots([3.0, 0.5, 0.1], 150)
+    recorded = [shots for num, shots in backend.jobs for _ in range(num)]
+    assert sorted(recorded) == sorted(expected)
+    assert sum(num for num, _ in backend.jobs) == 3
+    assert allocator.num_shots == expected.sum() == 1500
+    assert result.metadata[0]["shots"] == 1500
+    exact = Statevector(circuit).expectation_value(observable).real
+    assert result.values[0] == pytest.approx(exact, abs=0.3)
+
+
+def test_budget_grows_only_with_advance():
+    allocator = ShotAllocatingEstimator(
+        GenericBackendV2(2), shots=100, min_fraction=0.5, growth=2.0
+    )
+    circuit = QuantumCircuit(2)
+    allocator.run([circuit], [SparsePauliOp("IZ")], [[]]).result()
+    allocator.run([circuit], [SparsePauliOp("IZ")], [[]]).result()
+    assert allocator.budget == 0.5
+    assert allocator.num_shots == 100
+    allocator.advance()
+    assert allocator.budget == 1.0
+    allocator.advance()
+    assert allocator.budget == 1.0
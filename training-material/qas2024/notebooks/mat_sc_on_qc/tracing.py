@@ -0,0 +1,301 @@
+"""Per-phase tracing of the embedding client in the Chrome trace format.
+
+The log of ``client-vqe-ucc.py`` only shows the energy of every optimizer
+iteration, so it does not tell whether a run spends its time waiting for CP2K,
+building or transpiling circuits, in the estimator or in QEOM. :class:`Tracer`
+records timed spans of these phases:
+
+- spans are Chrome trace "complete" events, so the file opens in
+  ``chrome://tracing`` or https://ui.perfetto.dev, with nested spans per thread,
+- the arguments of a span, e.g. the number of circuits and shots of an estimator
+  call, are stored with the event and summed in the summary table,
+- :meth:`Tracer.wrap` traces a method of an existing object, e.g.
+  ``compute_minimum_eigenvalue`` of the solver or ``PretranspiledEstimator.prepare``,
+  without touching its class, and :class:`TracingEstimator` traces every call of
+  an estimator,
+- :meth:`Tracer.trace_jobs` splits the time of every backend job into the spans
+  ``backend.queue`` and ``backend.execute``,
+- a tracer created with ``enabled=False`` records nothing and wraps nothing, so
+  the phases can stay instrumented when tracing is off.
+
+Usage:
+    tracer = Tracer(enabled=args.trace)
+    estimator = TracingEstimator(estimator, tracer)
+    with tracer.span("qeom.solve"):
+        qeom.solve(problem)
+    tracer.write("quantum_calculation_trace.json")
+
+Running this file prints the summary tables of one or more trace files side by
+side, e.g. of the same calculation on two backends:
+
+    python tracing.py aer.json sv1.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+from qiskit.primitives import BaseEstimatorV1
+from qiskit.primitives.primitive_job import PrimitiveJob
+
+COUNTERS = ("circuits", "shots")
+
+
+class Tracer:
+    """Collects timed spans and writes them as a Chrome trace.
+
+    Args:
+        name: Process name shown in the trace viewer.
+        enabled: Record spans and wrap methods and backends; otherwise every
+            method of the tracer is a no-op.
+    """
+
+    def __init__(self, name: str = "client-vqe-ucc", enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self.events = []
+        self._start = time.perf_counter()
+        self._laps = {}
+        self._lock = threading.Lock()
+
+    def _now(self) -> float:
+        """Microseconds since the tracer was created."""
+        return (time.perf_counter() - self._start) * 1e6
+
+    def _record(self, name: str, phase: str, start: float, args: dict, **fields):
+        if not self.enabled:
+            return
+        event = {
+            "name": name,
+            "ph": phase,
+            "ts": start,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+            **fields,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args):
+        """Record the enclosed block as span ``name``.
+
+        The yielded dictionary is stored as the arguments of the span, so counts
+        that are only known at the end of the block can be added to it.
+        """
+        if not self.enabled:
+            yield args
+            return
+        start = self._now()
+        try:
+            yield args
+        finally:
+            self._record(name, "X", start, args, dur=self._now() - start)
+
+    def lap(self, name: str, **args):
+        """Record the time since the previous lap of ``name``, e.g. per iteration."""
+        now = self._now()
+        start = self._laps.get(name, now)
+        self._laps[name] = now
+        self._record(name, "X", start, args, dur=now - start)
+
+    def add_span(self, name: str, start: float, duration: float, **args):
+        """Record a span that was timed elsewhere, in microseconds of the tracer."""
+        self._record(name, "X", start, args, dur=max(duration, 0.0))
+
+    def instant(self, name: str, **args):
+        """Record a point in time."""
+        self._record(name, "i", self._now(), args, s="p")
+
+    def wrap(self, obj, method: str, name: str | None = None):
+        """Trace every call of ``obj.method`` by replacing it on the instance."""
+        if not self.enabled:
+            return obj
+        function = getattr(obj, method)
+
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            with self.span(name or f"{type(obj).__name__}.{method}"):
+                return function(*args, **kwargs)
+
+        setattr(obj, method, traced)
+        return obj
+
+    def trace_jobs(self, backend):
+        """Record queue and execution time of every job by replacing ``backend.run``.
+
+        Estimators that already hold ``backend`` are traced as well, since the
+        method is replaced on the instance. See :class:`TracedJob`.
+        """
+        if not self.enabled:
+            return backend
+        run = backend.run
+
+        @functools.wraps(run)
+        def traced(*args, **kwargs):
+            submitted = self._now()
+            job = run(*args, **kwargs)
+            return TracedJob(job, self, submitted)
+
+        backend.run = traced
+        return backend
+
+    def write(self, path: str):
+        """Write the trace in the Chrome trace JSON format."""
+        metadata = {
+            "name": "process_name",
+            "ph": "M",
+            "pid": os.getpid(),
+            "args": {"name": self.name},
+        }
+        with open(path, "w") as f:
+            json.dump({"traceEvents": [metadata] + self.events}, f, default=float)
+
+    def summary(self) -> str:
+        """Table with count, total, mean and maximum time and the counters per span."""
+        return format_summary({self.name: summarize(self.events)})
+
+
+class TracedJob:
+    """Backend job whose ``result`` records its ``backend.queue`` and
+    ``backend.execute`` spans.
+
+    ``result`` waits on the job's own ``result`` and times the wait from the
+    submission. The execution time is the ``time_taken`` the result reports, the
+    rest of the wait counts as queue time. Everything else is forwarded to the job.
+    """
+
+    def __init__(self, job, tracer: Tracer, submitted: float):
+        self.job = job
+        self.tracer = tracer
+        self.submitted = submitted
+        self._traced = False
+
+    def __getattr__(self, name):
+        if name == "job":
+            raise AttributeError(name)
+        return getattr(self.job, name)
+
+    def result(self, *args, **kwargs):
+        result = self.job.result(*args, **kwargs)
+        if self._traced:
+            return result
+        end = self.tracer._now()
+        taken = getattr(result, "time_taken", None) or 0.0
+        running = max(end - taken * 1e6, self.submitted)
+        self._traced = True
+        self.tracer.add_span("backend.queue", self.submitted, running - self.submitted)
+        self.tracer.add_span("backend.execute", running, end - running)
+        return result
+
+
+class TracingEstimator(BaseEstimatorV1):
+    """Estimator (V1) that records every call of ``estimator`` as a span.
+
+    The span covers the submission and the wait for the result, i.e. queueing and
+    execution on the backend, which :meth:`Tracer.trace_jobs` separates, and counts
+    the circuits and, if the estimator reports them in the metadata, the shots.
+
+    Args:
+        estimator: The traced estimator.
+        tracer: Receives the spans.
+        name: Name of the spans.
+    """
+
+    def __init__(
+        self, estimator: BaseEstimatorV1, tracer: Tracer, name: str = "estimator"
+    ):
+        super().__init__()
+        self.estimator = estimator
+        self.tracer = tracer
+        self.name = name
+
+    def __getattr__(self, name):
+        # counters like num_submissions of the wrapped estimator
+        if name == "estimator":
+            raise AttributeError(name)
+        return getattr(self.estimator, name)
+
+    def _run(self, circuits, observables, parameter_values, **run_options):
+        job = PrimitiveJob(
+            self._call, circuits, observables, parameter_values, **run_options
+        )
+        job._submit()
+        return job
+
+    def _call(self, circuits, observables, parameter_values, **run_options):
+        with self.tracer.span(self.name, circuits=len(circuits)) as args:
+            result = self.estimator.run(
+                circuits, observables, parameter_values, **run_options
+            ).result()
+            args["shots"] = sum(m.get("shots", 0) or 0 for m in result.metadata)
+        return result
+
+
+def summarize(events: list[dict]) -> dict[str, dict]:
+    """Aggregate the spans of a trace by name."""
+    table = {}
+    for event in events:
+        if event.get("ph") != "X":
+            continue
+        row = table.setdefault(
+            event["name"],
+            {"count": 0, "total": 0.0, "max": 0.0, **dict.fromkeys(COUNTERS, 0)},
+        )
+        duration = event["dur"] / 1e6
+        row["count"] += 1
+        row["total"] += duration
+        row["max"] = max(row["max"], duration)
+        for counter in COUNTERS:
+            row[counter] += event.get("args", {}).get(counter, 0)
+    return table
+
+
+def format_summary(tables: dict[str, dict[str, dict]]) -> str:
+    """Format the summaries of one or more traces, one column block per trace."""
+    names = sorted(
+        {name for table in tables.values() for name in table},
+        key=lambda name: (
+            -max(table.get(name, {}).get("total", 0) for table in tables.values())
+        ),
+    )
+    block = "  count   total s   mean s    max s circuits     shots"
+    lines = [
+        f"{'span':<24}"
+        + "".join(f" | {label[-len(block) :]:<{len(block)}}" for label in tables),
+        f"{'':<24}" + f" | {block}" * len(tables),
+    ]
+    lines[0] = lines[0].rstrip()
+    lines.append("-" * len(lines[-1]))
+    for name in names:
+        line = f"{name:<24}"
+        for table in tables.values():
+            row = table.get(name)
+            if row is None:
+                line += f" | {'':<{len(block)}}"
+                continue
+            line += (
+                f" | {row['count']:>7} {row['total']:>9.2f} "
+                f"{row['total'] / row['count']:>8.3f} {row['max']:>8.3f} "
+                f"{row['circuits']:>8} {row['shots']:>9}"
+            )
+        lines.append(line.rstrip())
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("traces", nargs="+")
+    args = parser.parse_args()
+    tables = {}
+    for path in args.traces:
+        with open(path) as f:
+            tables[path] = summarize(json.load(f)["traceEvents"])
+    print(format_summary(tables))
@@ -0,0 +1,228 @@
+"""Batched readout-error mitigation with tensor-product confusion matrices.
+
+``ghz_estimator_attendees.ipynb`` builds the full ``2^n x 2^n`` confusion matrix
+with ``reduce(np.kron, ...)``, multiplies it with the counts, and repairs negative
+counts with an SLSQP minimization over ``2^n`` variables followed by resampling.
+That is fine for 5 qubits but does not scale. This module keeps the per-qubit
+``2 x 2`` matrices instead:
+
+* :func:`apply_tensored` applies ``reduce(np.kron, matrices)`` to a batch of vectors
+  one qubit at a time, in ``O(n 2^n)`` per vector, without building the matrix.
+* :func:`project_simplex` is the exact Euclidean projection onto the probability
+  simplex (sort and threshold, ``O(N log N)``), for a whole batch of vectors.
+* :func:`counts_from_distribution` resamples counts with one multinomial draw per
+  vector.
+
+The matrices follow the notebook: ``matrix[i][j]`` is the probability of measuring
+``i`` when ``j`` was prepared, and ``matrices[k]`` acts on character ``k`` of the
+bitstrings (the ``np.kron`` order), so index ``int(bitstring, 2)`` of a vector is
+the count of ``bitstring``.
+
+Usage:
+    matrices = confusion_matrices(counts_0s, counts_1s)
+    mitigated = mitigate([counts], matrices)  # (1, 2^n) probabilities
+
+For 20 and more qubits even ``2^n`` vector entries are too many; there
+:func:`quasi_probabilities` evaluates single entries of the mitigated
+quasi-distribution, such as the GHZ populations, directly from the measured
+bitstrings. They are not projected onto the simplex, so their sum is an estimate
+that can leave ``[0, 1]`` and is clipped when it is reported as a fidelity.
+
+Running this file compares with the notebook's SLSQP path and times GHZ results of
+up to 26 qubits:
+
+    python readout_mitigation.py --max-qubits 26
+"""
+
+import argparse
+import time
+from functools import reduce
+
+import numpy as np
+
+
+def counts_to_array(counts, num_qubits):
+    """Dense count vectors, shape ``(len(counts), 2^n)``, of a list of count dicts."""
+    result = np.zeros((len(counts), 2**num_qubits))
+    for row, c in zip(result, counts):
+        indices = np.fromiter((int(key, 2) for key in c), dtype=np.int64, count=len(c))
+        row[indices] = np.fromiter(c.values(), dtype=float, count=len(c))
+    return result
+
+
+def confusion_matrices(counts_0s, counts_1s):
+    """Per-qubit confusion matrices from the all-zeros and all-ones calibrations.
+
+    ``matrices[k]`` belongs to character ``k`` of the bitstrings.
+    """
+    num_qubits = len(next(iter(counts_0s)))
+    matrices = np.zeros((num_qubits, 2, 2))
+    for j, c in enumerate([counts_0s, counts_1s]):
+        bits = np.array([list(map(int, key)) for key in c])
+        weights = np.fromiter(c.values(), dtype=float, count=len(c))
+        ones = weights @ bits / weights.sum()
+        matrices[:, 1, j] = ones
+        matrices[:, 0, j] = 1 - ones
+    return matrices
+
+
+def apply_tensored(matrices, vectors):
+    """``reduce(np.kron, matrices) @ vector`` for every vector of a batch.
+
+    Args:
+        matrices: ``n`` matrices of shape ``(2, 2)``, ``matrices[0]`` acts on the
+            most significant bit of the index.
+        vectors: Array of shape ``(..., 2^n)``.
+    """
+    vectors = np.asarray(vectors, dtype=float)
+    batch_shape = vectors.shape[:-1]
+    num_qubits = len(matrices)
+    result = vectors.reshape(-1, 2**num_qubits)
+    for matrix in matrices:
+        # apply the matrix to the leading bit, then rotate it to the end of the index
+        leading = result.reshape(len(result), 2, -1)
+        result = np.einsum("ij,bjr->bri", matrix, leading).reshape(len(result), -1)
+    return result.reshape(*batch_shape, 2**num_qubits)
+
+
+def project_simplex(vectors):
+    """Euclidean projection of every row onto the probability simplex.
+
+    The closest ``p`` with ``p >= 0`` and ``sum(p) = 1`` is ``max(v - tau, 0)``,
+    where the threshold ``tau`` follows from the sorted entries.
+    """
+    vectors = np.asarray(vectors, dtype=float)
+    v = vectors.reshape(-1, vectors.shape[-1])
+    u = -np.sort(-v, axis=1)
+    cumulative = np.cumsum(u, axis=1) - 1
+    k = np.arange(1, v.shape[1] + 1)
+    # number of entries above the threshold
+    rho = np.count_nonzero(u - cumulative / k > 0, axis=1)
+    tau = cumulative[np.arange(len(v)), rho - 1] / rho
+    return np.maximum(v - tau[:, None], 0).reshape(vectors.shape)
+
+
+def counts_from_distribution(distributions, shots, rng=None):
+    """Resample ``shots`` counts from every row of ``distributions``."""
+    rng = rng or np.random.default_rng()
+    distributions = np.asarray(distributions, dtype=float)
+    distributions = distributions / distributions.sum(axis=-1, keepdims=True)
+    return rng.multinomial(shots, distributions)
+
+
+def mitigate(counts, matrices):
+    """Mitigated probability distributions of a batch of results.
+
+    Args:
+        counts: List of count dicts, or count vectors of shape ``(..., 2^n)``.
+        matrices: Per-qubit confusion matrices, see :func:`confusion_matrices`.
+
+    Returns:
+        Distributions of shape ``(..., 2^n)`` on the probability simplex.
+    """
+    if isinstance(counts, (list, tuple)) and counts and isinstance(counts[0], dict):
+        counts = counts_to_array(counts, len(matrices))
+    counts = np.asarray(counts, dtype=float)
+    inverse = [np.linalg.pinv(m) for m in matrices]
+    quasi = apply_tensored(inverse, counts / counts.sum(axis=-1, keepdims=True))
+    return project_simplex(quasi)
+
+
+def quasi_probabilities(counts, matrices, bitstrings):
+    """Entries of the mitigated quasi-distribution for a few ``bitstrings``.
+
+    Entry ``x`` of ``reduce(np.kron, inverses) @ p`` is the sum over the measured
+    bitstrings ``y`` of ``p[y] * prod_k inverses[k][x_k, y_k]``, so it costs
+    ``O(len(counts) * n)`` per bitstring, whatever the number of qubits. The values
+    are the entries of :func:`mitigate` before the projection onto the simplex and
+    can be negative or sum to more than one, e.g. ``"0" * n`` and ``"1" * n`` give
+    a quasi-probability estimate of the GHZ fidelity; clip it to ``[0, 1]``.
+
+    Args:
+        counts: Count dict of one result.
+        matrices: Per-qubit confusion matrices, see :func:`confusion_matrices`.
+        bitstrings: Bitstrings ``x`` to evaluate.
+
+    Returns:
+        Array of the quasi-probabilities of ``bitstrings``.
+    """
+    inverse = np.array([np.linalg.pinv(m) for m in matrices])
+    measured = np.array([list(map(int, key)) for key in counts], dtype=np.intp)
+    targets = np.array([list(map(int, key)) for key in bitstrings], dtype=np.intp)
+    p = np.fromiter(counts.values(), dtype=float, count=len(counts))
+    p /= p.sum()
+
+    qubits = np.arange(len(matrices))
+    factors = inverse[qubits, targets[:, None, :], measured[None, :, :]]
+    return factors.prod(axis=2) @ p
+
+
+def _ghz_counts(matrices, shots, rng):
+    """Count dict of an ideal GHZ state measured with the given readout errors."""
+    matrices = np.asarray(matrices)
+    prepared = np.repeat(rng.integers(0, 2, size=(shots, 1)), len(matrices), axis=1)
+    p_one = matrices[np.arange(len(matrices)), 1, prepared]
+    measured = (rng.random(prepared.shape) < p_one).astype(np.int8)
+    keys, c = np.unique(measured, axis=0, return_counts=True)
+    return {"".join(map(str, key)): int(n) for key, n in zip(keys, c)}
+
+
+def _fidelity(distribution, num_qubits):
+    return distribution.get("0" * num_qubits, 0) + distribution.get("1" * num_qubits, 0)
+
+
+def benchmark(max_qubits, shots=1024, max_dense_qubits=18):
+    from scipy.optimize import minimize
+
+    rng = np.random.default_rng(0)
+    for n in [5] + list(range(10, max_qubits + 1, 4)):
+        matrices = np.array(
+            [
+                [[1 - e0, e1], [e0, 1 - e1]]
+                for e0, e1 in rng.uniform([0.01, 0.05], [0.03, 0.15], size=(n, 2))
+            ]
+        )
+        counts = _ghz_counts(matrices, shots, rng)
+        line = f"{n:2d} qubits: raw fidelity {_fidelity(counts, n) / shots:.4f}"
+
+        if n == 5:
+            # the notebook path: full inverse and L1 fit with SLSQP
+            start = time.perf_counter()
+            A_pinv = reduce(np.kron, [np.linalg.pinv(m) for m in matrices])
+            quasi = A_pinv @ counts_to_array([counts], n)[0] / shots
+            res = minimize(
+                lambda x: np.linalg.norm(quasi - x, ord=1),
+                rng.uniform(size=len(quasi)),
+                method="SLSQP",
+                options={"maxiter": 1000},
+                bounds=[(0, 1)] * len(quasi),
+                constraints=({"type": "eq", "fun": lambda p: np.sum(p) - 1},),
+            )
+            line += (
+                f", kron + SLSQP {(time.perf_counter() - start) * 1e3:8.2f} ms "
+                f"({res.x[0] + res.x[-1]:.4f})"
+            )
+
+        if n <= max_dense_qubits:
+            start = time.perf_counter()
+            dense = mitigate([counts], matrices)[0]
+            line += (
+                f", tensored {(time.perf_counter() - start) * 1e3:8.2f} ms "
+                f"({dense[0] + dense[-1]:.4f})"
+            )
+
+        start = time.perf_counter()
+        quasi = quasi_probabilities(counts, matrices, ["0" * n, "1" * n])
+        line += (
+            f", GHZ quasi-probabilities {(time.perf_counter() - start) * 1e3:6.2f} ms "
+            f"({quasi.sum():.4f}, clipped {np.clip(quasi.sum(), 0, 1):.4f})"
+        )
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-qubits", type=int, default=26)
+    parser.add_argument("--shots", type=int, default=1024)
+    args = parser.parse_args()
+    benchmark(args.max_qubits, args.shots)
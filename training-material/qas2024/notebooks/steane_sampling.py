@@ -0,0 +1,183 @@
+"""Streaming, bounded-memory sampling of Steane-code logical qubits.
+
+``sample_from_circuit`` in ``css_code_steane.ipynb`` compiles a new sampler on every
+call and returns all ``shots x measurements`` results as 64-bit integers, so 10^7
+shots of a few logical qubits need gigabytes. Here samples are produced in chunks of
+bit-packed ``uint8`` rows (8 measurements per byte, as returned by Stim), the
+reference sample, the expensive part of compiling a sampler, is cached per circuit,
+and the logical values and the final stabilizer checks are decoded inside each chunk.
+Only the decoded chunk, or the running totals of :func:`logical_statistics`, are
+kept.
+
+The circuits follow the layout of the notebook: logical qubit ``k`` uses the physical
+qubits ``8k ... 8k + 6`` for data and ``8k + 7`` as the verification ancilla of
+``encoding_circuit``. The measurement positions are read from the circuit, so any
+sequence of ``encoding_circuit``, logical gates, syndrome extractions and a final
+data measurement works; qubits that are reset after their last measurement, like
+the syndrome ancillas ``8, 9, 10`` of ``measure_all_syndromes``, are ancillas.
+
+Usage:
+    c = encoding_circuit(0) + encoding_circuit(1) + logical_cnot(0, 1)
+    c += measure_logical_qubits([0, 1])
+    for chunk in sample_logical(c, shots=10**7):
+        ...  # chunk.logical, chunk.syndromes, chunk.ancilla
+"""
+
+from __future__ import annotations
+
+import functools
+from dataclasses import dataclass
+from typing import Iterator, Sequence
+
+import numpy as np
+import stim
+
+# data qubits of the three plaquettes and of the logical Z (and X) operator
+PLAQUETTES = np.array([[0, 1, 2, 3], [1, 2, 4, 5], [2, 3, 5, 6]])
+LOGICAL_SUPPORT = np.array([4, 5, 6])
+
+
+def measure_logical_qubits(log_qubit_indices: Sequence[int] = (0,)) -> stim.Circuit:
+    """Measure the data qubits of all logical qubits with a single instruction."""
+    offsets = 8 * np.asarray(log_qubit_indices)
+    targets = (offsets[:, None] + np.arange(7)[None, :]).ravel()
+    c = stim.Circuit()
+    c.append("M", targets)
+    return c
+
+
+@functools.lru_cache(maxsize=16)
+def _reference_sample(circuit_text: str) -> tuple[stim.Circuit, np.ndarray]:
+    circuit = stim.Circuit(circuit_text)
+    return circuit, circuit.reference_sample()
+
+
+def sample_chunks(
+    circuit: stim.Circuit, shots: int, chunk_shots: int = 2**16, seed: int | None = None
+) -> Iterator[np.ndarray]:
+    """Yield bit-packed samples of ``circuit``, at most ``chunk_shots`` rows at a time.
+
+    Each chunk has shape ``(rows, ceil(num_measurements / 8))``; measurement ``m`` is
+    bit ``m % 8`` of byte ``m // 8``. Every call starts a new sampler from the
+    cached reference sample, so the same circuit and seed give the same samples.
+    """
+    circuit, reference = _reference_sample(str(circuit))
+    sampler = circuit.compile_sampler(seed=seed, reference_sample=reference)
+    for start in range(0, shots, chunk_shots):
+        yield sampler.sample(shots=min(chunk_shots, shots - start), bit_packed=True)
+
+
+def _bits(packed: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Unpack the measurements ``indices`` (any shape) of bit-packed rows."""
+    indices = np.asarray(indices)
+    return (packed[:, indices >> 3] >> (indices & 7).astype(np.uint8)) & 1
+
+
+@dataclass
+class MeasurementLayout:
+    """Positions in the measurement record of the logical qubits of a circuit."""
+
+    logical_qubits: list[int]
+    data: np.ndarray  # (logical qubits, 7) last measurement of each data qubit
+    ancilla: np.ndarray  # (logical qubits,) last verification ancilla, -1 if none
+
+    @classmethod
+    def from_circuit(cls, circuit: stim.Circuit) -> MeasurementLayout:
+        last = {}
+        index = 0
+        for instruction in circuit.flattened():
+            if instruction.name in ("R", "RZ"):
+                # reused ancillas, e.g. of the syndrome extraction
+                for target in instruction.targets_copy():
+                    last.pop(target.value, None)
+                continue
+            if instruction.name not in ("M", "MZ"):
+                index += instruction.num_measurements
+                continue
+            for target in instruction.targets_copy():
+                last[target.value] = index
+                index += 1
+        logical_qubits = sorted({q // 8 for q in last if q % 8 < 7})
+        data = np.array(
+            [[last.get(8 * k + i, -1) for i in range(7)] for k in logical_qubits],
+            dtype=np.int64,
+        )
+        if (data < 0).any():
+            raise ValueError("Every logical qubit must measure all 7 data qubits")
+        ancilla = np.array(
+            [last.get(8 * k + 7, -1) for k in logical_qubits], dtype=np.int64
+        )
+        return cls(logical_qubits, data.reshape(len(logical_qubits), 7), ancilla)
+
+
+@dataclass
+class LogicalChunk:
+    """Decoded samples of one chunk, one column per logical qubit."""
+
+    logical: np.ndarray  # (rows, logical qubits) logical Z outcomes
+    syndromes: np.ndarray  # (rows, logical qubits, 3) plaquette parities
+    ancilla: np.ndarray  # (rows, logical qubits) verification ancilla, 0 if none
+
+    @property
+    def accepted(self) -> np.ndarray:
+        """Shots whose verification ancillas and final syndromes are all trivial."""
+        return ~(self.ancilla.any(axis=1) | self.syndromes.any(axis=(1, 2)))
+
+
+def decode_chunk(packed: np.ndarray, layout: MeasurementLayout) -> LogicalChunk:
+    """Logical Z values and stabilizer checks of bit-packed samples."""
+    data = _bits(packed, layout.data)  # (rows, logical qubits, 7)
+    logical = np.bitwise_xor.reduce(data[:, :, LOGICAL_SUPPORT], axis=2)
+    syndromes = np.bitwise_xor.reduce(data[:, :, PLAQUETTES], axis=3)
+    ancilla = np.zeros_like(logical)
+    has_ancilla = layout.ancilla >= 0
+    if has_ancilla.any():
+        ancilla[:, has_ancilla] = _bits(packed, layout.ancilla[has_ancilla])
+    return LogicalChunk(logical, syndromes, ancilla)
+
+
+def sample_logical(
+    circuit: stim.Circuit, shots: int, chunk_shots: int = 2**16, seed: int | None = None
+) -> Iterator[LogicalChunk]:
+    """Yield the decoded logical values of ``circuit`` chunk by chunk."""
+    layout = MeasurementLayout.from_circuit(circuit)
+    for packed in sample_chunks(circuit, shots, chunk_shots, seed):
+        yield decode_chunk(packed, layout)
+
+
+def logical_statistics(
+    circuit: stim.Circuit, shots: int, chunk_shots: int = 2**16, seed: int | None = None
+) -> dict:
+    """Accumulate outcome counts over all chunks of ``circuit``.
+
+    Returns the histogram of the joint logical outcomes (bit ``k`` of the index is
+    logical qubit ``k``, up to 20 logical qubits) over all shots and over the
+    accepted shots, the number of accepted shots and the fraction of ones of each
+    logical qubit.
+    """
+    layout = MeasurementLayout.from_circuit(circuit)
+    num_logical = len(layout.logical_qubits)
+    if num_logical > 20:
+        raise ValueError("Joint histograms are limited to 20 logical qubits")
+    weights = 1 << np.arange(num_logical)
+    counts = np.zeros(2**num_logical, dtype=np.int64)
+    accepted_counts = np.zeros(2**num_logical, dtype=np.int64)
+    ones = np.zeros(num_logical, dtype=np.int64)
+
+    for packed in sample_chunks(circuit, shots, chunk_shots, seed):
+        chunk = decode_chunk(packed, layout)
+        outcome = chunk.logical.astype(np.int64) @ weights
+        counts += np.bincount(outcome, minlength=len(counts))
+        accepted_counts += np.bincount(
+            outcome[chunk.accepted], minlength=len(accepted_counts)
+        )
+        ones += chunk.logical.sum(axis=0, dtype=np.int64)
+
+    return {
+        "logical_qubits": layout.logical_qubits,
+        "counts": counts,
+        "accepted_counts": accepted_counts,
+        "accepted": int(accepted_counts.sum()),
+        "shots": shots,
+        "p_one": ones / shots,
+    }
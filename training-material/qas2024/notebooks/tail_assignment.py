@@ -0,0 +1,199 @@
+"""Sparse QUBO and Ising construction for the tail-assignment (flight scheduling) QAOA.
+
+``flight_scheduling_optimization_qaoa.ipynb`` builds the QUBO matrix densely, writes
+one Pauli string of length ``N`` for every pair ``i < j`` and scores the sampled
+bitstrings one at a time. For instances with thousands of candidate routes this
+module keeps everything sparse:
+
+* :func:`qubo` returns ``Q = A^T A - 2 diag(A^T 1)`` as a CSR matrix.
+* :func:`cost_hamiltonian` emits the nonzero ``Z_i Z_j`` and ``Z_i`` terms directly
+  from the sparsity pattern of ``Q``, without building any Pauli string.
+* :func:`pack_bitstrings` turns sampled bitstrings into a bit-packed ``uint8``
+  array and :func:`constraint_costs` scores all of them with one sparse matrix
+  product, ``||A x - 1||^2`` per sample.
+
+Bit ``i`` of a packed row, like qubit ``i`` of a Qiskit bitstring (read from the
+right), is the decision variable ``x_i`` of route ``i``.
+
+Usage:
+    Q = qubo(A)
+    H = cost_hamiltonian(Q)
+    keys, packed = pack_bitstrings(counts)
+    costs = constraint_costs(packed, A)  # 0 for the exact covers
+
+Running this file compares with the notebook functions on random instances:
+
+    python tail_assignment.py --max-routes 4096
+"""
+
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from qiskit.quantum_info import PauliList, SparsePauliOp
+
+
+def qubo(A):
+    """Sparse QUBO matrix of the exact cover constraints ``A x = 1``."""
+    A = sp.csr_matrix(A)
+    column_sums = np.asarray(A.sum(axis=0)).ravel()
+    return (A.T @ A - 2 * sp.diags(column_sums)).tocsr()
+
+
+def linear_coefficients(Q):
+    """Coefficients ``b_i = -sum_j (Q_ij + Q_ji)`` of the ``Z_i`` terms."""
+    Q = sp.csr_matrix(Q)
+    return -(np.asarray(Q.sum(axis=0)).ravel() + np.asarray(Q.sum(axis=1)).ravel())
+
+
+def cost_hamiltonian(Q, b=None):
+    """Cost Hamiltonian ``1/4 sum_ij Q_ij Z_i Z_j + 1/4 sum_i b_i Z_i`` of a QUBO.
+
+    The constant terms are dropped and zero coefficients are skipped, as in
+    ``generate_pauli_terms`` of the notebook, and the terms come in the same order.
+    The ``Z`` masks of all terms are set at once from the nonzero entries of ``Q``
+    and ``b``, which is an order of magnitude faster than
+    ``SparsePauliOp.from_sparse_list`` for thousands of terms.
+    """
+    Q = sp.csr_matrix(Q)
+    b = linear_coefficients(Q) if b is None else np.asarray(b)
+    upper = sp.triu(Q + Q.T, k=1).tocoo()
+    upper.eliminate_zeros()
+    nonzero = np.flatnonzero(b)
+
+    num_pairs = len(upper.data)
+    z = np.zeros((num_pairs + len(nonzero), Q.shape[0]), dtype=bool)
+    z[np.arange(num_pairs), upper.row] = True
+    z[np.arange(num_pairs), upper.col] = True
+    z[num_pairs + np.arange(len(nonzero)), nonzero] = True
+    coeffs = np.concatenate([upper.data, b[nonzero]]) / 4
+    return SparsePauliOp(PauliList.from_symplectic(z, np.zeros_like(z)), coeffs)
+
+
+def pack_bitstrings(counts):
+    """Bit-packed decision vectors of the bitstrings of a counts dict.
+
+    Returns the bitstrings and a ``uint8`` array of shape ``(len(counts),
+    ceil(N / 8))`` with ``x_i`` in bit ``i % 8`` of byte ``i // 8``. Spaces between
+    the classical registers of a key are ignored.
+    """
+    keys = list(counts)
+    if not keys:
+        return keys, np.zeros((0, 0), dtype=np.uint8)
+    bitstrings = [key.replace(" ", "") for key in keys]
+    num_bits = len(bitstrings[0])
+    chars = np.frombuffer("".join(bitstrings).encode(), dtype=np.uint8)
+    bits = chars.reshape(len(keys), num_bits)[:, ::-1] - ord("0")
+    return keys, np.packbits(bits, axis=1, bitorder="little")
+
+
+def unpack(packed, num_bits):
+    """Decision vectors of shape ``(samples, num_bits)`` of packed rows."""
+    return np.unpackbits(packed, axis=1, count=num_bits, bitorder="little")
+
+
+def constraint_costs(packed, A):
+    """``||A x - 1||^2`` of every packed decision vector ``x``."""
+    A = sp.csr_matrix(A)
+    residual = A @ unpack(packed, A.shape[1]).T.astype(np.int64) - 1
+    return np.square(residual).sum(axis=0)
+
+
+def qubo_energies(packed, Q):
+    """``x^T Q x`` of every packed decision vector ``x``."""
+    Q = sp.csr_matrix(Q)
+    X = unpack(packed, Q.shape[0]).astype(np.int64)
+    return np.einsum("is,si->s", Q @ X.T, X)
+
+
+def random_instance(num_flights, num_routes, route_length=3, rng=None):
+    """Assignment matrix with one planted exact cover and random other routes."""
+    rng = rng or np.random.default_rng()
+    flights = rng.permutation(num_flights)
+    cover = np.array_split(flights, max(1, num_flights // route_length))
+    rows, cols = [], []
+    for r, route in enumerate(cover):
+        rows += route.tolist()
+        cols += [r] * len(route)
+    for r in range(len(cover), num_routes):
+        route = rng.choice(num_flights, size=route_length, replace=False)
+        rows += route.tolist()
+        cols += [r] * route_length
+    A = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(num_flights, num_routes))
+    # hide the planted cover among the other routes
+    return A[:, rng.permutation(num_routes)]
+
+
+def _notebook_hamiltonian(A):
+    """``QUBO`` and ``generate_pauli_terms`` of the notebook."""
+    Q = A.transpose() @ A - 2 * np.diag((A.T @ np.ones((A.shape[0], 1))).flatten())
+    b = -sum(Q[i, :] + Q[:, i] for i in range(Q.shape[0]))
+    N = len(b)
+    pauli_list = []
+    for i in range(N - 1):
+        for j in range(i + 1, N):
+            if Q[i, j] != 0:
+                paulis = ["I"] * N
+                paulis[i], paulis[j] = "Z", "Z"
+                pauli_list.append(("".join(paulis)[::-1], 2 * Q[i, j] / 4))
+    for i in range(N):
+        if b[i] != 0:
+            paulis = ["I"] * N
+            paulis[i] = "Z"
+            pauli_list.append(("".join(paulis)[::-1], b[i] / 4))
+    return SparsePauliOp.from_list(pauli_list)
+
+
+def _notebook_cost(bit_str, A):
+    x = np.array([[int(bit)] for bit in reversed(bit_str)])
+    id_vec = np.ones((A.shape[0], 1))
+    return np.sum(np.square(A @ x - id_vec), axis=0)[0]
+
+
+def benchmark(max_routes, samples=4000, max_notebook_routes=1024):
+    rng = np.random.default_rng(0)
+    num_routes = 8
+    while num_routes <= max_routes:
+        A = random_instance(max(2, num_routes // 2), num_routes, rng=rng)
+        bits = rng.integers(0, 2, size=(samples, num_routes), dtype=np.uint8)
+        counts = {"".join(map(str, row[::-1])): 1 for row in bits}
+
+        start = time.perf_counter()
+        H = cost_hamiltonian(qubo(A))
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        keys, packed = pack_bitstrings(counts)
+        costs = constraint_costs(packed, A)
+        score = time.perf_counter() - start
+        line = (
+            f"{num_routes:5d} routes, {len(H):7d} terms: sparse build {build:7.3f} s, "
+            f"scoring {len(keys)} samples {score:7.3f} s"
+        )
+
+        if num_routes <= max_notebook_routes:
+            dense = A.toarray()
+            start = time.perf_counter()
+            reference = _notebook_hamiltonian(dense)
+            notebook_build = time.perf_counter() - start
+            start = time.perf_counter()
+            notebook_costs = [_notebook_cost(key, dense) for key in keys]
+            notebook_score = time.perf_counter() - start
+            same = (H - reference).simplify().size == 1 and np.allclose(
+                (H - reference).simplify().coeffs, 0
+            )
+            line += (
+                f" | notebook build {notebook_build:7.3f} s, scoring "
+                f"{notebook_score:7.3f} s (same operator: {same}, same costs: "
+                f"{np.array_equal(costs, notebook_costs)})"
+            )
+        print(line)
+        num_routes *= 4
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-routes", type=int, default=4096)
+    parser.add_argument("--samples", type=int, default=4000)
+    args = parser.parse_args()
+    benchmark(args.max_routes, args.samples)
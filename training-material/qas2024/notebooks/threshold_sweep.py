@@ -0,0 +1,296 @@
+"""Parallel, early-stopping logical error rate sweeps for threshold studies.
+
+``count_logical_errors`` in ``surface_code_threshold.ipynb`` samples a fixed number
+of shots per (distance, noise) point, one point after the other. This module splits
+every point into chunks of shots that are sampled with Stim and decoded with
+``pymatching.Matching.decode_batch`` in a process pool. A point stops receiving new
+chunks once it has collected ``max_errors`` logical errors, once the Wilson
+confidence interval of its logical error rate is narrower than ``rel_precision``,
+or once it reaches ``max_shots``. Chunks are sized from the observed error rate,
+at most ``max_chunks_in_flight`` run per point, and queued chunks of a finished point
+are cancelled, so a point overshoots its stop condition by little. Each worker
+process builds the ``Matching`` of a circuit only once and reuses it for all of
+that circuit's chunks.
+
+Usage:
+    from threshold_sweep import surface_code_circuit, sweep
+
+    results = sweep(surface_code_circuit, [3, 5, 7], [0.002, 0.004, 0.006, 0.008])
+    for r in results:
+        print(r.distance, r.noise, r.rate, r.interval)
+
+Running this file sweeps the surface code and prints the logical error rates:
+
+    python threshold_sweep.py --distances 3 5 7 9 --noise 0.002 0.005 0.008
+"""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+
+import numpy as np
+import pymatching
+import stim
+
+
+def repetition_code_circuit(distance: int, noise: float) -> stim.Circuit:
+    """Repetition code memory experiment of the notebook, ``3 * distance`` rounds."""
+    return stim.Circuit.generated(
+        "repetition_code:memory",
+        rounds=distance * 3,
+        distance=distance,
+        before_round_data_depolarization=noise,
+    )
+
+
+def surface_code_circuit(distance: int, noise: float) -> stim.Circuit:
+    """Rotated surface code with reset, measurement and depolarizing errors."""
+    return stim.Circuit.generated(
+        "surface_code:rotated_memory_x",
+        rounds=distance * 3,
+        distance=distance,
+        after_clifford_depolarization=noise,
+        after_reset_flip_probability=noise,
+        before_measure_flip_probability=noise,
+        before_round_data_depolarization=noise,
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _decoder(circuit_text: str) -> tuple[stim.Circuit, pymatching.Matching]:
+    """Parse ``circuit_text`` and build its decoder, once per process and circuit."""
+    circuit = stim.Circuit(circuit_text)
+    detector_error_model = circuit.detector_error_model(decompose_errors=True)
+    return circuit, pymatching.Matching.from_detector_error_model(detector_error_model)
+
+
+def count_logical_errors(circuit: stim.Circuit | str, num_shots: int, seed=None) -> int:
+    """Sample and decode ``num_shots`` shots and return the number of logical errors."""
+    circuit, matcher = _decoder(str(circuit))
+    sampler = circuit.compile_detector_sampler(seed=seed)
+    detection_events, observable_flips = sampler.sample(
+        num_shots, separate_observables=True
+    )
+    predictions = matcher.decode_batch(detection_events)
+    # a shot fails if any observable is predicted wrongly
+    return int(np.count_nonzero(np.any(predictions != observable_flips, axis=1)))
+
+
+def wilson_interval(errors: int, shots: int, z: float = 1.96) -> tuple[float, float]:
+    """Wilson score interval of the logical error rate, ``z = 1.96`` for 95 %."""
+    if shots == 0:
+        return 0.0, 1.0
+    rate = errors / shots
+    center = (rate + z**2 / (2 * shots)) / (1 + z**2 / shots)
+    half = (
+        z
+        / (1 + z**2 / shots)
+        * np.sqrt(rate * (1 - rate) / shots + z**2 / (4 * shots**2))
+    )
+    return max(center - half, 0.0), min(center + half, 1.0)
+
+
+@dataclass
+class PointResult:
+    """Logical errors collected for one (distance, noise) point of a sweep."""
+
+    distance: int
+    noise: float
+    circuit: str
+    shots: int = 0
+    errors: int = 0
+    chunks_in_flight: int = 0
+    shots_in_flight: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.errors / self.shots if self.shots else float("nan")
+
+    @property
+    def interval(self) -> tuple[float, float]:
+        return wilson_interval(self.errors, self.shots)
+
+    def done(self, max_errors, max_shots, rel_precision) -> bool:
+        if self.shots >= max_shots or self.errors >= max_errors:
+            return True
+        if rel_precision is None or self.errors == 0:
+            return False
+        low, high = self.interval
+        return (high - low) / 2 <= rel_precision * self.rate
+
+    def next_chunk(
+        self,
+        max_errors,
+        max_shots,
+        rel_precision,
+        min_shots: int,
+        max_shots_per_chunk: int,
+    ) -> int:
+        """Shots of the next chunk, 0 if the chunks in flight should close the point.
+
+        The chunk is sized from the observed rate so that, together with the shots
+        in flight, it is expected to collect the errors that are still missing. The
+        relative half width of the interval is about ``1.96 / sqrt(errors)``, which
+        bounds the errors ``rel_precision`` needs.
+        """
+        remaining = max_shots - self.shots - self.shots_in_flight
+        if remaining <= 0:
+            return 0
+        if self.errors == 0:
+            # no rate yet: one chunk at a time, each double the shots taken so far
+            if self.chunks_in_flight:
+                return 0
+            size = self.shots
+        else:
+            target = max_errors
+            if rel_precision is not None:
+                target = min(target, math.ceil((1.96 / rel_precision) ** 2))
+            rate = self.errors / self.shots
+            missing = target - self.errors - rate * self.shots_in_flight
+            if missing <= 0:
+                # only refill if nothing is left in flight to close the point
+                return 0 if self.chunks_in_flight else min(min_shots, remaining)
+            size = math.ceil(1.1 * missing / rate)
+        return min(max(size, min_shots), max_shots_per_chunk, remaining)
+
+
+def sweep(
+    make_circuit,
+    distances,
+    noises,
+    max_errors: int = 100,
+    max_shots: int = 10**7,
+    rel_precision: float | None = 0.1,
+    chunk_shots: int = 20_000,
+    min_chunk_shots: int = 1_000,
+    max_chunks_in_flight: int = 2,
+    max_workers: int | None = None,
+    seed: int = 0,
+) -> list[PointResult]:
+    """Estimate the logical error rate of every (distance, noise) combination.
+
+    Args:
+        make_circuit: Called as ``make_circuit(distance, noise)``, returns the noisy
+            ``stim.Circuit``, e.g. :func:`surface_code_circuit`.
+        distances: Code distances.
+        noises: Physical error rates.
+        max_errors: Stop a point after this many logical errors.
+        max_shots: Stop a point after this many shots.
+        rel_precision: Stop a point once the half width of the 95 % confidence
+            interval is below this fraction of the rate, ``None`` to disable.
+        chunk_shots: Largest number of shots per task of the process pool.
+        min_chunk_shots: Smallest number of shots per task, also the size of the
+            first chunk of every point.
+        max_chunks_in_flight: Chunks of one point that are queued or running at
+            the same time.
+        max_workers: Number of processes, defaults to the number of CPUs.
+        seed: Seed of the sampler of the first chunk; chunk ``k`` uses ``seed + k``.
+
+    The point with the fewest shots gets the next chunk, so cheap points finish
+    early and the pool keeps working on the hard ones (large distance, low noise).
+    Chunks still queued for a point are cancelled as soon as it is done.
+    """
+    points = [
+        PointResult(d, p, str(make_circuit(d, p))) for d in distances for p in noises
+    ]
+    max_workers = max_workers or os.cpu_count()
+    limits = (max_errors, max_shots, rel_precision)
+    next_seed = seed
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+
+        def submit():
+            nonlocal next_seed
+            while len(running) < 2 * max_workers:
+                candidates = []
+                for point in points:
+                    if point.chunks_in_flight >= max_chunks_in_flight:
+                        continue
+                    if point.done(*limits):
+                        continue
+                    shots = point.next_chunk(*limits, min_chunk_shots, chunk_shots)
+                    if shots > 0:
+                        candidates.append((point, shots))
+                if not candidates:
+                    return
+                point, shots = min(
+                    candidates, key=lambda c: c[0].shots + c[0].shots_in_flight
+                )
+                future = pool.submit(_run_chunk, point.circuit, shots, next_seed)
+                running[future] = point, shots
+                point.chunks_in_flight += 1
+                point.shots_in_flight += shots
+                next_seed += 1
+
+        def cancel(point):
+            for future, (owner, shots) in list(running.items()):
+                if owner is point and future.cancel():
+                    del running[future]
+                    point.chunks_in_flight -= 1
+                    point.shots_in_flight -= shots
+
+        submit()
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                point, shots = running.pop(future)
+                point.chunks_in_flight -= 1
+                point.shots_in_flight -= shots
+                errors, seconds = future.result()
+                point.shots += shots
+                point.errors += errors
+                point.seconds += seconds
+                if point.done(*limits):
+                    cancel(point)
+            submit()
+
+    for point in points:
+        point.chunks_in_flight = point.shots_in_flight = 0
+    return points
+
+
+def _run_chunk(circuit_text: str, shots: int, seed: int) -> tuple[int, float]:
+    start = time.perf_counter()
+    errors = count_logical_errors(circuit_text, shots, seed=seed)
+    return errors, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--code", choices=["surface", "repetition"], default="surface")
+    parser.add_argument("--distances", type=int, nargs="+", default=[3, 5, 7])
+    parser.add_argument(
+        "--noise", type=float, nargs="+", default=[0.002, 0.004, 0.006, 0.008]
+    )
+    parser.add_argument("--max-errors", type=int, default=100)
+    parser.add_argument("--max-shots", type=int, default=10**7)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    make_circuit = (
+        surface_code_circuit if args.code == "surface" else repetition_code_circuit
+    )
+    start = time.perf_counter()
+    results = sweep(
+        make_circuit,
+        args.distances,
+        args.noise,
+        max_errors=args.max_errors,
+        max_shots=args.max_shots,
+        max_workers=args.workers,
+    )
+    for r in results:
+        low, high = r.interval
+        print(
+            f"d = {r.distance:2d}, p = {r.noise:.4f}: LER {r.rate:.3e} "
+            f"[{low:.2e}, {high:.2e}] from {r.errors} errors in {r.shots} shots"
+        )
+    print(f"total {time.perf_counter() - start:.1f} s")